@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Rendering benchmarks for Dust.
+
+Builds synthetic Worlds with World.create_default_world, Layer.fill and
+Actors, times World.blit, Layer.flip, Sprite.blit and Actor.blit at several
+board sizes and actor counts, and writes the results as JSON.  A previous
+results file can be given as a baseline to compare against; the script exits
+with status 1 if any case got slower than the tolerance allows.
+
+Runs on the headless backend unless DUST_BACKEND is already set.
+
+Usage:
+	python bench.py [--sizes 80x25,256x256] [--actors 0,100] [--repeat 5]
+		[--output bench_results.json] [--baseline FILE] [--tolerance 1.25]
+		[--profile]
+"""
+
+import os
+os.environ.setdefault('DUST_BACKEND', 'headless')
+
+import argparse
+import json
+import random
+import sys
+import time
+import dust
+
+
+def build_world(console, w, h, num_actors, seed=15121197):
+	"""
+	build_world(Console console, int w, int h, int num_actors, int seed)
+		returns World
+	Builds a World with one w x h Board whose Layer is filled with a pattern of
+	game tiles, and which holds num_actors randomly placed 1x1 Actors.
+	"""
+	rng = random.Random(seed)
+	world = dust.World(console)
+	world.boards = []
+	world.create_default_world(w, h)
+	layer = world.current_board.layers[-1]
+	layer.fill(5, 7, 0)
+	for i in range(0, w * h, 7):
+		layer.set_game_tile(i % w, i // w, rng.randint(0, len(dust.tilesaurus) - 1))
+	layer.flip(None, incremental=False)
+	for i in range(num_actors):
+		actor = dust.Actor(layer, 1, 1, rng.randint(0, w - 1), rng.randint(0, h - 1))
+		actor.get_sprite().fill_sprite(rng.randint(33, 126), rng.randint(1, 255))
+		layer.actors.append(actor)
+	return world
+
+
+def time_call(func, repeat):
+	"""
+	time_call(function func, int repeat) returns tuple (float, float)
+	Calls func repeat times and returns the best and mean time, in seconds.
+	"""
+	times = []
+	for i in range(repeat):
+		start = time.time()
+		func()
+		times.append(time.time() - start)
+	return min(times), sum(times) / len(times)
+
+
+def make_cases(world, console):
+	"""
+	make_cases(World world, Console console) returns list of (str, function)
+	Returns the named operations to time on a World built by build_world.
+	"""
+	layer = world.current_board.layers[-1]
+	sprite = layer.get_sprite()
+
+	def world_blit():
+		world.blit(console)
+
+	def layer_flip():
+		layer.flip(None, incremental=False)
+
+	def sprite_blit():
+		sprite.dirty = True
+		sprite.blit(console)
+
+	def sprite_blit_clean():
+		sprite.blit(console)
+
+	def actor_blit():
+		for actor in layer.actors:
+			actor.blit(console)
+
+	cases = [('World.blit', world_blit), ('Layer.flip', layer_flip), ('Sprite.blit', sprite_blit), ('Sprite.blit (clean)', sprite_blit_clean)]
+	if layer.actors:
+		cases.append(('Actor.blit', actor_blit))
+	return cases
+
+
+def run(sizes, actor_counts, repeat, profile=False):
+	"""
+	run(list sizes, list actor_counts, int repeat, bool profile)
+		returns list of dict
+	Runs every case for every size and actor count and returns one result
+	dict per case.
+	"""
+	results = []
+	for w, h in sizes:
+		console = dust.Console(w, h)
+		for num_actors in actor_counts:
+			world = build_world(console, w, h, num_actors)
+			for name, func in make_cases(world, console):
+				func() # warm up caches and dirty state
+				if profile:
+					import cProfile
+					print '== %s %dx%d, %d actors' % (name, w, h, num_actors)
+					cProfile.runctx('func()', globals(), {'func': func}, sort='cumulative')
+				best, mean = time_call(func, repeat)
+				results.append({'name': name, 'size': '%dx%d' % (w, h), 'actors': num_actors, 'best': best, 'mean': mean, 'repeat': repeat})
+				print '%-20s %9s %6d actors  best %10.3f ms  mean %10.3f ms' % (name, '%dx%d' % (w, h), num_actors, best * 1000, mean * 1000)
+	return results
+
+
+def compare(results, baseline, tolerance):
+	"""
+	compare(list results, list baseline, float tolerance) returns bool
+	Prints the ratio of each result's best time to the matching baseline
+	result.  Returns False if any ratio is above tolerance.
+	"""
+	ok = True
+	old = dict(((r['name'], r['size'], r['actors']), r) for r in baseline)
+	for r in results:
+		key = (r['name'], r['size'], r['actors'])
+		if key not in old:
+			continue
+		ratio = r['best'] / max(old[key]['best'], 1e-9)
+		flag = ''
+		if ratio > tolerance:
+			flag = '  SLOWER'
+			ok = False
+		print '%-20s %9s %6d actors  %6.2fx baseline%s' % (r['name'], r['size'], r['actors'], ratio, flag)
+	return ok
+
+
+def parse_list(text, convert):
+	return [convert(x) for x in text.split(',') if x]
+
+
+def parse_size(text):
+	w, h = text.lower().split('x')
+	return int(w), int(h)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Benchmark the Dust rendering paths.')
+	parser.add_argument('--sizes', default='80x25,256x256,1024x1024', help='comma-separated board sizes, e.g. 80x25,256x256')
+	parser.add_argument('--actors', default='0,100,1000,10000', help='comma-separated actor counts')
+	parser.add_argument('--repeat', type=int, default=5, help='timed calls per case')
+	parser.add_argument('--output', default='bench_results.json', help='file to write the JSON results to')
+	parser.add_argument('--baseline', help='results file to compare against')
+	parser.add_argument('--tolerance', type=float, default=1.25, help='largest allowed slowdown against the baseline')
+	parser.add_argument('--profile', action='store_true', help='also run each case under cProfile')
+	args = parser.parse_args(argv)
+
+	results = run(parse_list(args.sizes, parse_size), parse_list(args.actors, int), args.repeat, args.profile)
+	with open(args.output, 'w') as f:
+		json.dump({'backend': os.environ['DUST_BACKEND'], 'python': sys.version.split()[0], 'results': results}, f, indent=1)
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)['results']
+		if not compare(results, baseline, args.tolerance):
+			return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
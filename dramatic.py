@@ -0,0 +1,1064 @@
+#!/usr/bin/env python
+"""
+Compiler and virtual machine for Dramatic, the Dust Actor scripting language.
+
+A script is compiled once into a Program, a flat list of (opcode, argument)
+integer pairs with tables of constants and names, and is then run by a
+Process, which keeps one Actor's place in its Program between ticks.  See
+docs/dust.md for the language.
+
+Programs are cached by source, so Actors sharing a script share one Program.
+This module does not import dust; it works on any object with the Actor
+attributes (parent, x, y, w, h, name, counters, heading, sprite, program).
+"""
+
+import re
+import math
+
+class DramaticError(Exception):
+	"""
+	Raised for a script that cannot be compiled or a runtime error in a
+		running script.  The message includes the line number.
+	"""
+	pass
+
+
+############################
+# Directions
+############################
+
+NORTH, EAST, SOUTH, WEST = 0, 1, 2, 3
+DIRECTIONS = {'north': NORTH, 'east': EAST, 'south': SOUTH, 'west': WEST}
+DELTAS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+############################
+# Opcodes
+############################
+
+(CONST, LOCAL, LOAD, STORE, STORE_LOCAL, STORE_PROP, PROP, PROP_OF, ME, BINARY,
+	NOT, NEG, CALL, JUMP, JUMP_IF_FALSE, YIELD_JUMP, ITER, NEXT, GO, POINT,
+	SAY, SEND, RETURN, END, DIE, SHOOT) = range(26)
+
+OPNAMES = ('CONST', 'LOCAL', 'LOAD', 'STORE', 'STORE_LOCAL', 'STORE_PROP',
+	'PROP', 'PROP_OF', 'ME', 'BINARY', 'NOT', 'NEG', 'CALL', 'JUMP',
+	'JUMP_IF_FALSE', 'YIELD_JUMP', 'ITER', 'NEXT', 'GO', 'POINT', 'SAY',
+	'SEND', 'RETURN', 'END', 'DIE', 'SHOOT')
+
+############################
+# Values
+############################
+
+def is_actor(value):
+	"""
+	is_actor(value) returns bool
+	Returns True for an Actor, or anything else with a heading and counters.
+	"""
+	return hasattr(value, 'heading') and hasattr(value, 'counters')
+
+def to_direction(actor, value):
+	"""
+	to_direction(Actor actor, value) returns int
+	Turns a direction or an Actor (meaning its heading) into a direction.
+	"""
+	if type(value) is int:
+		return value % 4
+	if is_actor(value):
+		return value.heading
+	return int(value) % 4
+
+def add(a, b):
+	if isinstance(a, basestring) or isinstance(b, basestring):
+		return format_value(a) + format_value(b)
+	return a + b
+
+def format_value(value):
+	"""
+	format_value(value) returns str
+	Returns value as say and print show it.
+	"""
+	if isinstance(value, basestring):
+		return value
+	if is_actor(value):
+		return value.name
+	if isinstance(value, list):
+		return '[' + ', '.join(format_value(i) for i in value) + ']'
+	return str(value)
+
+BINARY_OPS = {
+	'+': add,
+	'-': lambda a, b: a - b,
+	'*': lambda a, b: a * b,
+	'/': lambda a, b: a / b,
+	'%': lambda a, b: a % b,
+	'^': lambda a, b: a ** b,
+	'==': lambda a, b: a == b,
+	'=': lambda a, b: a == b,
+	'!=': lambda a, b: a != b,
+	'<': lambda a, b: a < b,
+	'>': lambda a, b: a > b,
+	'<=': lambda a, b: a <= b,
+	'>=': lambda a, b: a >= b,
+	'and': lambda a, b: a and b,
+	'or': lambda a, b: a or b,
+}
+BINARY_NAMES = sorted(BINARY_OPS)
+BINARY_TABLE = [BINARY_OPS[i] for i in BINARY_NAMES]
+
+############################
+# Actor access
+############################
+
+def find_actor(actor, name):
+	"""
+	find_actor(Actor actor, str name) returns Actor or None
+	Looks for an Actor called name (in any case) beside actor, on its Layer
+		or Board, then in its World.  Lists that index their Actors by name
+		(see dust.ActorList.find_name) are not searched one by one.
+	"""
+	obj = actor
+	while hasattr(obj, 'parent'):
+		obj = obj.parent
+		actors = getattr(obj, 'actors', ())
+		if hasattr(actors, 'find_name'):
+			found = actors.find_name(name)
+			if found != None:
+				return found
+			continue
+		for i in actors:
+			if i.name.lower() == name:
+				return i
+	return None
+
+def get_property(actor, name):
+	"""
+	get_property(Actor actor, str name) returns value
+	Returns one of actor's properties (x, y, w, h, name, char, color or
+		current_heading), or else its counter called name, or 0.
+	"""
+	if name in ('x', 'y', 'w', 'h', 'name'):
+		return getattr(actor, name)
+	elif name == 'current_heading':
+		return actor.heading
+	elif name == 'char':
+		return actor.sprite[0].get_tile(0, 0)[0]
+	elif name == 'color':
+		return actor.sprite[0].get_tile(0, 0)[1]
+	elif name in BUILTINS:
+		return BUILTINS[name][0](actor)
+	return actor.counters.get(name, 0)
+
+def set_property(actor, name, value):
+	"""
+	set_property(Actor actor, str name, value) returns None
+	Sets one of actor's properties, moving or redrawing it if needed, or
+		else its counter called name.
+	"""
+	if name == 'x':
+		actor.move_to(int(value), actor.y)
+	elif name == 'y':
+		actor.move_to(actor.x, int(value))
+	elif name == 'current_heading':
+		actor.heading = to_direction(actor, value)
+	elif name == 'char':
+		actor.sprite[0].fill_sprite(int(value), None)
+	elif name == 'color':
+		actor.sprite[0].fill_sprite(None, int(value))
+	elif name == 'name':
+		actor.name = format_value(value)
+	else:
+		actor.set_counter(name, value)
+
+def is_blocked(actor, direction):
+	"""
+	is_blocked(Actor actor, int direction) returns bool
+	Returns True if actor cannot take a step in direction, as decided by
+		its Layer's is_blocked.  Offscreen Actors are always blocked.
+	"""
+	dx, dy = DELTAS[direction]
+	check = getattr(actor.parent, 'is_blocked', None)
+	if check == None:
+		return True
+	return check(actor.x + dx, actor.y + dy, actor)
+
+############################
+# Builtins
+############################
+
+def split_args(actor, args):
+	"""
+	split_args(Actor actor, list args) returns tuple (int, Actor)
+	Sorts the arguments of a direction builtin into a direction (or None)
+		and an Actor (actor if none was given).
+	"""
+	direction = None
+	for i in args:
+		if is_actor(i):
+			actor = i
+		else:
+			direction = int(i) % 4
+	return direction, actor
+
+def builtin_forward(actor, *args):
+	direction, actor = split_args(actor, args)
+	if direction == None:
+		direction = actor.heading
+	return direction
+
+def builtin_opp(actor, *args):
+	return (builtin_forward(actor, *args) + 2) % 4
+
+def builtin_clockwise(actor, *args):
+	return (builtin_forward(actor, *args) + 1) % 4
+
+def builtin_counterclockwise(actor, *args):
+	return (builtin_forward(actor, *args) + 3) % 4
+
+def builtin_blocked(actor, *args):
+	direction, actor = split_args(actor, args)
+	if direction == None:
+		direction = actor.heading
+	return is_blocked(actor, direction)
+
+def builtin_length(actor, value):
+	if isinstance(value, (int, long, float)):
+		return len(str(abs(int(value))))
+	return len(value)
+
+def builtin_first(actor, value):
+	if isinstance(value, basestring):
+		return ord(value[0]) if value else 0
+	return value[0] if value else 0
+
+def builtin_split(actor, value, glue=None):
+	return format_value(value).split(glue and format_value(glue) or None)
+
+def builtin_trim(actor, value, chars=None):
+	return format_value(value).strip(chars and format_value(chars) or None)
+
+def builtin_sqrt(actor, value):
+	return math.sqrt(value)
+
+# name: (function, most arguments)
+BUILTINS = {
+	'forward': (builtin_forward, 1),
+	'backward': (builtin_opp, 1),
+	'opp': (builtin_opp, 1),
+	'clockwise': (builtin_clockwise, 1),
+	'counterclockwise': (builtin_counterclockwise, 1),
+	'blocked': (builtin_blocked, 2),
+	'length': (builtin_length, 1),
+	'first': (builtin_first, 1),
+	'split': (builtin_split, 2),
+	'trim': (builtin_trim, 2),
+	'sqrt': (builtin_sqrt, 1),
+}
+BUILTIN_NAMES = sorted(BUILTINS)
+BUILTIN_TABLE = [BUILTINS[i][0] for i in BUILTIN_NAMES]
+
+# Scripts of the builtin Actor kinds that shoot can create.
+BUILTIN_SCRIPTS = {
+	'bullet': "loop\n\tif blocked\n\t\tdie\n\tgo\n",
+	'blankactor': "",
+}
+
+############################
+# Compiler
+############################
+
+TOKEN = re.compile(r"""\s*(?:(//.*)|"((?:\\.|[^"\\])*)"|(\d+\.\d+|\d+)|('s)\b|([A-Za-z_][A-Za-z_0-9]*)|(==|!=|<=|>=|[-+*/%^()<>=:]))""")
+IGNORED = ('by', 'of', 'to')
+HELPERS = ('is', 'am', 'are')
+LOCALS = ('it', 'that', 'index')
+PROPERTIES = ('x', 'y', 'w', 'h', 'name', 'char', 'color', 'current_heading')
+COMPARISONS = ('==', '!=', '<', '>', '<=', '>=', '=')
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r'}
+UNSUPPORTED = ('open', 'close', 'prompt')
+STATEMENTS = ('loop', 'if', 'else', 'for', 'set', 'go', 'point', 'jump', 'goto', 'trigger', 'say', 'print', 'when', 'return', 'die', 'shoot')
+
+def tokenize(line, lineno):
+	"""
+	tokenize(str line, int lineno) returns list of tuple (str, value)
+	Splits a line into ('str', str), ('num', int or float), ('word', str)
+		and ('op', str) tokens, dropping comments and ignored words.  Words
+		are lower case.
+	"""
+	tokens = []
+	pos = 0
+	line = line.rstrip()
+	while pos < len(line):
+		match = TOKEN.match(line, pos)
+		if match == None:
+			raise DramaticError('line %d: unexpected %r' % (lineno, line[pos:].strip()[:10]))
+		pos = match.end()
+		comment, string, number, possessive, word, op = match.groups()
+		if comment != None:
+			break
+		elif string != None:
+			tokens.append(('str', re.sub(r'\\(.)', lambda m: ESCAPES.get(m.group(1), m.group(1)), string)))
+		elif number != None:
+			tokens.append(('num', float(number) if '.' in number else int(number)))
+		elif possessive != None:
+			tokens.append(('op', "'s"))
+		elif word != None:
+			if word.lower() not in IGNORED:
+				tokens.append(('word', word.lower()))
+		elif op != None:
+			tokens.append(('op', op))
+	return tokens
+
+
+class Program(object):
+	"""
+	A Program is a compiled Dramatic script.  code is a flat list of
+		(opcode, argument) pairs; arguments index consts or names, or are
+		code offsets.  labels and handlers map label and event names to code
+		offsets, and lines holds the script line of each instruction.
+	Methods:
+		Program.get_label(str label) returns int
+		Program.disassemble() returns str
+	"""
+	def __init__(self, source, code, consts, names, labels, handlers, lines):
+		self.source = source
+		self.code = code
+		self.consts = consts
+		self.names = names
+		self.labels = labels
+		self.handlers = handlers
+		self.lines = lines
+
+	def get_label(self, label):
+		"""
+		Program.get_label(str label) returns int
+		Returns the code offset of a label, or raises DramaticError.
+		"""
+		label = format_value(label).lower()
+		if label not in self.labels:
+			raise DramaticError('no label %r' % label)
+		return self.labels[label]
+
+	def disassemble(self):
+		"""
+		Program.disassemble() returns str
+		Returns a listing of the Program's instructions, for debugging.
+		"""
+		out = []
+		for pc in range(0, len(self.code), 2):
+			op, arg = self.code[pc], self.code[pc + 1]
+			if op in (CONST, SHOOT):
+				note = repr(self.consts[arg])
+			elif op in (LOCAL, LOAD, STORE, STORE_LOCAL, STORE_PROP, PROP, PROP_OF):
+				note = self.names[arg]
+			elif op == BINARY:
+				note = BINARY_NAMES[arg]
+			elif op == CALL:
+				note = '%s/%d' % (BUILTIN_NAMES[arg >> 3], arg & 7)
+			else:
+				note = arg
+			out.append('%4d %4d %-14s %s' % (self.lines[pc // 2], pc, OPNAMES[op], note))
+		return '\n'.join(out)
+
+
+class Compiler(object):
+	"""
+	A Compiler turns the source of a Dramatic script into a Program.
+		Statements are one per line, and the bodies of loop, if, else,
+		for each and when are the more deeply indented lines after them.
+	Methods:
+		Compiler.compile() returns Program
+	"""
+	def __init__(self, source):
+		self.source = source
+		self.code = []
+		self.consts = []
+		self.names = []
+		self.labels = {}
+		self.handlers = {}
+		self.lines = []
+		self.fixups = []
+		self.lineno = 0
+		self.rows = []
+		for lineno, line in enumerate(source.splitlines()):
+			tokens = tokenize(line, lineno + 1)
+			if tokens:
+				depth = len(line) - len(line.lstrip())
+				self.rows.append((lineno + 1, depth, tokens))
+		self.row = 0
+
+	def compile(self):
+		"""
+		Compiler.compile() returns Program
+		Compiles the whole script.
+		"""
+		self.compile_block(0)
+		self.emit(END)
+		for pc, label, lineno in self.fixups:
+			if label not in self.labels:
+				raise DramaticError('line %d: no label %r' % (lineno, label))
+			self.code[pc + 1] = self.labels[label]
+		return Program(self.source, self.code, self.consts, self.names, self.labels, self.handlers, self.lines)
+
+	def error(self, message):
+		raise DramaticError('line %d: %s' % (self.lineno, message))
+
+	def emit(self, op, arg=0):
+		self.code.extend((op, arg))
+		self.lines.append(self.lineno)
+		return len(self.code) - 2
+
+	def patch(self, pc):
+		self.code[pc + 1] = len(self.code)
+
+	def const(self, value):
+		for i in range(len(self.consts)):
+			if self.consts[i] == value and type(self.consts[i]) is type(value):
+				return i
+		self.consts.append(value)
+		return len(self.consts) - 1
+
+	def name(self, name):
+		if name not in self.names:
+			self.names.append(name)
+		return self.names.index(name)
+
+	def compile_block(self, depth):
+		while self.row < len(self.rows):
+			lineno, row_depth, tokens = self.rows[self.row]
+			if row_depth < depth:
+				return
+			self.lineno = lineno
+			if row_depth > depth:
+				self.error('unexpected indent')
+			self.row += 1
+			self.labels.setdefault(str(lineno), len(self.code))
+			self.tokens, self.pos = tokens, 0
+			self.compile_statement(depth)
+
+	def compile_body(self, depth):
+		"""
+		Compiles the lines indented under the current line, if any.
+		Returns True if there were any.
+		"""
+		if self.row < len(self.rows) and self.rows[self.row][1] > depth:
+			self.compile_block(self.rows[self.row][1])
+			return True
+		return False
+
+	def peek(self, offset=0):
+		if self.pos + offset < len(self.tokens):
+			return self.tokens[self.pos + offset]
+		return (None, None)
+
+	def next(self):
+		token = self.peek()
+		if token[0] == None:
+			self.error('unexpected end of line')
+		self.pos += 1
+		return token
+
+	def at_end(self):
+		return self.pos >= len(self.tokens)
+
+	def expect_end(self):
+		if not self.at_end():
+			self.error('unexpected %r' % (self.peek()[1],))
+
+	def take_word(self, *words):
+		kind, value = self.peek()
+		if kind == 'word' and (not words or value in words):
+			self.pos += 1
+			return value
+		return None
+
+	def compile_statement(self, depth):
+		kind, word = self.peek()
+		if kind == 'op' and word == ':':
+			self.pos += 1
+			label = format_value(self.next()[1]).lower()
+			self.expect_end()
+			self.labels[label] = len(self.code)
+			return
+		if kind != 'word':
+			self.compile_expression_statement()
+			return
+		if word in UNSUPPORTED:
+			self.error('%r is not supported' % word)
+		if word in STATEMENTS:
+			self.pos += 1
+			getattr(self, 'compile_' + word)(depth)
+		else:
+			self.compile_expression_statement()
+
+	def compile_expression_statement(self):
+		self.compile_expression()
+		self.expect_end()
+		self.emit(STORE_LOCAL, self.name('that'))
+
+	def compile_loop(self, depth):
+		self.expect_end()
+		top = len(self.code)
+		self.compile_body(depth)
+		self.emit(YIELD_JUMP, top)
+
+	def compile_if(self, depth):
+		self.compile_expression()
+		self.expect_end()
+		branch = self.emit(JUMP_IF_FALSE)
+		self.compile_body(depth)
+		if self.row < len(self.rows) and self.rows[self.row][1] == depth and self.rows[self.row][2][0] == ('word', 'else'):
+			skip = self.emit(JUMP)
+			self.patch(branch)
+			self.lineno, row_depth, self.tokens = self.rows[self.row]
+			self.row += 1
+			self.pos = 1
+			if self.take_word('if'):
+				self.compile_if(depth)
+			else:
+				self.expect_end()
+				self.compile_body(depth)
+			self.patch(skip)
+		else:
+			self.patch(branch)
+
+	def compile_else(self, depth):
+		self.error("'else' without 'if'")
+
+	def compile_for(self, depth):
+		if not self.take_word('each'):
+			self.error("expected 'for each'")
+		if self.at_end():
+			self.emit(LOCAL, self.name('it'))
+		else:
+			self.compile_expression()
+			self.expect_end()
+		self.emit(ITER)
+		top = self.emit(NEXT)
+		self.compile_body(depth)
+		self.emit(JUMP, top)
+		self.patch(top)
+
+	def compile_set(self, depth):
+		prop = self.take_word('my') != None
+		kind, name = self.next()
+		if kind != 'word':
+			self.error('expected a name to set')
+		self.compile_expression()
+		self.expect_end()
+		if prop or name in PROPERTIES:
+			self.emit(STORE_PROP, self.name(name))
+		elif name in LOCALS:
+			self.emit(STORE_LOCAL, self.name(name))
+		else:
+			self.emit(STORE, self.name(name))
+
+	def compile_go(self, depth):
+		self.compile_optional_direction()
+		self.emit(GO)
+
+	def compile_point(self, depth):
+		if self.at_end():
+			self.error('point needs a direction')
+		self.compile_atom()
+		if self.at_end():
+			self.emit(POINT, 0)
+		else:
+			self.compile_atom()
+			self.expect_end()
+			self.emit(POINT, 1)
+
+	def compile_optional_direction(self):
+		if self.at_end():
+			self.emit(CALL, BUILTIN_NAMES.index('forward') << 3)
+		else:
+			self.compile_expression()
+			self.expect_end()
+
+	def compile_jump(self, depth):
+		words = self.tokens[self.pos:]
+		if len(words) == 1:
+			label = format_value(words[0][1]).lower()
+			self.fixups.append((self.emit(JUMP), label, self.lineno))
+		elif len(words) == 2:
+			self.emit(CONST, self.const(format_value(words[1][1]).lower()))
+			self.compile_atom()
+			self.emit(SEND)
+		else:
+			self.error('expected a label, or an Actor and a label')
+		self.pos = len(self.tokens)
+	compile_goto = compile_trigger = compile_jump
+
+	def compile_say(self, depth):
+		self.compile_expression()
+		self.expect_end()
+		self.emit(SAY)
+	compile_print = compile_say
+
+	def compile_when(self, depth):
+		event = ' '.join(format_value(i[1]) for i in self.tokens[self.pos:])
+		if not event:
+			self.error('when needs an event')
+		if event in self.handlers:
+			self.error('more than one handler for %r' % event)
+		if self.row < len(self.rows) and self.rows[self.row][1] > depth:
+			skip = self.emit(JUMP)
+			self.handlers[event] = len(self.code)
+			self.compile_body(depth)
+			self.emit(RETURN)
+			self.patch(skip)
+		else:
+			# An unindented handler runs until its return; running into it
+			# from above stops the script, as it waits for the event.
+			self.emit(END)
+			self.handlers[event] = len(self.code)
+
+	def compile_return(self, depth):
+		self.expect_end()
+		self.emit(RETURN)
+
+	def compile_die(self, depth):
+		self.expect_end()
+		self.emit(DIE)
+
+	def compile_shoot(self, depth):
+		kind = 'bullet'
+		if self.peek()[0] == 'word' and self.peek()[1] in BUILTIN_SCRIPTS:
+			kind = self.next()[1]
+		self.compile_optional_direction()
+		self.emit(SHOOT, self.const(kind))
+
+	def compile_expression(self):
+		self.compile_binary(('or',), self.compile_and)
+
+	def compile_and(self):
+		self.compile_binary(('and',), self.compile_not)
+
+	def compile_binary(self, operators, operand):
+		operand()
+		while self.peek()[1] in operators and self.peek()[0] in ('op', 'word'):
+			op = self.next()[1]
+			operand()
+			self.emit(BINARY, BINARY_NAMES.index(op))
+
+	def compile_not(self):
+		if self.take_word('not'):
+			self.compile_not()
+			self.emit(NOT)
+		else:
+			self.compile_comparison()
+
+	def compile_comparison(self):
+		self.compile_sum()
+		kind, op = self.peek()
+		if kind == 'op' and op in COMPARISONS:
+			self.pos += 1
+			self.compile_sum()
+			self.emit(BINARY, BINARY_NAMES.index(op))
+		elif kind == 'word' and op in HELPERS:
+			# "A is blocked north" is "blocked north A"; otherwise "A is B"
+			# compares A and B.
+			self.pos += 1
+			negate = self.take_word('not') != None
+			kind, word = self.peek()
+			if kind == 'word' and word in BUILTINS:
+				self.pos += 1
+				self.compile_call(word, 1)
+			else:
+				self.compile_sum()
+				self.emit(BINARY, BINARY_NAMES.index('=='))
+			if negate:
+				self.emit(NOT)
+
+	def compile_sum(self):
+		self.compile_binary(('+', '-'), self.compile_term)
+
+	def compile_term(self):
+		self.compile_binary(('*', '/', '%'), self.compile_power)
+
+	def compile_power(self):
+		self.compile_unary()
+		if self.peek() == ('op', '^'):
+			self.pos += 1
+			self.compile_power()
+			self.emit(BINARY, BINARY_NAMES.index('^'))
+
+	def compile_unary(self):
+		if self.peek() == ('op', '-'):
+			self.pos += 1
+			self.compile_unary()
+			self.emit(NEG)
+		else:
+			self.compile_primary(True)
+
+	def compile_atom(self):
+		self.compile_primary(False)
+
+	def can_start_atom(self):
+		kind, value = self.peek()
+		if kind in ('str', 'num'):
+			return True
+		if kind == 'op':
+			return value in ('(', '-')
+		return kind == 'word' and value not in ('and', 'or', 'not') + HELPERS
+
+	def compile_primary(self, calls):
+		"""
+		Compiles a value and any 's properties of it.  If calls is False, as
+			for the arguments of a builtin, builtins take no arguments.
+		"""
+		kind, value = self.next()
+		if kind in ('str', 'num'):
+			self.emit(CONST, self.const(value))
+		elif kind == 'op' and value == '(':
+			self.compile_expression()
+			if self.next() != ('op', ')'):
+				self.error("expected ')'")
+		elif kind == 'op' and value == '-':
+			self.compile_atom()
+			self.emit(NEG)
+		elif kind == 'op':
+			self.error('unexpected %r' % value)
+		elif value in DIRECTIONS:
+			self.emit(CONST, self.const(DIRECTIONS[value]))
+		elif value in ('number', 'string'):
+			self.emit(CONST, self.const(value))
+		elif value in ('me', 'i'):
+			self.emit(ME)
+		elif value == 'my':
+			kind, name = self.next()
+			if kind != 'word':
+				self.error("expected a property after 'my'")
+			self.emit(PROP, self.name(name))
+		elif value in LOCALS:
+			self.emit(LOCAL, self.name(value))
+		elif value in PROPERTIES:
+			self.emit(PROP, self.name(value))
+		elif value in BUILTINS:
+			self.compile_call(value, 0, calls)
+		else:
+			self.emit(LOAD, self.name(value))
+		while self.peek() == ('op', "'s"):
+			self.pos += 1
+			kind, name = self.next()
+			if kind != 'word':
+				self.error("expected a property after 's")
+			self.emit(PROP_OF, self.name(name))
+
+	def compile_call(self, name, extra, calls=True):
+		"""
+		Compiles a call to a builtin, whose arguments are the extra values
+			already on the stack (the subject of "is") and the atoms after it.
+		"""
+		most = BUILTINS[name][1]
+		count = 0
+		if calls:
+			while count < most - extra and self.can_start_atom():
+				self.compile_atom()
+				count += 1
+		self.emit(CALL, (BUILTIN_NAMES.index(name) << 3) | (count + extra))
+
+
+programs = {}
+
+def compile(source):
+	"""
+	compile(str source) returns Program
+	Compiles a Dramatic script, or returns the Program already compiled
+		from the same source.
+	"""
+	program = programs.get(source)
+	if program == None:
+		program = programs[source] = Compiler(source).compile()
+	return program
+
+############################
+# Virtual machine
+############################
+
+class Process(object):
+	"""
+	A Process runs one Actor's Program.  It keeps the Actor's place, the
+		value stack, the for each loops in progress and the handlers to
+		return from (each as the place, loop depth and stack height to
+		return to), so that a script can stop at the end of a tick, or when
+		it runs out of instructions, and carry on from there next tick.  A
+		script that raises a DramaticError is stopped for good: it is done,
+		its error is kept, and events and jumps no longer wake it.
+	Methods:
+		Process.run(int limit) returns int
+		Process.goto(str label) returns None
+		Process.send(str event) returns bool
+		Process.clone(Actor actor) returns Process
+		Process.wake() returns None
+		Process.stop(str error) returns None
+		Process.is_done() returns bool
+	"""
+	def __init__(self, program, actor):
+		self.program = program
+		self.actor = actor
+		self.pc = 0
+		self.stack = []
+		self.loops = []
+		self.returns = []
+		self.locals = {'it': 0, 'that': 0, 'index': 0}
+		self.done = False
+		self.preempted = False
+		self.error = None
+
+	def is_done(self):
+		"""
+		Process.is_done() returns bool
+		Returns True if the script has ended, died or stopped with an error.
+		"""
+		return self.done
+
+	def goto(self, label):
+		"""
+		Process.goto(str label) returns None
+		Sends the script to a label, abandoning the loops and handlers it
+			was in.
+		"""
+		if self.error != None:
+			return
+		self.pc = self.program.get_label(label)
+		del self.stack[:], self.loops[:], self.returns[:]
+		self.wake()
+
+	def send(self, event):
+		"""
+		Process.send(str event) returns bool
+		Runs the handler for event from the next tick, returning to the
+			current place at its return, and dropping any for each loops and
+			values the handler leaves behind.  Returns False if the script has no
+			handler for event, or is already running a handler, in which
+			case the event is dropped.
+		"""
+		handler = self.program.handlers.get(event)
+		if handler == None or self.returns or self.error != None:
+			return False
+		self.returns.append((self.pc, len(self.loops), len(self.stack)))
+		self.pc = handler
+		self.wake()
+		return True
+
+	def wake(self):
+		"""
+		Process.wake() returns None
+		Clears done, and calls the Actor's wake method, if it has one, if the
+			script was done.
+		"""
+		if self.done:
+			self.done = False
+			if hasattr(self.actor, 'wake'):
+				self.actor.wake()
+
+	def stop(self, error):
+		"""
+		Process.stop(str error) returns None
+		Stops the script for good, keeping error.
+		"""
+		self.done = True
+		self.error = error
+
+	def clone(self, actor):
+		"""
+		Process.clone(Actor actor) returns Process
+		Returns a copy of the Process, at the same place, running for actor.
+		"""
+		new = Process(self.program, actor)
+		new.pc, new.done, new.preempted, new.error = self.pc, self.done, self.preempted, self.error
+		new.stack = list(self.stack)
+		new.loops = [[i[0], i[1]] for i in self.loops]
+		new.returns = list(self.returns)
+		new.locals = dict(self.locals)
+		return new
+
+	def run(self, limit=1000):
+		"""
+		Process.run(int limit) returns int
+		Runs the script until it yields for the tick (at the end of a loop or
+			after a go), ends, or has run limit instructions, and returns the
+			number of instructions run.  In the last case, preempted is set,
+			and the next run carries on from the same place.  An error stops
+			the Process and is raised as a DramaticError giving the line.
+		"""
+		if self.done:
+			return 0
+		program = self.program
+		code, consts, names = program.code, program.consts, program.names
+		stack, actor = self.stack, self.actor
+		push, pop = stack.append, stack.pop
+		pc = self.pc
+		count = 0
+		preempted = False
+		try:
+			while count < limit:
+				op = code[pc]
+				arg = code[pc + 1]
+				pc += 2
+				count += 1
+				if op == CONST:
+					push(consts[arg])
+				elif op == JUMP_IF_FALSE:
+					if not pop():
+						pc = arg
+				elif op == JUMP:
+					pc = arg
+				elif op == CALL:
+					argc = arg & 7
+					args = stack[len(stack) - argc:]
+					del stack[len(stack) - argc:]
+					push(BUILTIN_TABLE[arg >> 3](actor, *args))
+				elif op == YIELD_JUMP:
+					pc = arg
+					break
+				elif op == GO:
+					direction = to_direction(actor, pop())
+					actor.heading = direction
+					dx, dy = DELTAS[direction]
+					if not is_blocked(actor, direction):
+						actor.move_to(actor.x + dx, actor.y + dy)
+					elif hasattr(actor.parent, 'fire'):
+						actor.parent.fire('touched', actor.x + dx, actor.y + dy, actor.x + dx + actor.w, actor.y + dy + actor.h, actor)
+					if code[pc] == YIELD_JUMP:
+						# A go at the end of a loop yields for the loop too.
+						pc = code[pc + 1]
+					break
+				elif op == LOCAL:
+					push(self.locals[names[arg]])
+				elif op == LOAD:
+					name = names[arg]
+					if name in self.locals:
+						push(self.locals[name])
+					elif name in actor.counters:
+						push(actor.counters[name])
+					else:
+						push(find_actor(actor, name) or 0)
+				elif op == BINARY:
+					b = pop()
+					stack[-1] = BINARY_TABLE[arg](stack[-1], b)
+				elif op == NOT:
+					stack[-1] = not stack[-1]
+				elif op == NEG:
+					stack[-1] = -stack[-1]
+				elif op == PROP:
+					push(get_property(actor, names[arg]))
+				elif op == PROP_OF:
+					target = pop()
+					if not is_actor(target):
+						raise DramaticError('%s is not an Actor' % format_value(target))
+					push(get_property(target, names[arg]))
+				elif op == ME:
+					push(actor)
+				elif op == STORE:
+					value = pop()
+					if is_actor(value):
+						self.locals[names[arg]] = value
+					else:
+						self.locals.pop(names[arg], None)
+						actor.set_counter(names[arg], value)
+				elif op == STORE_LOCAL:
+					self.locals[names[arg]] = pop()
+				elif op == STORE_PROP:
+					set_property(actor, names[arg], pop())
+				elif op == ITER:
+					value = pop()
+					if isinstance(value, basestring):
+						value = [ord(i) for i in value]
+					elif not isinstance(value, list):
+						value = [value]
+					self.loops.append([value, 0])
+				elif op == NEXT:
+					loop = self.loops[-1]
+					if loop[1] < len(loop[0]):
+						self.locals['it'] = loop[0][loop[1]]
+						self.locals['index'] = loop[1]
+						loop[1] += 1
+					else:
+						self.loops.pop()
+						pc = arg
+				elif op == POINT:
+					direction = pop()
+					target = pop() if arg else actor
+					if not is_actor(target):
+						raise DramaticError('%s is not an Actor' % format_value(target))
+					target.heading = to_direction(actor, direction)
+				elif op == SAY:
+					print '%s: %s' % (actor.name, format_value(pop()))
+				elif op == SEND:
+					target = pop()
+					label = pop()
+					if not is_actor(target):
+						raise DramaticError('%s is not an Actor' % format_value(target))
+					if target is actor:
+						self.goto(label)
+						pc = self.pc
+					else:
+						target.get_process().goto(label)
+				elif op == RETURN:
+					if self.returns:
+						pc, depth, height = self.returns.pop()
+						del self.loops[depth:], stack[height:]
+					else:
+						del self.loops[:], stack[:]
+						pc -= 2
+						self.done = True
+						break
+				elif op == SHOOT:
+					shoot(actor, consts[arg], to_direction(actor, pop()))
+				elif op == DIE:
+					pc -= 2
+					self.done = True
+					die(actor)
+					break
+				elif op == END:
+					pc -= 2
+					self.done = True
+					break
+			else:
+				preempted = True
+		except (DramaticError, TypeError, ValueError, ArithmeticError, IndexError, KeyError, AttributeError), e:
+			self.pc = pc
+			self.stop('line %d: %s' % (program.lines[(pc - 2) // 2], e))
+			raise DramaticError(self.error)
+		self.pc = pc
+		self.preempted = preempted
+		return count
+
+
+def failed(source, actor, error):
+	"""
+	failed(str source, Actor actor, str error) returns Process
+	Returns a Process for a script that did not compile, already stopped
+		with error, so that the script is not compiled again every tick.
+	"""
+	process = Process(Program(source, [END, 0], [], [], {}, {}, [0]), actor)
+	process.stop(error)
+	return process
+
+
+def die(actor):
+	"""
+	die(Actor actor) returns None
+	Removes actor from its parent.  The parent's ActorList drops its event
+		registrations.
+	"""
+	siblings = getattr(actor.parent, 'actors', [])
+	if actor in siblings:
+		siblings.remove(actor)
+
+def shoot(actor, kind, direction):
+	"""
+	shoot(Actor actor, str kind, int direction) returns Actor or None
+	Creates an Actor of a builtin kind ('bullet' or 'blankactor') in the
+		tile next to actor in direction, heading that way, unless that tile
+		is blocked.
+	"""
+	if is_blocked(actor, direction):
+		return None
+	dx, dy = DELTAS[direction]
+	new = type(actor)(actor.parent, 1, 1, actor.x + dx, actor.y + dy, kind.capitalize())
+	new.heading = direction
+	new.program = BUILTIN_SCRIPTS[kind]
+	if kind == 'bullet':
+		new.sprite[0].fill_sprite(249, 15)
+	actor.parent.actors.append(new)
+	return new
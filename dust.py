@@ -2,15 +2,36 @@
 
 from pprint import pprint
 from copy import deepcopy
-import libtcodpy
+from contextlib import contextmanager
+from collections import deque
+import os
+if os.environ.get('DUST_BACKEND') == 'headless':
+	import headless as libtcodpy
+else:
+	import libtcodpy
+import numpy
 import json
+import zlib
+import threading
+import multiprocessing
+import time
+import dustfile
+import dramatic
 	
-class RootClass:
+class RootClass(object):
 	"""
 	Class for certain functions that require all of the objects in the Dust
 		data structure.
 	Methods:
 		RootClass.redraw(Sprite dest_graphics, *args, **kwargs)
+		RootClass.find_main_display() returns None
+		RootClass.get_world() returns World or None
+		RootClass.get_path() returns list
+		RootClass.record_change(str op, ...) returns None
+		RootClass.touch() returns None
+		RootClass.get_journal() returns Journal or None
+		RootClass.get_history() returns History or None
+		RootClass.set_counter(str name, value) returns None
 	"""
 
 	# def redraw(self, dest_graphics, *args, **kwargs):
@@ -50,21 +71,123 @@ class RootClass:
 			print "Couldn't find main_display in any parents for", repr(self)
 			raise ReferenceError
 
+	def get_world(self):
+		"""
+		RootClass.get_world() returns World or None
+		Follows parents up to the World this object belongs to.  Returns None
+			if the object is not attached to a World.
+		"""
+		obj = self
+		while not isinstance(obj, World):
+			if not hasattr(obj, 'parent'):
+				return None
+			obj = obj.parent
+		return obj
+
+	def get_path(self):
+		"""
+		RootClass.get_path() returns list
+		Returns the location of this object in its World as a flat list of
+			(attribute, index) pairs, e.g. ['boards', 0, 'layers', 2], which
+			World.resolve_path turns back into the object.  Actors are
+			found by their uid (see ActorList) rather than their index, so
+			that the path stays valid as Actors are added and removed.
+		"""
+		if isinstance(self, World) or not hasattr(self, 'parent'):
+			return []
+		parent = self.parent
+		actors = getattr(parent, 'actors', None)
+		if isinstance(actors, ActorList) and actors.by_uid.get(getattr(self, 'uid', None)) is self:
+			return parent.get_path() + ['actors', self.uid]
+		for a in ('boards', 'layers', 'sprite'):
+			siblings = getattr(parent, a, [])
+			for i in range(len(siblings)):
+				if siblings[i] is self:
+					return parent.get_path() + [a, i]
+		print "Couldn't find", repr(self), "in its parent", repr(parent)
+		raise ReferenceError
+
+	def record_change(self, op, *args):
+		"""
+		RootClass.record_change(str op, ...) returns None
+		Records a change made to this object in its World's journal, if the
+			World has one open, and touches it.  See Journal.
+		"""
+		self.touch()
+		journal = self.get_journal()
+		if journal != None:
+			journal.record(op, self.get_path(), *args)
+
+	def touch(self):
+		"""
+		RootClass.touch() returns None
+		Tells the Board this object belongs to that it has changed, so that
+			the next BackgroundSave takes a new Snapshot of it rather than
+			reusing the last one.  The methods that change Boards call it;
+			code that changes a Board's values directly should too.  Raises
+			ReferenceError if the Board has been evicted from its World (see
+			World.evict_board), since the change would be lost.
+		"""
+		obj = self
+		while not isinstance(obj, Board):
+			obj = getattr(obj, 'parent', None)
+			if obj == None:
+				return
+		if obj.closed:
+			raise ReferenceError("Board %r has been evicted from its World; get it again with World.get_board" % obj.name)
+		obj.snapshot = None
+
+	def get_journal(self):
+		"""
+		RootClass.get_journal() returns Journal or None
+		Returns the Journal of this object's World, if it has one open.
+		"""
+		world = self.get_world()
+		if world == None:
+			return None
+		return world.journal
+
+	def get_history(self):
+		"""
+		RootClass.get_history() returns History or None
+		Returns the undo History of this object's World, if it has one open.
+		"""
+		world = self.get_world()
+		if world == None:
+			return None
+		return world.history
+
+	def set_counter(self, name, value):
+		"""
+		RootClass.set_counter(str name, value) returns None
+		Sets one of this object's counters and records the change.
+		"""
+		self.touch()
+		self.counters[name] = value
+		self.record_change('counter', name, value)
+
 
 class Saveable(RootClass):
 	"""
 	Class for all Dust objects that can be loaded and saved.
 	Methods:
-		Saveable.load_from_dict(dict load_dict) returns None
+		Saveable.load_from_dict(dict load_dict, list planes) returns None
+		Saveable.load_child(class this_class, dict blueprint, list planes)
+			returns Saveable
 		Saveable.get_footprint() returns dict
-		Saveable.serialize() returns dict
+		Saveable.get_codec() returns Codec
+		Saveable.serialize(list planes, tuple exclude) returns dict
+		Saveable.get_snapshot(tuple exclude) returns Snapshot
+		Saveable.clone(Saveable parent) returns Saveable
 	
 	"""
+	codecs = {}
+
 	def __init__(self):
 		pass
-	def load_from_dict(self, load_dict):
+	def load_from_dict(self, load_dict, planes=None):
 		"""
-		Saveable.load_from_dict(dict load_dict)
+		Saveable.load_from_dict(dict load_dict, list planes)
 			returns None
 		Takes a dictionary loaded from JSON containing properties that
 			are in this object's footprint.  The footprint describes how
@@ -73,26 +196,30 @@ class Saveable(RootClass):
 			serialized or de-serialized as-is; if the footprint's value is
 			a class name, it is loaded as a list of classes, which, in
 			turn, have load_from_dict called to deserialize them.
-		See also:  Saveable.get_footprint, Saveable.serialize
-		"""
-		footprint = self.get_footprint()
-		for this_attribute in footprint:
-			this_class = footprint[this_attribute]
-			if not this_class:
-				if hasattr(load_dict, this_attribute):
-					setattr(self, this_attribute, load_dict[this_attribute])
-			else:
-				compiled_attribute_list = []
-				for each_blueprint in load_dict[this_attribute]:
-					if hasattr(each_blueprint, 'subclass'):
-						new_object = each_blueprint[subclass]()
-					else:
-						new_object = this_class()
-					new_object.load_from_dict(each_blueprint)
-					compiled_attribute_list.append(new_object)
-				setattr(self, this_attribute, compiled_attribute_list)
+			Properties missing from load_dict keep their current value.  If
+			planes is given, values of the form {"plane": index} are replaced
+			with planes[index], as written by serialize; run-length encoded
+			planes of the form {"rle": runs} are expanded.
+		See also:  Saveable.get_footprint, Saveable.serialize, Codec
+		"""
+		self.get_codec().decode(self, load_dict, planes)
 		return None
 
+	def load_child(self, this_class, blueprint, planes=None):
+		"""
+		Saveable.load_child(class this_class, dict blueprint, list planes)
+			returns Saveable
+		Creates an object of this_class (or of the class named by the
+			blueprint's 'subclass' key) as a child of this object, sized and
+			positioned from the blueprint, and loads the blueprint into it.
+		"""
+		if 'subclass' in blueprint:
+			this_class = globals()[blueprint['subclass']]
+		geometry = dict((k, blueprint[k]) for k in ('w', 'h', 'x', 'y') if k in blueprint)
+		new_object = this_class(self, **geometry)
+		new_object.load_from_dict(blueprint, planes)
+		return new_object
+
 	def get_footprint(self):
 		"""
 		Saveable.get_footprint() returns dict
@@ -100,30 +227,314 @@ class Saveable(RootClass):
 			loading.  The values are in the form {property: obj}, where
 			property is the name of the property (i.e., what you would pass
 			to getattr), and obj is either False for a static JSONable data
-			type (list, int, string), or a class' name if the data type is
-			a list of that class.
+			type (list, int, string), numpy.ndarray for a tile plane, or a
+			class' name if the data type is a list of that class.
 		See also:  Saveable.load_from_dict, Saveable.serialize
 		"""
 		return {}
+
+	def get_codec(self):
+		"""
+		Saveable.get_codec() returns Codec
+		Returns the Codec compiled from the footprint of this object's
+			class.  Each class' footprint is compiled once, on first use, and
+			kept in Saveable.codecs.
+		"""
+		codec = Saveable.codecs.get(type(self))
+		if codec == None:
+			codec = Saveable.codecs[type(self)] = Codec(self.get_footprint())
+		return codec
 		
-	def serialize(self):
+	def serialize(self, planes=None, exclude=()):
 		"""
-		Saveable.serialize() returns dict
+		Saveable.serialize(list planes, tuple exclude) returns dict
 		Serializes the data in this Seriable and all Seriables it
 			references, in a format similar to __dict__, except it only respects
-			the keys provided from self.get_footprint().
-		See also:  Saveable.load_from_dict, Saveable.serialize
+			the keys provided from self.get_footprint(), less any named in
+			exclude.  Tile planes (numpy arrays) are turned into lists, or
+			into {"rle": runs} where that is much smaller, unless a list is
+			passed as planes, in which case they are appended to it and
+			replaced with {"plane": index}.
+		See also:  Saveable.load_from_dict, Saveable.serialize, Codec
+		"""
+		return self.get_codec().encode(self, planes, exclude)
+
+	def get_snapshot(self, exclude=()):
+		"""
+		Saveable.get_snapshot(tuple exclude) returns Snapshot
+		Returns a Snapshot of the values this object would serialize, less
+			any named in exclude, which can be serialized later while the
+			object carries on changing.
 		"""
-		footprint = self.get_footprint()
+		return self.get_codec().snapshot(self, exclude)
+
+	def clone(self, parent=None):
+		"""
+		Saveable.clone(Saveable parent) returns Saveable
+		Returns a copy of this object as a child of parent, without going
+			through serialization.  Lists of child objects are cloned in
+			turn; other lists and dicts are copied; tile planes are shared
+			and made read-only, so that whichever copy changes a plane first
+			copies it (see Layer.unshare and Sprite.unshare); everything else
+			is shared.
+		"""
+		new = object.__new__(type(self))
+		attributes = new.__dict__ = self.__dict__.copy()
+		if parent != None:
+			new.parent = parent
+		for a, value in attributes.items():
+			kind = type(value)
+			if kind is list:
+				attributes[a] = [i.clone(new) if isinstance(i, (Saveable, BoardStub)) else i for i in value]
+			elif kind is ActorList:
+				attributes[a] = ActorList(new, [i.clone(new) for i in value])
+			elif kind is dict:
+				attributes[a] = value.copy()
+			elif kind is numpy.ndarray:
+				value.flags.writeable = False
+		return new
+
+
+class Codec(object):
+	"""
+	A Codec holds the encode, decode and snapshot functions compiled from a
+		class' footprint, so that Saveable.serialize, Saveable.load_from_dict
+		and Saveable.get_snapshot run straight-line code instead of building
+		and walking the footprint for every object.
+	Methods:
+		Codec.compile(str source, str name) returns function
+		Codec.encode(Saveable obj, list planes, tuple exclude) returns dict
+		Codec.decode(Saveable obj, dict load_dict, list planes) returns None
+		Codec.snapshot(Saveable obj, tuple exclude) returns Snapshot
+	"""
+	def __init__(self, footprint):
+		self.footprint = footprint
+		self.classes = {}
 		for a in footprint:
-			if footprint[a]:
-				footprint[a] = []
-				for i in getattr(self, a):
-					footprint[a].append(i.serialize())
-				#footprint[a] = self.serialize_all(getattr(self, a))
+			if footprint[a] and footprint[a] is not numpy.ndarray:
+				self.classes['class_' + a] = footprint[a]
+		self.encoders = {}
+		self.snapshotters = {}
+		lines = ['def decode(obj, load_dict, planes):']
+		for a in sorted(footprint):
+			lines.append('\tif %r in load_dict:' % a)
+			if not footprint[a]:
+				lines.append('\t\tobj.%s = load_dict[%r]' % (a, a))
+			elif footprint[a] is numpy.ndarray:
+				lines.append('\t\tobj.%s = decode_plane(load_dict[%r], planes)' % (a, a))
 			else:
-				footprint[a] = getattr(self, a)
-		return footprint
+				lines.append('\t\tobj.%s = [obj.load_child(class_%s, b, planes) for b in load_dict[%r]]' % (a, a, a))
+		lines.append('\treturn None')
+		self.decode_function = self.compile('\n'.join(lines), 'decode')
+
+	def compile(self, source, name):
+		"""
+		Codec.compile(str source, str name) returns function
+		Executes source and returns the function it defines called name.
+		"""
+		namespace = dict(self.classes, encode_plane=encode_plane, decode_plane=decode_plane, snapshot_plane=snapshot_plane, copy_plain=copy_plain, Snapshot=Snapshot, codec=self)
+		exec source in namespace
+		return namespace[name]
+
+	def encode(self, obj, planes=None, exclude=()):
+		"""
+		Codec.encode(Saveable obj, list planes, tuple exclude) returns dict
+		Serializes obj.  An encoder is compiled for each distinct exclude.
+			See Saveable.serialize.
+		"""
+		encoder = self.encoders.get(exclude)
+		if encoder == None:
+			items = []
+			for a in sorted(self.footprint):
+				if a in exclude:
+					continue
+				if not self.footprint[a]:
+					items.append('%r: obj.%s' % (a, a))
+				elif self.footprint[a] is numpy.ndarray:
+					items.append('%r: encode_plane(obj.%s, planes)' % (a, a))
+				else:
+					items.append('%r: [i.serialize(planes) for i in obj.%s]' % (a, a))
+			source = 'def encode(obj, planes):\n\treturn {%s}' % ', '.join(items)
+			encoder = self.encoders[exclude] = self.compile(source, 'encode')
+		return encoder(obj, planes)
+
+	def decode(self, obj, load_dict, planes=None):
+		"""
+		Codec.decode(Saveable obj, dict load_dict, list planes) returns None
+		Loads load_dict into obj.  See Saveable.load_from_dict.
+		"""
+		self.decode_function(obj, load_dict, planes)
+
+	def snapshot(self, obj, exclude=()):
+		"""
+		Codec.snapshot(Saveable obj, tuple exclude) returns Snapshot
+		Takes a Snapshot of obj.  A snapshot function is compiled for each
+			distinct exclude.  See Saveable.get_snapshot.
+		"""
+		snapshotter = self.snapshotters.get(exclude)
+		if snapshotter == None:
+			# Plain values that are not dicts or lists are taken inline,
+			# rather than through a function call each.
+			items = []
+			for a in sorted(self.footprint):
+				if a in exclude:
+					continue
+				if not self.footprint[a]:
+					items.append('%r: copy_plain(obj.%s) if type(obj.%s) in (dict, list) else obj.%s' % ((a,) + (a,) * 3))
+				elif self.footprint[a] is numpy.ndarray:
+					items.append('%r: snapshot_plane(obj.%s)' % (a, a))
+				else:
+					items.append('%r: [i.get_snapshot() for i in obj.%s]' % (a, a))
+			lines = ['def snapshot(obj):', '\tnew = Snapshot(codec)', '\tnew.__dict__.update({%s})' % ', '.join(items), '\treturn new']
+			snapshotter = self.snapshotters[exclude] = self.compile('\n'.join(lines), 'snapshot')
+		return snapshotter(obj)
+
+
+class Snapshot(object):
+	"""
+	A Snapshot holds the values a Saveable serializes, as they were when
+		Saveable.get_snapshot was called, so that a BackgroundSave can
+		serialize them on its own thread.  Tile planes are shared and made
+		read-only (see Layer.unshare and Sprite.unshare); dicts and lists
+		are copied (see copy_plain).
+	Methods:
+		Snapshot.serialize(list planes, tuple exclude) returns dict
+	"""
+	def __init__(self, codec):
+		self.codec = codec
+
+	def serialize(self, planes=None, exclude=()):
+		"""
+		Snapshot.serialize(list planes, tuple exclude) returns dict
+		Serializes the Snapshot as Saveable.serialize would have serialized
+			the Saveable.
+		"""
+		return self.codec.encode(self, planes, exclude)
+
+
+def copy_plain(value):
+	"""
+	copy_plain(dict or list value) returns dict or list
+	Copies a plain dict or list for a Snapshot: a shallow copy if it holds
+		no dicts or lists, as counters usually do, or else a deep one.
+	"""
+	for i in (value.itervalues() if type(value) is dict else value):
+		if type(i) in (dict, list):
+			return deepcopy(value)
+	return value.copy() if type(value) is dict else list(value)
+
+
+def snapshot_plane(plane):
+	"""
+	snapshot_plane(numpy.ndarray plane) returns numpy.ndarray
+	Makes a tile plane read-only, so that it can be shared with a Snapshot,
+		and returns it.
+	"""
+	if isinstance(plane, numpy.ndarray):
+		plane.flags.writeable = False
+	return plane
+
+
+def encode_plane(plane, planes=None):
+	"""
+	encode_plane(numpy.ndarray plane, list planes) returns list or dict
+	Returns a tile plane as it is serialized: appended to planes and replaced
+		with {"plane": index} if planes is a list, or else in its JSON form.
+	"""
+	if not isinstance(plane, numpy.ndarray):
+		return plane
+	if planes != None:
+		planes.append(plane)
+		return {'plane': len(planes) - 1}
+	return dustfile.encode_json_plane(plane)
+
+
+blank_planes = {}
+
+def blank_plane(row, n):
+	"""
+	blank_plane(tuple row, int n) returns numpy.ndarray
+	Returns a shared, read-only int32 plane of n copies of row, which new
+	Layers and Sprites start from, so that objects whose planes are about to
+	be loaded do not each build one.
+	"""
+	key = (row, n)
+	if key not in blank_planes:
+		blank_planes[key] = dustfile.share_plane(numpy.tile(numpy.array(row, dtype=numpy.int32), (n, 1)))
+	return blank_planes[key]
+
+
+def is_shared_plane(plane):
+	"""
+	is_shared_plane(plane) returns bool
+	Returns True if plane is a read-only int32 array, which Layers and
+	Sprites share instead of copying.  See Layer.unshare and Sprite.unshare.
+	"""
+	return isinstance(plane, numpy.ndarray) and plane.dtype == numpy.int32 and not plane.flags.writeable
+
+
+def decode_plane(value, planes=None):
+	"""
+	decode_plane(value, list planes) returns numpy.ndarray or list
+	Reverses encode_plane.
+	"""
+	if isinstance(value, dict):
+		if planes != None and 'plane' in value:
+			return planes[value['plane']]
+		elif 'rle' in value:
+			return dustfile.decode_json_plane(value)
+	return value
+
+
+# The keys a single-tile Actor and its Sprite may have for pack_actors to
+# pack the Actor into columns.
+PACKED_ACTOR_KEYS = frozenset(['w', 'h', 'x', 'y', 'name', 'sprite', 'counters', 'program', 'heading', 'uid'])
+PACKED_SPRITE_KEYS = frozenset(['w', 'h', 'x', 'y', 'tilemap', 'tilemask'])
+
+
+def pack_actors(actors):
+	"""
+	pack_actors(list actors) returns dict or None
+	Packs serialized single-tile Actors into columns that Layer.adopt_actors
+		builds Actors from without loading each from a dict: 'ints', an
+		int32 array with a row (x, y, heading, uid, sprite x, sprite y,
+		tilemask, tilemap plane) per Actor, where a uid of -1 is None, and
+		lists of the Actors' 'names', 'programs' and 'counters'.  Returns
+		None if any of the Actors is not a plain single-tile Actor.
+	"""
+	rows, names, programs, counters = [], [], [], []
+	for a in actors:
+		if not PACKED_ACTOR_KEYS.issuperset(a) or a.get('w', 1) != 1 or a.get('h', 1) != 1 or len(a.get('sprite', ())) != 1:
+			return None
+		sprite = a['sprite'][0]
+		tilemap = sprite.get('tilemap')
+		if not PACKED_SPRITE_KEYS.issuperset(sprite) or sprite.get('w') != 1 or sprite.get('h') != 1 or not isinstance(tilemap, dict) or 'plane' not in tilemap:
+			return None
+		uid = a.get('uid')
+		rows.append((a.get('x', 0), a.get('y', 0), a.get('heading', 0), -1 if uid == None else uid, sprite.get('x', 0), sprite.get('y', 0), sprite.get('tilemask', 0), tilemap['plane']))
+		names.append(a.get('name', "New Actor"))
+		programs.append(a.get('program', ""))
+		counters.append(a.get('counters', {}))
+	return {'ints': numpy.array(rows, dtype=numpy.int32).reshape(-1, 8), 'names': names, 'programs': programs, 'counters': counters}
+
+
+def load_board_record(location):
+	"""
+	load_board_record(tuple location) returns tuple (dict, list, list)
+	Reads and decodes the BORD chunk at location (see dustfile.load_chunk),
+		in a worker process of World.iter_load_parallel, and packs the
+		Actors of each Layer that pack_actors can pack, taking them out of
+		the Board's object.  Returns the object, its planes and a list of
+		(Layer index, columns).
+	"""
+	obj, planes = dustfile.load_chunk(location)
+	packed = []
+	for i, layer in enumerate(obj.get('layers', [])):
+		columns = pack_actors(layer.get('actors', []))
+		if columns != None:
+			del layer['actors']
+			packed.append((i, columns))
+	return obj, planes, packed
 
 
 class Material(RootClass):
@@ -135,6 +546,9 @@ class Material(RootClass):
 		Material.get_sprite() returns None or Sprite instance
 		Material.get_console() returns None or libtcodpy Console instance
 		Material.fill(char, color) returns None
+		Material.get_children() returns list
+		Material.get_memory_size() returns int
+		Material.close() returns None
 	"""
 	def __init__(self):
 		pass
@@ -218,6 +632,105 @@ class Material(RootClass):
 
 		return max(self.x, min(self.x+self.w-1, x)), max(self.y, min(self.y+self.h-1, y))
 
+	def get_children(self):
+		"""
+		Material.get_children() returns list
+		Returns the Sprites, Layers and Actors held by this Material.
+		"""
+		children = []
+		for a in ('sprite', 'layers', 'actors'):
+			if hasattr(self, a):
+				children.extend(getattr(self, a))
+		return children
+
+	def get_memory_size(self):
+		"""
+		Material.get_memory_size() returns int
+		Returns an estimate of the bytes held by this Material's gamemap and
+		by its Sprites, Layers and Actors.
+		"""
+		size = sum(i.get_memory_size() for i in self.get_children())
+		if hasattr(self, 'gamemap'):
+			size += self.gamemap.nbytes
+		return size
+
+	def close(self):
+		"""
+		Material.close() returns None
+		Closes the consoles of this Material's Sprites, Layers and Actors.
+		The Material should not be blitted afterwards.
+		"""
+		for i in self.get_children():
+			i.close()
+
+
+class Tilesaurus(object):
+	"""
+	A Tilesaurus is the table of game tile types that a Layer's gamemap ids
+		refer to.  On creation it is compiled into lookup arrays indexed by
+		id, so that whole gamemaps can be rendered with a single gather.  The
+		arrays have one extra row at the end, which is used for unknown ids.
+		A type with "solid": true blocks movement; unknown ids do not.
+	Methods:
+		Tilesaurus.load(str file_path) returns Tilesaurus
+		Tilesaurus.clip(ids) returns ids
+		Tilesaurus.render(ids) returns numpy.ndarray
+		Tilesaurus.is_solid(int id) returns bool
+		Tilesaurus.pack_solid(ids) returns bytearray
+	"""
+	def __init__(self, types):
+		self.types = types
+		self.floor = numpy.array([(t['floor_char'], t['floor_color']) for t in types] + [(32, 7)], dtype=numpy.int32)
+		self.wall = numpy.array([(t['wall_char'], t['wall_color']) for t in types] + [(32, 7)], dtype=numpy.int32)
+		self.solid = numpy.array([bool(t.get('solid', False)) for t in types] + [False], dtype=bool)
+		self.solid_ids = self.solid[:-1].tolist()
+
+	@classmethod
+	def load(cls, file_path):
+		"""
+		Tilesaurus.load(str file_path) returns Tilesaurus
+		Loads and compiles a tilesaurus JSON file.
+		"""
+		with open(file_path) as fp:
+			return cls(json.load(fp)['types'])
+
+	def __len__(self):
+		return len(self.types)
+
+	def __getitem__(self, id):
+		return self.types[id]
+
+	def clip(self, ids):
+		"""
+		Tilesaurus.clip(ids) returns ids
+		Maps an id or array of ids to rows of the lookup arrays, sending ids
+		that are not in the tilesaurus to the extra row.
+		"""
+		return numpy.where((ids >= 0) & (ids < len(self.types)), ids, len(self.types))
+
+	def render(self, ids):
+		"""
+		Tilesaurus.render(ids) returns numpy.ndarray
+		Returns the (char, color) floor tiles for an array of ids as an
+		(n, 2) array.
+		"""
+		return self.floor[self.clip(ids)]
+
+	def is_solid(self, id):
+		"""
+		Tilesaurus.is_solid(int id) returns bool
+		Returns True if tiles of type id block movement.
+		"""
+		return 0 <= id < len(self.solid_ids) and self.solid_ids[id]
+
+	def pack_solid(self, ids):
+		"""
+		Tilesaurus.pack_solid(ids) returns bytearray
+		Returns the solidity of an array of ids as a bitmap, eight tiles to a
+		byte, with the first tile in the high bit of the first byte.
+		"""
+		return bytearray(numpy.packbits(self.solid[self.clip(ids)]).tostring())
+
 
 class World(Saveable):
 	"""
@@ -225,16 +738,46 @@ class World(Saveable):
 		counters, boards, actors, and world settings.
 	Methods:
 		World.get_footprint() returns dict
-		World.create_default_world()
+		World.get_actors() returns ActorList
+		World.set_actors(list actors) returns None
 		World.tick()
+		World.iter_actors() yields Actor
+		World.iter_actor_lists() yields list
 		World.blit(Graphics dest_graphics, ...)
-		World.create_default_world()
-		World.save(str file_path) returns bool
+		World.create_default_world(int w, int h)
+		World.load(str file_path, bool lazy, int processes) returns None
+		World.iter_load(str file_path, bool lazy, int processes)
+			yields Board
+		World.iter_load_parallel(str file_path, int processes) yields Board
+		World.get_board(int i) returns Board
+		World.set_current_board(int i) returns None
+		World.evict_boards() returns None
+		World.evict_board(int i) returns None
+		World.resolve_path(list path) returns object
+		World.open_journal(str file_path) returns Journal
+		World.open_history(int budget) returns History
+		World.set_script_limits(int budget, float deadline) returns None
+		World.save(str file_path, str format, bool compress) returns bool
+		World.save_incremental() returns bool
+		World.compact() returns bool
+		World.clear_journal(str file_path) returns None
+		World.write_binary(file f, bool compress) returns None
+		World.read_board(str file_path, int i) returns Board
+		World.write_board(int i, str file_path) returns None
+		World.compact_file(str file_path) returns None
+		World.save_in_background(str file_path, str format, bool compress)
+			returns BackgroundSave or None
+		World.start_autosave(float interval, str file_path, str format,
+			bool compress) returns None
+		World.stop_autosave() returns None
+		World.poll_autosave(bool wait) returns bool or None
+		World.clone() returns World
+		World.snapshot() returns World
+		World.restore(World snapshot) returns None
 	"""
-	def __init__(self, main_display, name="New World", tilesaurus_path='data/tilesaurus.json', file_path=False):
-		with open(tilesaurus_path) as fp:
-			global tilesaurus
-			tilesaurus = json.load(fp)['types']
+	def __init__(self, main_display, name="New World", tilesaurus_path='data/tilesaurus.json', file_path=False, lazy=False, board_memory_budget=None, processes=None):
+		global tilesaurus
+		tilesaurus = Tilesaurus.load(tilesaurus_path)
 		
 		# set defaults before loading, so that they may be overridden
 		self.main_display = main_display
@@ -243,73 +786,1344 @@ class World(Saveable):
 		self.boards = []
 		self.layers = []
 		self.actors = []
+		self.board_memory_budget = board_memory_budget
+		self.board_lru = []
+		self.journal = None
+		self.history = None
+		self.autosave_interval = None
+		self.autosave_options = {}
+		self.last_autosave = time.time()
+		self.background_save = None
+		self.scheduler = Scheduler(self)
+
+		if not file_path:
+			self.create_default_world()
+		else:
+			if file_path == True:
+				file_path = "saved.json"
+			self.file_path = file_path
+			self.load(file_path, lazy, processes)
+			
+	def create_default_world(self, w=80, h=25):
+		"""
+		World.create_default_world(int w, int h)
+		Creates a default board, 80x25 unless w and h are given, and adds a
+		blank Layer.
+		"""
+		self.current_board = Board(self, w, h)
+		self.boards.append(self.current_board)
+		my_layer = Layer(self.current_board, *(getattr(self.current_board, x) for x in ('w','h','x','y')))
+		self.current_board.layers.append(my_layer)
+		
+	def get_footprint(self):
+		return {'name': False, 'counters': False, 'actors': Actor, 'layers': Layer, 'boards': Board}
+	get_footprint.__doc__ = Saveable.get_footprint.__doc__ # Inherit docstring.
+
+	def get_actors(self):
+		"""
+		World.get_actors() returns ActorList
+		Returns the World's own Actors.
+		"""
+		return self._actors
+
+	def set_actors(self, actors):
+		"""
+		World.set_actors(list actors) returns None
+		Replaces the World's own Actors.
+		"""
+		self._actors = ActorList(self, actors)
+	actors = property(get_actors, set_actors)
+		
+	def tick(self):
+		"""
+		World.tick()
+		Runs the scripts of the World's Actors, and those on its Layers and
+			Boards, within the Scheduler's budget, then finishes or starts
+			an autosave if one is due.  Edits made by the scripts are not
+			undo steps.  See Scheduler.tick and World.poll_autosave.
+		"""
+		if self.history == None:
+			self.scheduler.tick()
+		else:
+			with self.history.paused():
+				self.scheduler.tick()
+		self.poll_autosave()
+
+	def iter_actors(self):
+		"""
+		World.iter_actors() yields Actor
+		Yields the World's global Actors, the Actors on its global Layers, and
+			the Actors and Layer Actors of each loaded Board, in the order
+			they are ticked.
+		"""
+		for actors in self.iter_actor_lists():
+			for i in actors:
+				yield i
+
+	def iter_actor_lists(self):
+		"""
+		World.iter_actor_lists() yields list
+		Yields the actors lists of the World, its global Layers, and each
+			loaded Board and its Layers, in World.iter_actors order.
+		"""
+		yield self.actors
+		for layer in self.layers:
+			yield layer.actors
+		for board in self.boards:
+			if isinstance(board, BoardStub):
+				continue
+			yield board.actors
+			for layer in board.layers:
+				yield layer.actors
+			
+	def blit(self, dest_graphics):
+		"""
+		World.blit(Graphics dest_graphics, ...)
+		Composites the current Board's Layers over the World's global Layers
+			and blits the frame to dest_graphics.  Each tile of dest_graphics
+			is written once, from the topmost opaque Sprite that covers it;
+			see Compositor.
+		"""
+		if not hasattr(self, 'compositor') or (self.compositor.w, self.compositor.h) != (dest_graphics.w, dest_graphics.h):
+			self.compositor = Compositor(dest_graphics.w, dest_graphics.h)
+		self.compositor.composite(self.current_board.layers + self.layers, dest_graphics)
+		
+	def load(self, file_path, lazy=False, processes=None):
+		"""
+		World.load(str file_path, bool lazy, int processes) returns None
+		Loads the world from a Dust World file, which may be either binary or
+			JSON; the format is detected from the file's contents.  See
+			iter_load for lazy and parallel loading.  If a journal of changes
+			made since the file was saved lies next to it, the changes are
+			replayed, followed by any in the second file of a BackgroundSave
+			that did not finish (see Journal.split).
+		"""
+		for board in self.iter_load(file_path, lazy, processes):
+			pass
+		self.current_board = self.get_board(0)
+		for journal_path in (file_path + '.journal', file_path + '.journal.next'):
+			if os.path.exists(journal_path):
+				Journal(journal_path).replay(self)
+
+	def iter_load(self, file_path, lazy=False, processes=None):
+		"""
+		World.iter_load(str file_path, bool lazy, int processes) yields Board
+		Loads the world from a Dust World file one Board at a time, yielding
+			each Board once it is built.  The World's own properties are loaded
+			before the first Board, and current_board is set as soon as the
+			first Board arrives, so the World can be played while the rest
+			load, e.g. by advancing the generator once per frame:
+				loader = world.iter_load('big.dust')
+				next(loader)
+				...
+				next(loader, None)
+			Binary files are streamed a chunk and a plane at a time, so memory
+			is bounded by the largest Board; JSON files, which may be deflated,
+			have to be parsed whole first.
+			If lazy is True, only the first Board is built; the others are
+			left as BoardStubs that are built on first access through
+			get_board, and are yielded as such.  Otherwise, if processes is
+			more than 1, the Board chunks of a binary file are read and
+			decoded by a pool of that many processes, and the Boards are built
+			from their results in order.
+		"""
+		self.boards = []
+		self.board_lru = []
+		if dustfile.is_dust_file(file_path) and not lazy and processes > 1:
+			for board in self.iter_load_parallel(file_path, processes):
+				yield board
+		elif dustfile.is_dust_file(file_path):
+			with open(file_path, 'rb') as f:
+				for tag, start, length in dustfile.read_locations(f):
+					if tag == b'WRLD':
+						section = dustfile.Section(f, start, length, numpy.int32)
+						self.load_from_dict(section.object, section)
+					elif tag == b'BORD':
+						if lazy and self.boards:
+							board = BoardStub(file_path=file_path, start=start, length=length)
+						else:
+							section = dustfile.Section(f, start, length, numpy.int32)
+							board = self.load_child(Board, section.object, section)
+						self.boards.append(board)
+						if len(self.boards) == 1:
+							self.current_board = board
+						yield board
+		else:
+			with open(file_path, 'rb') as fp:
+				data = fp.read()
+			if data[:1] == b'x':
+				data = zlib.decompress(data)
+			j = json.loads(data)
+			blueprints = j.pop('boards', [])
+			self.load_from_dict(j)
+			for i in range(len(blueprints)):
+				if lazy and self.boards:
+					board = BoardStub(payload=zlib.compress(dustfile.encode_chunk(blueprints[i], []), 1))
+				else:
+					board = self.load_child(Board, blueprints[i])
+				blueprints[i] = None
+				self.boards.append(board)
+				if len(self.boards) == 1:
+					self.current_board = board
+				yield board
+
+	def iter_load_parallel(self, file_path, processes):
+		"""
+		World.iter_load_parallel(str file_path, int processes) yields Board
+		Loads a binary Dust World file as iter_load does, with the Board
+			chunks decoded by a pool of processes.  Each worker returns a
+			chunk's object and its int32 planes, which are adopted as they
+			are, with the single-tile Actors of its Layers packed into
+			columns (see load_board_record), so that building the Boards
+			does not load each Actor from a dict.
+		"""
+		locations = []
+		with open(file_path, 'rb') as f:
+			for tag, start, length in dustfile.read_locations(f):
+				if tag == b'WRLD':
+					section = dustfile.Section(f, start, length, numpy.int32)
+					self.load_from_dict(section.object, section)
+				elif tag == b'BORD':
+					locations.append((file_path, start, length, numpy.int32))
+		pool = multiprocessing.Pool(processes)
+		try:
+			chunksize = max(1, len(locations) // (processes * 4))
+			for obj, planes, packed in pool.imap(load_board_record, locations, chunksize):
+				planes = [dustfile.share_plane(plane) for plane in planes]
+				board = self.load_child(Board, obj, planes)
+				for i, columns in packed:
+					board.layers[i].adopt_actors(columns, planes)
+				self.boards.append(board)
+				if len(self.boards) == 1:
+					self.current_board = board
+				yield board
+		finally:
+			pool.terminate()
+			pool.join()
+
+	def get_board(self, i):
+		"""
+		World.get_board(int i) returns Board
+		Returns the Board at index i, building it first if it is a
+			BoardStub, and marks it as the most recently used Board.  Other
+			Boards may then be evicted to keep within board_memory_budget.
+		"""
+		board = self.boards[i]
+		if isinstance(board, BoardStub):
+			board = board.materialize(self)
+			self.boards[i] = board
+		if board in self.board_lru:
+			self.board_lru.remove(board)
+		self.board_lru.append(board)
+		self.evict_boards()
+		return board
+
+	def set_current_board(self, i):
+		"""
+		World.set_current_board(int i) returns None
+		Makes the Board at index i the current Board, building it if needed.
+		"""
+		self.current_board = self.boards[i]
+		self.current_board = self.get_board(i)
+
+	def evict_boards(self):
+		"""
+		World.evict_boards() returns None
+		If board_memory_budget (in bytes) is set and the built Boards take
+			more than that, evicts the least recently used Boards other than
+			the current one and the most recently used one (the Board
+			get_board is returning) until they fit.  Boards that have never been
+			accessed through get_board count as least recently used.
+		"""
+		if self.board_memory_budget == None:
+			return
+		built = [b for b in self.boards if isinstance(b, Board)]
+		sizes = dict((id(b), b.get_memory_size()) for b in built)
+		total = sum(sizes.values())
+		order = [b for b in built if b not in self.board_lru] + self.board_lru
+		recent = self.board_lru[-1:]
+		for board in order:
+			if total <= self.board_memory_budget:
+				break
+			if board is self.current_board or board in recent:
+				continue
+			total -= sizes[id(board)]
+			self.evict_board(self.boards.index(board))
+
+	def evict_board(self, i):
+		"""
+		World.evict_board(int i) returns None
+		Replaces the Board at index i with a BoardStub holding its deflated
+			binary form, drops its Actors from the Scheduler, and closes its
+			consoles.  The Board is marked closed, so that edits made
+			through it afterwards raise ReferenceError (see
+			RootClass.touch) rather than being lost.
+		"""
+		board = self.boards[i]
+		if isinstance(board, BoardStub):
+			return
+		self.boards[i] = BoardStub(payload=zlib.compress(board.get_chunk(), 1))
+		if board in self.board_lru:
+			self.board_lru.remove(board)
+		if self.history != None:
+			self.history.forget(board)
+		actors = list(board.actors)
+		for layer in board.layers:
+			actors.extend(layer.actors)
+		self.scheduler.forget(actors)
+		board.close()
+		board.closed = True
+
+	def resolve_path(self, path):
+		"""
+		World.resolve_path(list path) returns object
+		Returns the object at a path given by RootClass.get_path, building
+			its Board if needed.
+		"""
+		obj = self
+		for i in range(0, len(path), 2):
+			if obj is self and path[i] == 'boards':
+				obj = self.get_board(path[i + 1])
+			elif path[i] == 'actors':
+				obj = obj.actors.by_uid[path[i + 1]]
+			else:
+				obj = getattr(obj, path[i])[path[i + 1]]
+		return obj
+
+	def open_journal(self, file_path=None):
+		"""
+		World.open_journal(str file_path) returns Journal
+		Starts recording changes into a Journal.  The journal file defaults
+			to the World's file_path with '.journal' appended, which is where
+			World.load looks for it.
+		"""
+		if file_path == None:
+			file_path = getattr(self, 'file_path', 'saved.json') + '.journal'
+		self.journal = Journal(file_path)
+		return self.journal
+
+	def open_history(self, budget=16 * 1024 * 1024):
+		"""
+		World.open_history(int budget) returns History
+		Starts recording edits into an undo History that keeps at most about
+			budget bytes of deltas.
+		"""
+		self.history = History(budget)
+		return self.history
+
+	def set_script_limits(self, budget=None, deadline=None):
+		"""
+		World.set_script_limits(int budget, float deadline) returns None
+		Sets the most instructions, and the most seconds, that the Actors'
+			scripts may take in one World.tick, leaving either as it is if
+			not given.  See Scheduler.
+		"""
+		if budget != None:
+			self.scheduler.budget = budget
+		if deadline != None:
+			self.scheduler.deadline = deadline
+
+	def save_incremental(self):
+		"""
+		World.save_incremental() returns bool
+		Appends the changes recorded since the last save to the journal file,
+			which costs time in proportion to the changes rather than to the
+			World.  Falls back to a full save if no journal is open.  Returns
+			status boolean.
+		"""
+		if self.journal == None:
+			return self.save()
+		try:
+			self.journal.flush()
+			return True
+		except IOError:
+			return False
+
+	def compact(self):
+		"""
+		World.compact() returns bool
+		Folds the journal into the base file by saving the whole World to its
+			file_path, and then empties the journal.  Returns status boolean.
+		"""
+		if not self.save():
+			return False
+		if self.journal != None:
+			self.journal.clear()
+		return True
+
+	def clear_journal(self, file_path):
+		"""
+		World.clear_journal(str file_path) returns None
+		Empties the journal that World.load replays over file_path, whose
+			changes a full save to file_path has made stale.
+		"""
+		journal_path = file_path + '.journal'
+		if self.journal != None and os.path.abspath(self.journal.file_path) == os.path.abspath(journal_path):
+			self.journal.clear()
+		elif os.path.exists(journal_path):
+			open(journal_path, 'w').close()
+
+	def save(self, file_path=None, format=None, compress=False):
+		"""
+		World.save(str file_path, str format, bool compress) returns bool
+		Saves the world to a Dust World file.  format is 'json' or 'binary';
+			if it is not given, files ending in .json are saved as JSON and
+			others as binary.  Tile planes are run-length encoded where that
+			helps.  If compress is True, a JSON file is deflated as a whole,
+			and a binary file has each plane deflated.  The journal kept for
+			file_path is emptied, since the file now holds its changes.
+			Returns status boolean.
+		"""
+		if file_path == None:
+			if hasattr(self, 'file_path'):
+				file_path = self.file_path
+			else:
+				file_path = 'saved.json'
+		if format == None:
+			format = 'json' if file_path.lower().endswith('.json') else 'binary'
+		for board in self.boards:
+			if isinstance(board, BoardStub):
+				board.detach(file_path)
+		try:
+			if format == 'json':
+				data = json.dumps(self.serialize())
+				if compress:
+					data = zlib.compress(data)
+				with open(file_path, 'wb') as f:
+					f.write(data)
+			else:
+				with open(file_path, 'wb') as f:
+					self.write_binary(f, compress)
+			self.clear_journal(file_path)
+			return True
+		except IOError:
+			return False
+
+	def write_binary(self, f, compress=False):
+		"""
+		World.write_binary(file f, bool compress) returns None
+		Writes the world to f in the binary Dust World format: a WRLD chunk
+			for the World's own properties, then one BORD chunk per Board,
+			and an index of where each Board is.  If compress is True, planes
+			are deflated.  See dustfile.
+		"""
+		planes = []
+		world_payload = dustfile.encode_chunk(self.serialize(planes, exclude=('boards',)), planes, compress)
+		dustfile.write_world(f, world_payload, (board.get_chunk(compress) for board in self.boards))
+
+	def read_board(self, file_path, i):
+		"""
+		World.read_board(str file_path, int i) returns Board
+		Builds Board i of the binary Dust World file at file_path, as a
+			child of this World, by seeking to it through the file's index.
+			The Board is not added to the World's boards.
+		"""
+		obj, planes = dustfile.decode_chunk(dustfile.read_board(file_path, i), numpy.int32)
+		return self.load_child(Board, obj, planes)
+
+	def write_board(self, i, file_path=None):
+		"""
+		World.write_board(int i, str file_path) returns None
+		Replaces Board i in the binary Dust World file at file_path (by
+			default, the file the World was loaded from) with the World's
+			Board i, leaving the rest of the file as it is.  Once the old
+			chunks left behind take more space than the Boards, the file is
+			compacted.
+		"""
+		if file_path == None:
+			file_path = self.file_path
+		index = dustfile.replace_board(file_path, i, self.get_board(i).get_chunk())
+		if index['free'] > sum(b['length'] for b in index['boards']):
+			self.compact_file(file_path)
+
+	def compact_file(self, file_path=None):
+		"""
+		World.compact_file(str file_path) returns None
+		Rewrites the binary Dust World file at file_path (by default, the
+			file the World was loaded from) without the old chunks left by
+			write_board, and points the World's BoardStubs that were read
+			from it at their new chunks.
+		"""
+		if file_path == None:
+			file_path = self.file_path
+		moves = dustfile.compact(file_path)
+		target = os.path.abspath(file_path)
+		for board in self.boards:
+			if isinstance(board, BoardStub) and board.payload == None and os.path.abspath(board.file_path) == target:
+				board.start, board.length = moves[board.start]
+
+	def save_in_background(self, file_path=None, format=None, compress=False):
+		"""
+		World.save_in_background(str file_path, str format, bool compress)
+			returns BackgroundSave or None
+		Takes a snapshot of the world and starts writing it to file_path on
+			a background thread, as World.save would.  Returns the
+			BackgroundSave, or None if one is already running.  The save is
+			finished by World.poll_autosave.
+		"""
+		if self.background_save != None:
+			return None
+		if file_path == None:
+			file_path = getattr(self, 'file_path', 'saved.json')
+		self.background_save = BackgroundSave(self, file_path, format, compress)
+		self.background_save.start()
+		return self.background_save
+
+	def start_autosave(self, interval, file_path=None, format=None, compress=False):
+		"""
+		World.start_autosave(float interval, str file_path, str format,
+			bool compress) returns None
+		Saves the world in the background every interval seconds, from
+			World.tick.  The other arguments are as for World.save.
+		"""
+		self.autosave_interval = interval
+		self.autosave_options = {'file_path': file_path, 'format': format, 'compress': compress}
+		self.last_autosave = time.time()
+
+	def stop_autosave(self):
+		"""
+		World.stop_autosave() returns None
+		Stops autosaving.  A save that is already running is still finished
+			by World.poll_autosave.
+		"""
+		self.autosave_interval = None
+
+	def poll_autosave(self, wait=False):
+		"""
+		World.poll_autosave(bool wait) returns bool or None
+		Finishes the background save if its thread is done (or, if wait is
+			True, once it is), and starts an autosave if one is due.  Returns
+			the status of the save it finished, or None.
+		"""
+		status = None
+		save = self.background_save
+		if save != None and (wait or not save.is_alive()):
+			save.join()
+			status = save.finish()
+			self.background_save = None
+		if self.autosave_interval != None and self.background_save == None and time.time() - self.last_autosave >= self.autosave_interval:
+			self.last_autosave = time.time()
+			self.save_in_background(**self.autosave_options)
+		return status
+
+
+	def clone(self, parent=None):
+		"""
+		World.clone() returns World
+		Returns a copy of the World that shares its tile planes until either
+			copy changes them, e.g. to run a "what-if" simulation.  See
+			Saveable.clone.  The copy has no journal, undo history, autosave
+			or background save of its own, and a fresh Scheduler.
+		"""
+		# board_lru holds Boards that are also in boards; keep it from being
+		# cloned separately, and point it at the cloned Boards instead.
+		board_lru, self.board_lru = self.board_lru, None
+		try:
+			new = Saveable.clone(self)
+		finally:
+			self.board_lru = board_lru
+		new.board_lru = [new.boards[self.boards.index(b)] for b in board_lru]
+		new.current_board = new.boards[self.boards.index(self.current_board)]
+		new.journal = None
+		new.history = None
+		new.background_save = None
+		new.autosave_interval = None
+		new.scheduler = Scheduler(new, self.scheduler.budget, self.scheduler.deadline)
+		new.__dict__.pop('compositor', None)
+		return new
+
+	def snapshot(self):
+		"""
+		World.snapshot() returns World
+		Returns a snapshot of the World, which World.restore can return it
+			to.  A snapshot is a World.clone that is kept aside.
+		"""
+		return self.clone()
+
+	def restore(self, snapshot):
+		"""
+		World.restore(World snapshot) returns None
+		Returns the World's Boards, Layers, Actors, counters and name to their
+			state in snapshot, closing the consoles of the ones it replaces.
+			The snapshot is cloned rather than adopted, so it can be restored
+			again.  The undo History is cleared.  A journal is not rewound;
+			compact it after restoring.
+		"""
+		if self.history != None:
+			self.history.clear()
+		self.scheduler.clear()
+		state = snapshot.clone()
+		for i in self.boards + self.layers + self.actors:
+			if not isinstance(i, BoardStub):
+				i.close()
+		for a in ('name', 'counters', 'boards', 'layers', 'actors', 'current_board', 'board_lru'):
+			setattr(self, a, getattr(state, a))
+		for i in self.boards + self.layers + self.actors:
+			if not isinstance(i, BoardStub):
+				i.parent = self
+
+
+class BackgroundSave(threading.Thread):
+	"""
+	A BackgroundSave writes a snapshot of a World to a file on its own
+		thread, so that the frame loop does not wait on serialization or
+		disk I/O.  The snapshot is taken when the BackgroundSave is created,
+		as a Snapshot of the World and of each Board that is built.  Each
+		Board keeps its Snapshot until it is touched (see RootClass.touch),
+		so only the Boards changed since the last save are walked again.
+		The World's tile planes are shared with the snapshot rather than
+		copied, and made read-only, so that Layers and Sprites copy a plane
+		before they next change it (see Layer.unshare and Sprite.unshare).
+		The World's journal is split (see Journal.split), and the thread
+		appends the changes queued before the snapshot to the journal file,
+		serializes the snapshot, and writes it next to its destination.
+		finish, which must be called from the main thread once the thread
+		is done, moves the file into place and the journal's second file
+		over the first.
+	Methods:
+		BackgroundSave.serialize() returns None
+		BackgroundSave.run() returns None
+		BackgroundSave.write(file f) returns None
+		BackgroundSave.get_board_payload(tuple board) returns str
+		BackgroundSave.finish() returns bool
+	"""
+	def __init__(self, world, file_path, format=None, compress=False):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		if format == None:
+			format = 'json' if file_path.lower().endswith('.json') else 'binary'
+		self.world, self.file_path, self.format, self.compress = world, file_path, format, compress
+		self.temp_path = file_path + '.tmp'
+		self.status = None
+		self.error = None
+		self.locations = []
+		self.payloads = {}
+		self.journal = world.journal
+		if self.journal != None and os.path.abspath(self.journal.file_path) != os.path.abspath(file_path + '.journal'):
+			self.journal = None
+		self.entries = self.journal.split() if self.journal != None else []
+		self.state = world.get_snapshot(exclude=('boards',))
+		self.obj = None
+		self.planes = []
+		self.boards = []
+		for board in world.boards:
+			if isinstance(board, BoardStub):
+				self.boards.append((board, board.payload, board.file_path, board.start, board.length))
+			else:
+				if board.snapshot == None:
+					board.snapshot = board.get_snapshot()
+				self.boards.append(board.snapshot)
+
+	def serialize(self):
+		"""
+		BackgroundSave.serialize() returns None
+		Serializes the snapshot of the World, and turns each Board's Snapshot
+			into its serialized object and planes.  Called by run.
+		"""
+		self.obj = self.state.serialize(self.planes, exclude=('boards',))
+		for i, board in enumerate(self.boards):
+			if isinstance(board, Snapshot):
+				planes = []
+				self.boards[i] = (board.serialize(planes), planes)
+
+	def run(self):
+		"""
+		BackgroundSave.run() returns None
+		Appends the journaled changes the snapshot holds to the journal file,
+			serializes the snapshot and writes it to the temporary file.
+			Sets status to True when it has been written, or to False,
+			keeping the error, if anything goes wrong.
+		"""
+		try:
+			if self.entries:
+				self.journal.append(self.entries)
+				self.entries = []
+			self.serialize()
+			with open(self.temp_path, 'wb') as f:
+				self.write(f)
+			self.status = True
+		except Exception as e:
+			self.error = e
+			self.status = False
+
+	def write(self, f):
+		"""
+		BackgroundSave.write(file f) returns None
+		Writes the snapshot to f in the BackgroundSave's format, noting where
+			each BORD chunk's payload is in a binary file.  The chunks of
+			BoardStubs read from the file being replaced are kept, deflated,
+			for finish to hand back to them when the file is JSON.
+		"""
+		if self.format == 'json':
+			target = os.path.abspath(self.file_path)
+			obj = dustfile.resolve_planes(self.obj, self.planes)
+			obj['boards'] = []
+			for i, board in enumerate(self.boards):
+				if len(board) == 2:
+					board_obj, source = board
+				else:
+					payload = self.get_board_payload(board)
+					if board[1] == None and os.path.abspath(board[2]) == target:
+						self.payloads[i] = zlib.compress(payload, 1)
+					board_obj, source = dustfile.decode_chunk(payload)
+				obj['boards'].append(dustfile.resolve_planes(board_obj, source))
+			data = json.dumps(obj)
+			if self.compress:
+				data = zlib.compress(data)
+			f.write(data)
+			return
+		planes = []
+		obj = dustfile.resolve_planes(self.obj, self.planes, planes)
+		index = dustfile.write_world(f, dustfile.encode_chunk(obj, planes, self.compress), (self.get_board_payload(board) for board in self.boards))
+		self.locations = [(entry['start'], entry['length']) for entry in index['boards']]
+
+	def get_board_payload(self, board):
+		"""
+		BackgroundSave.get_board_payload(tuple board) returns str
+		Returns a Board of the snapshot as a BORD chunk payload.
+		"""
+		if len(board) == 2:
+			return dustfile.encode_chunk(board[0], board[1], self.compress)
+		elif board[1] != None:
+			return zlib.decompress(board[1])
+		return dustfile.read_payload(*board[2:])
+
+	def finish(self):
+		"""
+		BackgroundSave.finish() returns bool
+		Moves the written file into place, points any of the World's
+			BoardStubs that were read from it at their new chunks, and
+			replaces the journal with the changes made since the snapshot.
+			Returns status boolean.
+		"""
+		if not self.status:
+			if os.path.exists(self.temp_path):
+				os.remove(self.temp_path)
+			if self.journal != None:
+				self.journal.join(False, self.entries)
+			return False
+		target = os.path.abspath(self.file_path)
+		for i, board in enumerate(self.boards):
+			stub = board[0]
+			if len(board) == 2 or stub.payload != None or os.path.abspath(stub.file_path) != target:
+				continue
+			if self.format == 'json':
+				stub.payload, stub.file_path = self.payloads[i], None
+			else:
+				stub.start, stub.length = self.locations[i]
+		if os.name == 'nt' and os.path.exists(self.file_path):
+			os.remove(self.file_path)
+		os.rename(self.temp_path, self.file_path)
+		if self.journal != None:
+			self.journal.join(True)
+		elif os.path.exists(self.file_path + '.journal'):
+			open(self.file_path + '.journal', 'w').close()
+		return True
+
+
+class Scheduler(object):
+	"""
+	A Scheduler runs the Dramatic scripts of a World's Actors cooperatively.
+		Each tick, the Actors take turns in World.iter_actors order, each
+		running at most its instruction_limit, until every Actor has had a
+		turn, or the tick's instruction budget or time deadline is spent.  The
+		Actors that have not had their turn go first on the next tick, and a
+		script stopped part way through its turn carries on from the same
+		place, so a runaway script slows its own Actor down rather than the
+		frame.  An Actor found not to be awake after its turn (see
+		Actor.is_awake) is put to sleep: it is left out of later rounds,
+		at the cost of one dict lookup, until an event or a jump wakes it or
+		its program changes.  The deadline defaults to frame_share of a
+		frame at the fps of the World's Console, so that scripts leave the
+		rest of the frame to drawing; see World.set_script_limits.
+	Methods:
+		Scheduler.tick() returns int
+		Scheduler.clear() returns None
+		Scheduler.forget(list actors) returns None
+		Scheduler.wake(Actor actor) returns None
+		Scheduler.prune() returns None
+	"""
+	# Actors run, or instructions run, between checks of the deadline.
+	check_interval = 64
+	check_instructions = 4096
+	# Share of a frame that scripts may take by default.
+	frame_share = 0.5
+
+	def __init__(self, world, budget=200000, deadline=None):
+		self.world = world
+		self.budget = budget
+		if deadline == None:
+			fps = getattr(getattr(world, 'main_display', None), 'fps', 0)
+			if fps > 0:
+				deadline = self.frame_share / fps
+		self.deadline = deadline
+		self.queue = deque()
+		self.sleeping = {}
+		self.instructions = 0
+		self.turns = 0
+
+	def tick(self):
+		"""
+		Scheduler.tick() returns int
+		Gives Actors their turns until all have had one since the last
+		round began, or budget instructions have run, or deadline seconds
+		have passed, and returns the number of instructions run.  A new
+		round begins on a tick that starts with no Actors waiting.
+		"""
+		queue = self.queue
+		sleeping = self.sleeping
+		if not queue:
+			total = 0
+			for actors in self.world.iter_actor_lists():
+				total += len(actors)
+				queue.extend([i for i in actors if sleeping.get(i) is not i.program])
+			if len(sleeping) > total:
+				self.prune()
+		left = self.budget
+		stop = None
+		if self.deadline != None:
+			stop = time.time() + self.deadline
+		turns = 0
+		checked = left
+		while queue and left > 0:
+			actor = queue.popleft()
+			limit = min(actor.instruction_limit, left)
+			left -= actor.tick(limit)
+			turns += 1
+			if not actor.is_awake():
+				sleeping[actor] = actor.program
+			if limit < actor.instruction_limit and actor.process != None and actor.process.preempted:
+				# Cut short by the budget; finish the turn next tick.
+				queue.appendleft(actor)
+				break
+			if stop != None and (turns % self.check_interval == 0 or checked - left >= self.check_instructions):
+				checked = left
+				if time.time() > stop:
+					break
+		self.instructions = self.budget - left
+		self.turns = turns
+		return self.instructions
+
+	def clear(self):
+		"""
+		Scheduler.clear() returns None
+		Drops the Actors waiting for their turn, so that the next tick
+		begins a new round, and forgets which Actors are asleep.
+		"""
+		self.queue.clear()
+		self.sleeping.clear()
+
+	def forget(self, actors):
+		"""
+		Scheduler.forget(list actors) returns None
+		Drops actors from the Actors waiting for their turn and from those
+		asleep, as when their Board is evicted, leaving the others as they
+		are.
+		"""
+		actors = set(actors)
+		kept = [i for i in self.queue if i not in actors]
+		self.queue.clear()
+		self.queue.extend(kept)
+		for i in actors:
+			self.sleeping.pop(i, None)
+
+	def wake(self, actor):
+		"""
+		Scheduler.wake(Actor actor) returns None
+		Gives a sleeping Actor turns again from the next round.  Called by
+		Actor.wake when an event or a jump wakes its script.
+		"""
+		self.sleeping.pop(actor, None)
+
+	def prune(self):
+		"""
+		Scheduler.prune() returns None
+		Forgets sleeping Actors that are no longer in the World, such as
+		those that died.
+		"""
+		live = set(self.world.iter_actors())
+		for i in [i for i in self.sleeping if i not in live]:
+			del self.sleeping[i]
+
+
+class History(object):
+	"""
+	A History is a World's undo and redo stack.  Layers and Sprites record
+		each edit to a gamemap or tilemap into it as a delta before making
+		it: per-cell edits (Layer.set_game_tile, Layer.set_game_tile_param,
+		Sprite.put_tile) as the cell's tile ref and its old and new rows,
+		and whole-plane edits (Layer.fill, Sprite.fill_sprite) as the old
+		plane, which is kept read-only rather than copied (see
+		Layer.unshare), and the fill arguments.  Edits made between begin and
+		end, or inside a with block on action, are one undo step; others are
+		a step each.  Edits made inside a with block on paused, such as
+		those of Actors' scripts in World.tick, are not recorded.  When
+		finished, a step's cell deltas are packed into
+		arrays, and the oldest steps are dropped to keep the History within
+		its budget of bytes.
+	Methods:
+		History.begin() returns None
+		History.end() returns None
+		History.action() returns context manager
+		History.paused() returns context manager
+		History.record(object obj, str plane, int ref, tuple new) returns None
+		History.pack(list deltas) returns list
+		History.undo() returns bool
+		History.redo() returns bool
+		History.forget(Board board) returns None
+		History.is_on(object obj, Board board) returns bool
+		History.clear() returns None
+		History.get_step_size(list step) returns int
+		History.get_memory_size() returns int
+	"""
+	fill_methods = {'gamemap': 'fill', 'tilemap': 'fill_sprite'}
+
+	def __init__(self, budget=16 * 1024 * 1024):
+		self.budget = budget
+		self.undo_stack = []
+		self.redo_stack = []
+		self.size = 0
+		self.pending = None
+		self.depth = 0
+		self.applying = False
+		self.pause_depth = 0
+
+	def begin(self):
+		"""
+		History.begin() returns None
+		Starts an undo step.  Steps may be nested; only the outermost counts.
+		"""
+		if self.depth == 0:
+			self.pending = []
+		self.depth += 1
+
+	def end(self):
+		"""
+		History.end() returns None
+		Finishes the undo step started by the matching begin.
+		"""
+		self.depth -= 1
+		if self.depth > 0:
+			return
+		step, self.pending = self.pack(self.pending), None
+		if not step:
+			return
+		self.size -= sum(self.get_step_size(i) for i in self.redo_stack)
+		self.redo_stack = []
+		self.undo_stack.append(step)
+		self.size += self.get_step_size(step)
+		while len(self.undo_stack) > 0 and self.size > self.budget:
+			self.size -= self.get_step_size(self.undo_stack.pop(0))
+
+	@contextmanager
+	def action(self):
+		"""
+		History.action() returns context manager
+		Makes the edits made inside a with block one undo step:
+			with world.history.action():
+				console.line_iter(layer, 'set_game_tile', ...)
+		"""
+		self.begin()
+		try:
+			yield self
+		finally:
+			self.end()
+
+	@contextmanager
+	def paused(self):
+		"""
+		History.paused() returns context manager
+		Leaves the edits made inside a with block out of the History:
+			with world.history.paused():
+				world.scheduler.tick()
+		"""
+		self.pause_depth += 1
+		try:
+			yield self
+		finally:
+			self.pause_depth -= 1
+
+	def record(self, obj, plane, ref, new):
+		"""
+		History.record(object obj, str plane, int ref, tuple new) returns None
+		Records that the row at tile ref of obj's plane ('gamemap' or
+			'tilemap') is about to be set to new, or, if ref is None, that the
+			whole plane is about to be filled by calling obj's fill method
+			with the arguments new.  Edits made by undo and redo, or while
+			paused, are not recorded.
+		"""
+		if self.applying or self.pause_depth:
+			return
+		if self.pending == None:
+			self.begin()
+			self.record(obj, plane, ref, new)
+			self.end()
+			return
+		values = getattr(obj, plane)
+		if ref == None:
+			values.flags.writeable = False
+			self.pending.append([obj, plane, None, values, new])
+			return
+		if not self.pending or self.pending[-1][0] is not obj or self.pending[-1][1] != plane or self.pending[-1][2] == None:
+			self.pending.append([obj, plane, [], [], []])
+		delta = self.pending[-1]
+		delta[2].append(ref)
+		delta[3].append(values[ref].tolist())
+		delta[4].append(new)
+
+	def pack(self, deltas):
+		"""
+		History.pack(list deltas) returns list
+		Turns the cell deltas of a finished step into int32 arrays.
+		"""
+		for delta in deltas:
+			if delta[2] != None:
+				delta[2] = numpy.array(delta[2], dtype=numpy.int32)
+				delta[3] = numpy.array(delta[3], dtype=numpy.int32)
+				delta[4] = numpy.array(delta[4], dtype=numpy.int32)
+		return deltas
+
+	def undo(self):
+		"""
+		History.undo() returns bool
+		Reverts the last undo step.  Returns False if there is none.
+		"""
+		if not self.undo_stack:
+			return False
+		step = self.undo_stack.pop()
+		self.applying = True
+		try:
+			for obj, plane, refs, old, new in reversed(step):
+				if refs is None:
+					setattr(obj, plane, old)
+					if plane == 'gamemap' and obj.get_journal() != None:
+						obj.record_change('gamemap', dustfile.encode_json_plane(old))
+				else:
+					refs, first = numpy.unique(refs, return_index=True)
+					obj.write_cells(refs, old[first])
+		finally:
+			self.applying = False
+		self.redo_stack.append(step)
+		return True
+
+	def redo(self):
+		"""
+		History.redo() returns bool
+		Makes the last undone step again.  Returns False if there is none.
+		"""
+		if not self.redo_stack:
+			return False
+		step = self.redo_stack.pop()
+		self.applying = True
+		try:
+			for delta in step:
+				obj, plane, refs, old, new = delta
+				if refs is None:
+					self.size -= delta[3].nbytes
+					delta[3] = getattr(obj, plane)
+					delta[3].flags.writeable = False
+					self.size += delta[3].nbytes
+					getattr(obj, self.fill_methods[plane])(*new)
+				else:
+					refs, last = numpy.unique(refs[::-1], return_index=True)
+					obj.write_cells(refs, new[::-1][last])
+		finally:
+			self.applying = False
+		self.undo_stack.append(step)
+		return True
+
+	def forget(self, board):
+		"""
+		History.forget(Board board) returns None
+		Drops the deltas of objects on board, e.g. because it was evicted.
+		"""
+		for stack in (self.undo_stack, self.redo_stack):
+			for i in range(len(stack)):
+				self.size -= self.get_step_size(stack[i])
+				stack[i] = [d for d in stack[i] if not self.is_on(d[0], board)]
+				self.size += self.get_step_size(stack[i])
+			stack[:] = [step for step in stack if step]
+
+	def is_on(self, obj, board):
+		"""
+		History.is_on(object obj, Board board) returns bool
+		Returns True if obj is board or belongs to it.
+		"""
+		while obj is not board and hasattr(obj, 'parent'):
+			obj = obj.parent
+		return obj is board
+
+	def clear(self):
+		"""
+		History.clear() returns None
+		Drops every undo and redo step.
+		"""
+		self.undo_stack = []
+		self.redo_stack = []
+		self.size = 0
+
+	def get_step_size(self, step):
+		"""
+		History.get_step_size(list step) returns int
+		Returns the number of bytes held by the deltas of one finished step.
+		"""
+		size = 0
+		for delta in step:
+			size += delta[3].nbytes
+			if delta[2] is not None:
+				size += delta[2].nbytes + delta[4].nbytes
+		return size
+
+	def get_memory_size(self):
+		"""
+		History.get_memory_size() returns int
+		Returns the number of bytes held by the History's deltas, which is
+		kept as a running total as steps are added, dropped, undone and
+		redone.
+		"""
+		return self.size
+
+
+class Journal(object):
+	"""
+	A Journal is an append-only log of changes made to a World since it was
+		last saved in full.  Changes are recorded as they happen by
+		RootClass.record_change, appended to the journal file by flush, and
+		replayed on top of the base file when the World is loaded.  Each line
+		of the file is a JSON list [op, path, args...], with these ops:
+			tile     Layer.set_game_tile     x, y, id, color, param
+			param    Layer.set_game_tile_param  x, y, param
+			fill     Layer.fill              id, color, param
+			cells    Layer.write_cells       refs, rows
+			gamemap  Layer.gamemap           gamemap (as saved in JSON)
+			move     Actor.move_to           x, y
+			counter  RootClass.set_counter   name, value
+			add      ActorList (insert)      index, Actor (as saved in JSON)
+			remove   ActorList (remove)      uid
+			actors   ActorList (replace)     list of Actors (as saved in JSON)
+		While a BackgroundSave runs, the journal is split: the changes its
+		snapshot holds go to the journal file from its thread, and later
+		ones to a second file, which World.load replays after the first.
+	Methods:
+		Journal.record(str op, list path, ...) returns None
+		Journal.flush() returns None
+		Journal.append(list entries) returns None
+		Journal.split() returns list
+		Journal.join(bool saved, list entries) returns None
+		Journal.replay(World world) returns int
+		Journal.apply(World world, list entry) returns None
+		Journal.clear() returns None
+	"""
+	def __init__(self, file_path):
+		self.file_path = file_path
+		self.next_path = None
+		self.entries = []
+
+	def record(self, op, path, *args):
+		"""
+		Journal.record(str op, list path, ...) returns None
+		Queues a change until the next flush.
+		"""
+		self.entries.append([op, path] + list(args))
+
+	def flush(self):
+		"""
+		Journal.flush() returns None
+		Appends the queued changes to the journal file, or to the second
+			file while the journal is split.
+		"""
+		if not self.entries:
+			return
+		with open(self.next_path or self.file_path, 'a') as f:
+			f.write(''.join(json.dumps(e) + '\n' for e in self.entries))
+		self.entries = []
+
+	def append(self, entries):
+		"""
+		Journal.append(list entries) returns None
+		Appends entries taken by split to the journal file.  Only the
+			BackgroundSave's thread writes to the journal file while the
+			journal is split.
+		"""
+		with open(self.file_path, 'a') as f:
+			f.write(''.join(json.dumps(e) + '\n' for e in entries))
+
+	def split(self):
+		"""
+		Journal.split() returns list
+		Takes the queued changes, for a BackgroundSave to append from its
+			thread, and has flush write later ones to a second file next to
+			the journal file until join is called.
+		"""
+		entries, self.entries = self.entries, []
+		self.next_path = self.file_path + '.next'
+		return entries
+
+	def join(self, saved, entries=()):
+		"""
+		Journal.join(bool saved, list entries) returns None
+		Ends a split.  If saved, the journal file's changes are in the file
+			it is kept for, so the second file replaces it.  If not, entries
+			(the changes taken by split that were not appended) and then the
+			second file are appended to it.
+		"""
+		next_path, self.next_path = self.next_path, None
+		if saved and os.path.exists(next_path):
+			if os.name == 'nt' and os.path.exists(self.file_path):
+				os.remove(self.file_path)
+			os.rename(next_path, self.file_path)
+		elif saved:
+			open(self.file_path, 'w').close()
+		else:
+			with open(self.file_path, 'a') as f:
+				f.write(''.join(json.dumps(e) + '\n' for e in entries))
+				if os.path.exists(next_path):
+					with open(next_path) as g:
+						f.write(g.read())
+			if os.path.exists(next_path):
+				os.remove(next_path)
+
+	def replay(self, world):
+		"""
+		Journal.replay(World world) returns int
+		Applies every change in the journal file to world, without recording
+			them again, and returns how many were applied.  A line cut short
+			by a crash at the end of the file is ignored, and a change whose
+			object cannot be found is skipped with a warning.
+		"""
+		journal, world.journal = world.journal, None
+		count = skipped = 0
+		try:
+			with open(self.file_path) as f:
+				for line in f:
+					try:
+						entry = json.loads(line)
+					except ValueError:
+						break
+					try:
+						self.apply(world, entry)
+						count += 1
+					except (LookupError, TypeError, ValueError, AttributeError):
+						skipped += 1
+		finally:
+			world.journal = journal
+		if skipped:
+			print "Skipped", skipped, "journal entries that could not be applied from", self.file_path
+		return count
+
+	def apply(self, world, entry):
+		"""
+		Journal.apply(World world, list entry) returns None
+		Applies one change read from the journal file to world.
+		"""
+		op, obj, args = entry[0], world.resolve_path(entry[1]), entry[2:]
+		if op == 'tile':
+			obj.set_game_tile(*args)
+		elif op == 'param':
+			obj.set_game_tile_param(*args)
+		elif op == 'fill':
+			obj.fill(*args)
+		elif op == 'cells':
+			obj.write_cells(numpy.array(args[0], dtype=numpy.int32), numpy.array(args[1], dtype=numpy.int32))
+		elif op == 'gamemap':
+			obj.gamemap = decode_plane(args[0])
+		elif op == 'move':
+			obj.move_to(*args)
+		elif op == 'counter':
+			obj.set_counter(*args)
+		elif op == 'add':
+			obj.actors.insert(args[0], obj.load_child(Actor, args[1]))
+		elif op == 'remove':
+			obj.actors.remove(obj.actors.by_uid[args[0]])
+		elif op == 'actors':
+			obj.actors = [obj.load_child(Actor, b) for b in args[0]]
+
+	def clear(self):
+		"""
+		Journal.clear() returns None
+		Empties the journal file, and the second file if the journal is
+			split, and drops any queued changes.
+		"""
+		for path in (self.file_path, self.next_path):
+			if path != None:
+				open(path, 'w').close()
+		self.entries = []
+
+
+class BoardStub(object):
+	"""
+	A BoardStub stands in for a Board that is not built, in the boards of a
+		lazily loaded World or after the Board has been evicted.  It holds
+		either the location of the Board's chunk in a binary World file or
+		the chunk itself, deflated.  BoardStubs are not ticked.
+	Methods:
+		BoardStub.get_chunk() returns str
+		BoardStub.detach(str file_path) returns None
+		BoardStub.materialize(World world) returns Board
+		BoardStub.serialize(list planes) returns dict
+		BoardStub.get_memory_size() returns int
+		BoardStub.clone(World parent) returns BoardStub
+		BoardStub.tick() returns None
+	"""
+	def __init__(self, file_path=None, start=0, length=0, payload=None):
+		self.file_path, self.start, self.length = file_path, start, length
+		self.payload = payload
+
+	def get_chunk(self, compress=False):
+		"""
+		BoardStub.get_chunk() returns str
+		Returns the Board's binary chunk payload, as it was stored.
+		"""
+		if self.payload != None:
+			return zlib.decompress(self.payload)
+		return dustfile.read_payload(self.file_path, self.start, self.length)
 
-		if not file_path:
-			wo = self.create_default_world()
-		else:
-			if file_path == True:
-				file_path = "saved.json"
-			self.file_path = file_path
-			with open(file_path) as fp:
-				j = json.load(fp)
-			wo = World()
-			wo.load_from_dict(j)
-			return wo
-			self.current_board = self.boards[0]
-			
-	def create_default_world(self):
+	def detach(self, file_path=None):
 		"""
-		World.create_default_world()
-		Creates a default board with no parameters, and adds a blank Layer.
+		BoardStub.detach(str file_path) returns None
+		If the stub refers to file_path (or, if not given, to any file), reads
+			its chunk into memory so that the file can be overwritten.
 		"""
-		self.current_board = Board(self)
-		self.boards.append(self.current_board)
-		my_layer = Layer(self, *(getattr(self.current_board, x) for x in ('w','h','x','y')))
-		self.current_board.layers.append(my_layer)
-		
-	def get_footprint(self):
-		return {'name': False, 'counters': False, 'actors': Actor, 'layers': Layer, 'boards': Board}
-	get_footprint.__doc__ = Saveable.get_footprint.__doc__ # Inherit docstring.
-		
-	def tick(self):
+		if self.payload == None and (file_path == None or os.path.abspath(file_path) == os.path.abspath(self.file_path)):
+			self.payload = zlib.compress(self.get_chunk(), 1)
+			self.file_path = None
+
+	def materialize(self, world):
 		"""
-		World.tick()
-		Ticks the World's Actors, Layers, and Boards.
+		BoardStub.materialize(World world) returns Board
+		Builds the Board from its chunk, as a child of world.
 		"""
-		for i in self.actors:
-			i.tick()
-		for i in self.layers:
-			i.tick()
-		for i in self.boards:
-			i.tick()
-			
-	def blit(self, dest_graphics):
+		obj, planes = dustfile.decode_chunk(self.get_chunk(), numpy.int32)
+		return world.load_child(Board, obj, planes)
+
+	def serialize(self, planes=None, exclude=()):
 		"""
-		World.blit(Graphics dest_graphics, ...)
-		Blits the World's Boards and Layers to dest_graphics and passes other
-			arguments through.
+		BoardStub.serialize(list planes) returns dict
+		Serializes the Board without building it.  See Saveable.serialize.
 		"""
-		dest_graphics.clear()
-		for i in self.layers[::-1]:
-			i.blit(dest_graphics)
-		self.current_board.blit(dest_graphics)
-		
-	def save(self, file_path=None):
+		obj, source = dustfile.decode_chunk(self.get_chunk())
+		for a in exclude:
+			del obj[a]
+		return dustfile.resolve_planes(obj, source, planes)
+
+	def get_memory_size(self):
 		"""
-		World.save(str file_path) returns bool
-		Saves the world to a JSON Dust World file.  Returns status boolean.
+		BoardStub.get_memory_size() returns int
+		Returns the number of bytes held by the stub.
 		"""
-		if file_path == None:
-			if hasattr(self, 'file_path'):
-				file_path = self.file_path
-			else:
-				file_path = 'saved.json'
-		try:
-			with open(file_path, 'w') as f:
-				json.dump(self.serialize(), f)
-			return True
-		except IOError:
-			return False
+		if self.payload == None:
+			return 0
+		return len(self.payload)
+
+	def clone(self, parent=None):
+		"""
+		BoardStub.clone(World parent) returns BoardStub
+		Returns a stub for the same Board.
+		"""
+		return BoardStub(self.file_path, self.start, self.length, self.payload)
+
+	def tick(self):
+		pass
 
 
 class Board(Saveable, Material):
@@ -317,9 +2131,12 @@ class Board(Saveable, Material):
 	A Dust Board has a width and height and contains board counters and layers.
 	Methods:
 		Board.get_footprint() returns dict
+		Board.get_actors() returns ActorList
+		Board.set_actors(list actors) returns None
 		Board.tick()
 		Board.blit(Graphics dest_graphics, ...)
 		Board.get_sprite() returns Sprite
+		Board.get_chunk(bool compress) returns str
 	"""
 	def __init__(self, parent, w=80, h=25, x=0, y=0, name="New Board"):
 		self.parent = parent
@@ -329,10 +2146,27 @@ class Board(Saveable, Material):
 		self.counters = {}
 		self.layers = []
 		self.actors = []
+		self.snapshot = None
+		self.closed = False
 		
 	def get_footprint(self):
 		return {'w': False, 'h': False, 'x': False, 'y': False, 'name': False, 'counters': False, 'actors': Actor, 'layers': Layer}
 	get_footprint.__doc__ = Saveable.get_footprint.__doc__ # Inherit docstring.
+
+	def get_actors(self):
+		"""
+		Board.get_actors() returns ActorList
+		Returns the Board's Actors.
+		"""
+		return self._actors
+
+	def set_actors(self, actors):
+		"""
+		Board.set_actors(list actors) returns None
+		Replaces the Board's Actors.
+		"""
+		self._actors = ActorList(self, actors)
+	actors = property(get_actors, set_actors)
 	
 	def get_sprite(self):
 		"""
@@ -359,22 +2193,58 @@ class Board(Saveable, Material):
 		for i in self.layers[::-1]:
 			i.blit(dest_graphics)
 
+	def get_chunk(self, compress=False):
+		"""
+		Board.get_chunk(bool compress) returns str
+		Returns the Board serialized as a binary BORD chunk payload, with its
+		planes deflated if compress is True.
+		"""
+		planes = []
+		return dustfile.encode_chunk(self.serialize(planes), planes, compress)
+
 
 class Layer(Saveable, Material):
 	"""
 	A Dust Layer has a width and height, relative position, sprite, Actors.
 	Methods:
 		Layer.get_footprint() returns dict
+		Layer.unshare() returns numpy.ndarray
+		Layer.update_solid() returns None
+		Layer.is_solid(int x, int y) returns bool
+		Layer.get_actors() returns ActorList
+		Layer.set_actors(list actors) returns None
+		Layer.adopt_actors(dict columns, list planes) returns None
 		Layer.tick() returns None
+		Layer.reindex() returns None
+		Layer.index_actor(Actor actor) returns None
+		Layer.unindex_actor(Actor actor) returns None
+		Layer.update_actor(Actor actor) returns None
+		Layer.actors_at(int x, int y) returns list
+		Layer.actors_in(int x1, int y1, int x2, int y2) returns list
+		Layer.get_neighbours(Actor actor, int distance) returns list
+		Layer.is_blocked(int x, int y, Actor actor) returns bool
+		Layer.listen(Actor actor) returns None
+		Layer.unlisten(Actor actor) returns None
+		Layer.get_listeners(str event, list cells) returns list
+		Layer.fire(str event, int x1, int y1, int x2, int y2, Actor source)
+			returns int
+		Layer.fire_adjacent(Actor actor, int old_x, int old_y) returns int
+		Layer.clone(Saveable parent) returns Layer
 		Layer.blit(Graphics dest_graphics, ...)
-		Layer.flip(Sprite dest_graphics)
+		Layer.get_actor_batches() returns list
+		Layer.blit_glyphs(Graphics dest_graphics, ...)
+		Layer.flip(Sprite dest_graphics, bool incremental)
 		Layer.render_game_tile(int id, int color, int param)
 			returns tuple (int, int)
 		Layer.draw_game_tile(int x, int y, int id, int color, int param)
 		Layer.set_game_tile(int x, int y, int id, int color, int param)
 		Layer.set_game_tile_param(int x, int y, int param)
 		Layer.fill(int id, int color, int param)
+		Layer.write_cells(numpy.ndarray refs, numpy.ndarray rows) returns None
 	"""
+	# Events that Actors register for by tile; see Layer.listen.
+	spatial_events = ('touched', 'adjacent')
+
 	def __init__(self, parent, w=80, h=25, x=0, y=0, name="New Layer"):
 		self.parent = parent
 		self.find_main_display()
@@ -382,21 +2252,344 @@ class Layer(Saveable, Material):
 		self.name = name
 		self.sprite = [Sprite(self, w, h, x, y)]
 		self.actors = []
-		self.gamemap = [(1, 0, 7)] * (self.w * self.h)
-		self.dirty = True
+		self.gamemap = blank_plane((1, 0, 7), self.w * self.h)
+		self.listeners = {}
 		
 	def get_footprint(self):
-		return {'w': False, 'h': False, 'x': False, 'y': False, 'name': False, 'gamemap': False, 'actors': Actor}
+		return {'w': False, 'h': False, 'x': False, 'y': False, 'name': False, 'gamemap': numpy.ndarray, 'actors': Actor}
 	get_footprint.__doc__ = Saveable.get_footprint.__doc__ # Inherit docstring.
 
+	def get_gamemap(self):
+		"""
+		Layer.get_gamemap() returns numpy.ndarray
+		Returns the Layer's gamemap as a (w*h, 3) array of int32, where the
+		columns are the id, color and param of each game tile.
+		"""
+		return self._gamemap
+
+	def set_gamemap(self, gamemap):
+		"""
+		Layer.set_gamemap(list gamemap) returns None
+		Replaces the Layer's gamemap.  Accepts a list of (id, color, param)
+		triplets, as found in a Dust World file, or an array of the same shape.
+		A read-only int32 array, as loaded from a binary World file, is
+		shared rather than copied until the Layer changes it.
+		"""
+		if is_shared_plane(gamemap):
+			self._gamemap = gamemap.reshape(-1, 3)
+		else:
+			self._gamemap = numpy.array(gamemap, dtype=numpy.int32).reshape(-1, 3)
+		self.dirty = True
+		self.dirty_tiles = []
+		self.update_solid()
+		self.touch()
+	gamemap = property(get_gamemap, set_gamemap)
+
+	def update_solid(self):
+		"""
+		Layer.update_solid() returns None
+		Rebuilds the Layer's solidity bitmap from its gamemap ids.  The bitmap
+		is a bytearray with a bit per tile, set where the tilesaurus says the
+		tile's type is solid (see Tilesaurus.pack_solid), so Layer.is_solid
+		is an index and a mask.  Layer.set_game_tile, Layer.fill and
+		Layer.write_cells keep it up to date.
+		"""
+		global tilesaurus
+		self.solid = tilesaurus.pack_solid(self._gamemap[:, 0])
+
+	def is_solid(self, x, y):
+		"""
+		Layer.is_solid(int x, int y) returns bool
+		Returns True if the game tile at (x, y) blocks movement.
+		"""
+		ref = (y * self.w) + x
+		return bool(self.solid[ref >> 3] & (128 >> (ref & 7)))
+
+	def unshare(self):
+		"""
+		Layer.unshare() returns numpy.ndarray
+		Returns the Layer's gamemap for writing.  A gamemap shared with a
+		BackgroundSave is read-only, so it is copied first.
+		"""
+		self.touch()
+		if not self._gamemap.flags.writeable:
+			self._gamemap = self._gamemap.copy()
+		return self._gamemap
+
+	def get_actors(self):
+		"""
+		Layer.get_actors() returns ActorList
+		Returns the Layer's Actors, bottom first.  The list can be changed
+		like any other list, and keeps the Layer's spatial index up to date.
+		"""
+		return self._actors
+
+	def set_actors(self, actors):
+		"""
+		Layer.set_actors(list actors) returns None
+		Replaces the Layer's Actors, rebuilds its spatial index and drops
+		the event registrations of the Actors it no longer has.
+		"""
+		old = self.__dict__.get('_actors', ())
+		self._actors = ActorList(self, actors)
+		self.reindex()
+		kept = set(self._actors)
+		for i in old:
+			if i not in kept:
+				self.unlisten(i)
+	actors = property(get_actors, set_actors)
+
+	def adopt_actors(self, columns, planes):
+		"""
+		Layer.adopt_actors(dict columns, list planes) returns None
+		Replaces the Layer's Actors with single-tile Actors built from
+		columns packed by pack_actors, whose tilemaps are in planes.  Each
+		Actor and its Sprite start as copies of a blank pair, rather than
+		being constructed and loaded one by one.
+		"""
+		blank = Actor(self, 1, 1)
+		actor_state, sprite_state = blank.__dict__, blank.sprite[0].__dict__
+		actors = []
+		for (x, y, heading, uid, sprite_x, sprite_y, tilemask, plane), name, program, counters in zip(columns['ints'].tolist(), columns['names'], columns['programs'], columns['counters']):
+			actor = object.__new__(Actor)
+			sprite = object.__new__(Sprite)
+			sprite.__dict__ = dict(sprite_state, parent=actor, x=sprite_x, y=sprite_y, tilemask=tilemask, _tilemap=planes[plane].reshape(-1, 2))
+			actor.__dict__ = dict(actor_state, x=x, y=y, heading=heading, uid=None if uid < 0 else uid, _name=name, program=program, counters=counters, sprite=[sprite], listening=[])
+			actors.append(actor)
+		self.actors = actors
 		
 	def tick(self):
 		"""
 		Layer.tick() returns None
-		Ticks the Layer's Actors.
+		Ticks the Layer's Actors.  Actors created or removed by scripts
+		during the tick are ticked from the next one.
 		"""
-		for i in self.actors:
+		for i in self.actors[:]:
 			i.tick()
+
+	def reindex(self):
+		"""
+		Layer.reindex() returns None
+		Rebuilds the Layer's spatial index, a dict from each (x, y) tile to
+		the Actors covering it (see Material.get_bounds), which answers
+		Layer.actors_at, Layer.actors_in and Layer.is_blocked without going
+		through every Actor.
+		"""
+		self.cells = {}
+		self.actor_bounds = {}
+		for i in self._actors:
+			self.index_actor(i)
+
+	def index_actor(self, actor):
+		"""
+		Layer.index_actor(Actor actor) returns None
+		Adds actor to the spatial index at its current bounds.  Called by
+		ActorList when an Actor is added.
+		"""
+		x1, y1, x2, y2 = bounds = actor.get_bounds()
+		self.actor_bounds[actor] = bounds
+		cells = self.cells
+		for y in range(y1, y2):
+			for x in range(x1, x2):
+				cells.setdefault((x, y), []).append(actor)
+
+	def unindex_actor(self, actor):
+		"""
+		Layer.unindex_actor(Actor actor) returns None
+		Removes actor from the spatial index.  Called by ActorList when an
+		Actor is removed.
+		"""
+		bounds = self.actor_bounds.pop(actor, None)
+		if bounds == None:
+			return
+		x1, y1, x2, y2 = bounds
+		cells = self.cells
+		for y in range(y1, y2):
+			for x in range(x1, x2):
+				actors = cells[(x, y)]
+				actors.remove(actor)
+				if not actors:
+					del cells[(x, y)]
+
+	def update_actor(self, actor):
+		"""
+		Layer.update_actor(Actor actor) returns None
+		Moves actor to its current bounds in the spatial index, if it is in
+		the index.  Called by Actor.move_to; an Actor moved by setting x and
+		y directly is indexed at its old position until this is called.
+		"""
+		old = self.actor_bounds.get(actor)
+		if old == None:
+			return
+		x, y = actor.x, actor.y
+		if actor.w == 1 and actor.h == 1 and old[2] == old[0] + 1 and old[3] == old[1] + 1:
+			# Single tile: move it between two buckets.
+			if x == old[0] and y == old[1]:
+				return
+			cells = self.cells
+			actors = cells[old[:2]]
+			actors.remove(actor)
+			if not actors:
+				del cells[old[:2]]
+			cells.setdefault((x, y), []).append(actor)
+			self.actor_bounds[actor] = (x, y, x + 1, y + 1)
+		elif actor.get_bounds() != old:
+			self.unindex_actor(actor)
+			self.index_actor(actor)
+
+	def actors_at(self, x, y):
+		"""
+		Layer.actors_at(int x, int y) returns list
+		Returns the Layer's Actors covering the tile (x, y).
+		"""
+		return list(self.cells.get((x, y), ()))
+
+	def actors_in(self, x1, y1, x2, y2):
+		"""
+		Layer.actors_in(int x1, int y1, int x2, int y2) returns list
+		Returns the Layer's Actors that overlap the rectangle (x1, y1),
+		(x2, y2), where x2 and y2 are exclusive, in no particular order.  A
+		rectangle with more tiles than the index has is answered by checking
+		each Actor's bounds instead.
+		"""
+		if (x2 - x1) * (y2 - y1) > len(self.cells):
+			return [i for i, (a1, b1, a2, b2) in self.actor_bounds.items() if a1 < x2 and a2 > x1 and b1 < y2 and b2 > y1]
+		found = []
+		seen = set()
+		cells = self.cells
+		for y in range(y1, y2):
+			for x in range(x1, x2):
+				for i in cells.get((x, y), ()):
+					if i not in seen:
+						seen.add(i)
+						found.append(i)
+		return found
+
+	def get_neighbours(self, actor, distance=1):
+		"""
+		Layer.get_neighbours(Actor actor, int distance) returns list
+		Returns the Layer's other Actors within distance tiles of actor,
+		diagonals included.
+		"""
+		x1, y1, x2, y2 = actor.get_bounds()
+		return [i for i in self.actors_in(x1 - distance, y1 - distance, x2 + distance, y2 + distance) if i is not actor]
+
+	def is_blocked(self, x, y, actor=None):
+		"""
+		Layer.is_blocked(int x, int y, Actor actor) returns bool
+		Returns True if actor (or a single tile, if actor is None) cannot be
+		placed at (x, y), because it would leave the Layer, overlap a solid
+		game tile (see Layer.update_solid) or overlap another Actor.  This is
+		the Dramatic blocked check.
+		"""
+		w, h = (actor.w, actor.h) if actor != None else (1, 1)
+		if x < 0 or y < 0 or x + w > self.w or y + h > self.h:
+			return True
+		if w == 1 and h == 1:
+			ref = (y * self.w) + x
+			if self.solid[ref >> 3] & (128 >> (ref & 7)):
+				return True
+			for i in self.cells.get((x, y), ()):
+				if i is not actor:
+					return True
+			return False
+		for j in range(y, y + h):
+			for i in range(x, x + w):
+				if self.is_solid(i, j):
+					return True
+		for i in self.actors_in(x, y, x + w, y + h):
+			if i is not actor:
+				return True
+		return False
+
+	def listen(self, actor):
+		"""
+		Layer.listen(Actor actor) returns None
+		Registers actor, under every tile it covers, for each of the
+		spatial events (see Layer.spatial_events) its script has a when
+		handler for, replacing any earlier registration.  Actor.get_process
+		and Actor.move_to keep this up to date.
+		"""
+		self.unlisten(actor)
+		if actor.process == None:
+			return
+		handlers = actor.process.program.handlers
+		for event in self.spatial_events:
+			if event not in handlers:
+				continue
+			cells = self.listeners.setdefault(event, {})
+			for y in range(actor.y, actor.y + actor.h):
+				for x in range(actor.x, actor.x + actor.w):
+					cells.setdefault((x, y), []).append(actor)
+					actor.listening.append((event, (x, y)))
+
+	def unlisten(self, actor):
+		"""
+		Layer.unlisten(Actor actor) returns None
+		Removes actor's event registrations.
+		"""
+		for event, cell in actor.listening:
+			cells = self.listeners[event]
+			cells[cell].remove(actor)
+			if not cells[cell]:
+				del cells[cell]
+		actor.listening = []
+
+	def get_listeners(self, event, cells):
+		"""
+		Layer.get_listeners(str event, list cells) returns list
+		Returns the Actors registered for event at any of the given (x, y)
+		tiles, each once.
+		"""
+		registered = self.listeners.get(event)
+		if not registered:
+			return []
+		found = []
+		for cell in cells:
+			for i in registered.get(cell, ()):
+				if i not in found:
+					found.append(i)
+		return found
+
+	def fire(self, event, x1, y1, x2, y2, source=None):
+		"""
+		Layer.fire(str event, int x1, int y1, int x2, int y2, Actor source)
+			returns int
+		Sends event to the Actors registered for it in the rectangle (x1, y1),
+		(x2, y2), other than source, and returns how many took it.  The
+		Dramatic go fires 'touched' at the tiles an Actor is blocked from.
+		"""
+		if event not in self.listeners:
+			return 0
+		cells = [(x, y) for y in range(y1, y2) for x in range(x1, x2)]
+		return len([i for i in self.get_listeners(event, cells) if i is not source and i.get_process().send(event)])
+
+	def fire_adjacent(self, actor, old_x, old_y):
+		"""
+		Layer.fire_adjacent(Actor actor, int old_x, int old_y) returns int
+		Sends 'adjacent' to the Actors registered for it that actor, having
+		moved from (old_x, old_y), is now beside (but was not beside before),
+		and returns how many took it.
+		"""
+		def ring(x, y):
+			w, h = actor.w, actor.h
+			return ([(i, y - 1) for i in range(x, x + w)] + [(i, y + h) for i in range(x, x + w)] +
+				[(x - 1, j) for j in range(y, y + h)] + [(x + w, j) for j in range(y, y + h)])
+		found = self.get_listeners('adjacent', ring(actor.x, actor.y))
+		if not found:
+			return 0
+		before = self.get_listeners('adjacent', ring(old_x, old_y))
+		return len([i for i in found if i is not actor and i not in before and i.get_process().send('adjacent')])
+
+	def clone(self, parent=None):
+		new = Saveable.clone(self, parent)
+		new.solid = bytearray(self.solid)
+		new.actors = new._actors
+		new.listeners = {}
+		for i in new.actors:
+			new.listen(i)
+		return new
+	clone.__doc__ = Saveable.clone.__doc__ # Inherit docstring.
 			
 	def blit(self, dest_graphics):
 		"""
@@ -404,25 +2597,76 @@ class Layer(Saveable, Material):
 		Blits the Layer's sprite and Actors to dest_graphics and passes other
 		arguments through.
 		"""
-		if self.dirty:
+		if self.dirty or self.dirty_tiles:
 			self.flip(dest_graphics)
-			self.dirty = False
 		self.get_sprite().blit(dest_graphics)
-		for i in self.actors[::-1]:
-			i.blit(dest_graphics)
+		for batch in self.get_actor_batches()[::-1]:
+			if isinstance(batch, Actor):
+				batch.blit(dest_graphics)
+			else:
+				self.blit_glyphs(dest_graphics, *batch)
+
+	def get_actor_batches(self):
+		"""
+		Layer.get_actor_batches() returns list
+		Groups the Layer's Actors, topmost first, into runs of consecutive
+		single-tile Actors that use the Layer's palette, and lone other Actors.
+		A run is returned as a tuple (xs, ys, tiles, tilemasks, palette) of
+		arrays holding every glyph of the run, and can be drawn in one pass; any
+		other Actor is returned as itself.
+		"""
+		batches = []
+		run = []
+		palette = self.get_sprite().palette
+		for actor in self.actors + [None]:
+			if actor != None:
+				sprite = actor.sprite[0]
+				if sprite.w == 1 and sprite.h == 1 and sprite.palette is palette:
+					run.append(actor)
+					continue
+			if run:
+				batches.append((
+					numpy.array([a.x for a in run], dtype=numpy.int32),
+					numpy.array([a.y for a in run], dtype=numpy.int32),
+					numpy.concatenate([a.sprite[0].tilemap for a in run]),
+					numpy.array([a.sprite[0].tilemask for a in run], dtype=numpy.int32),
+					palette))
+				run = []
+			if actor != None:
+				batches.append(actor)
+		return batches
+
+	def blit_glyphs(self, dest_graphics, xs, ys, tiles, tilemasks, palette):
+		"""
+		Layer.blit_glyphs(Graphics dest_graphics, xs, ys, tiles, tilemasks,
+			Palette palette) returns None
+		Draws a run of single-tile Actors, as returned by get_actor_batches,
+		straight onto dest_graphics' console, bottom first.
+		"""
+		for x, y, (char, color), mask in reversed(zip(xs.tolist(), ys.tolist(), tiles.tolist(), tilemasks.tolist())):
+			if char != mask:
+				libtcodpy.console_put_char_ex(dest_graphics.console, x, y, char, palette.colors[color % 16], palette.colors[(color // 16) % 16])
 			
-	def flip(self, dest_graphics):
+	def flip(self, dest_graphics=None, incremental=True):
 		"""
-		Layer.flip(Sprite dest_graphics) returns None
-		Render all of the Layer's Tiles into the Tilemap.
+		Layer.flip(Sprite dest_graphics, bool incremental) returns None
+		Render the Layer's Tiles into the Tilemap with a single lookup in the
+		compiled tilesaurus.  If incremental is True and the gamemap has only
+		had single tiles set since the last flip, only those tiles are
+		re-rendered; otherwise the whole gamemap is.
 		"""
-		t = []
-		p=0
-		for	i in self.gamemap:
-			t.append(self.render_game_tile(*i))
-			p+=1
-		self.get_sprite().tilemap = t
-		self.dirty = True
+		global tilesaurus
+		sprite = self.get_sprite()
+		refs = self.dirty_tiles
+		if self.dirty or not incremental or len(refs) * 4 > len(self._gamemap) or sprite.tilemap.shape[0] != self._gamemap.shape[0]:
+			sprite.tilemap = tilesaurus.render(self._gamemap[:, 0])
+		elif refs:
+			refs = numpy.unique(numpy.array(refs, dtype=numpy.int32))
+			sprite.unshare()[refs] = tilesaurus.render(self._gamemap[refs, 0])
+			xs, ys = refs % self.w, refs // self.w
+			sprite.mark_dirty(int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)
+		self.dirty = False
+		self.dirty_tiles = []
 		
 	def render_game_tile(self, id, color, param):
 		"""
@@ -431,10 +2675,7 @@ class Layer(Saveable, Material):
 		Look up a tile in the tilesaurus and return its char and color as a tuple.
 		"""
 		global tilesaurus
-		if id < len(tilesaurus):
-			return [tilesaurus[id]['floor_char'], tilesaurus[id]['floor_color']]
-		else:
-			return [32, 7]
+		return tilesaurus.floor[tilesaurus.clip(id)].tolist()
 			
 	def draw_game_tile(self, x, y, id, color=7, param=0):
 		"""
@@ -453,8 +2694,24 @@ class Layer(Saveable, Material):
 		Draws the given game tile at the specified coordinates, but does not
 		add it to the map.
 		"""
-		self.gamemap[(y * self.w) + x] = (id, color, param)
-		self.dirty = True
+		global tilesaurus
+		self.touch()
+		ref = (y * self.w) + x
+		history = self.get_history()
+		if history != None:
+			history.record(self, 'gamemap', ref, (id, color, param))
+		self.unshare()[ref] = (id, color, param)
+		if tilesaurus.is_solid(id):
+			self.solid[ref >> 3] |= 128 >> (ref & 7)
+		else:
+			self.solid[ref >> 3] &= ~(128 >> (ref & 7)) & 255
+		if not self.dirty:
+			self.dirty_tiles.append(ref)
+			if len(self.dirty_tiles) * 4 > len(self._gamemap):
+				# flip would render the whole gamemap anyway.
+				self.dirty = True
+				self.dirty_tiles = []
+		self.record_change('tile', x, y, id, color, param)
 		return
 
 	def set_game_tile_param(self, x, y, param=0):
@@ -463,7 +2720,13 @@ class Layer(Saveable, Material):
 		Draws the given game tile at the specified coordinates, but does not
 		add it to the map.
 		"""
-		self.gamemap[(y * self.w) + x][2] = param
+		self.touch()
+		history = self.get_history()
+		if history != None:
+			row = self._gamemap[(y * self.w) + x]
+			history.record(self, 'gamemap', (y * self.w) + x, (row[0], row[1], param))
+		self.unshare()[(y * self.w) + x][2] = param
+		self.record_change('param', x, y, param)
 		return
 		
 	def fill_sprite(self, *args, **kwargs):
@@ -474,9 +2737,31 @@ class Layer(Saveable, Material):
 		Layer.fill(int id, int color, int param)
 		Fills the Layer with the given tile type.
 		"""
-		for i in range(len(self.gamemap)):
-			self.gamemap[i] = [id, color, param]
+		global tilesaurus
+		self.touch()
+		history = self.get_history()
+		if history != None:
+			history.record(self, 'gamemap', None, (id, color, param))
+		self.unshare()[:] = (id, color, param)
+		self.solid = bytearray((255 if tilesaurus.is_solid(id) else 0,)) * len(self.solid)
 		self.dirty = True
+		self.record_change('fill', id, color, param)
+	
+	def write_cells(self, refs, rows):
+		"""
+		Layer.write_cells(numpy.ndarray refs, numpy.ndarray rows) returns None
+		Sets the gamemap rows at the given tile refs, as History.undo and
+		History.redo do, and records the change.
+		"""
+		self.unshare()[refs] = rows
+		self.update_solid()
+		if not self.dirty:
+			self.dirty_tiles.extend(refs.tolist())
+			if len(self.dirty_tiles) * 4 > len(self._gamemap):
+				self.dirty = True
+				self.dirty_tiles = []
+		if self.get_journal() != None:
+			self.record_change('cells', refs.tolist(), rows.tolist())
 	
 	def fill_func(self, **kwargs):
 		"""
@@ -494,38 +2779,292 @@ class Layer(Saveable, Material):
 			for f in [['id_func', 'id_args', 0], ['color_func', 'color_args', 1], ['param_func', 'param_args', 2]]:
 				if hasattr(kwargs, f[0]):
 					if hasattr(kwargs, f[1]):
-						self.gamemap[i][f[2]] = f[0](i)
+						self.unshare()[i][f[2]] = f[0](i)
 					else:
-						self.gamemap[i][f[2]] = f[0]()
+						self.unshare()[i][f[2]] = f[0]()
+		self.update_solid()
+
+
+class ActorList(list):
+	"""
+	An ActorList is the list of Actors of a World, Board or Layer.  It is a
+		list that gives each Actor a uid unique within it, by which
+		RootClass.get_path finds the Actor, records Actors added and removed
+		in the World's journal, and tells a Layer when Actors are added or
+		removed, so that the Layer's spatial index and event listeners stay
+		up to date.  Changes that replace items or slices are journaled as a
+		whole new list and rebuild the whole index.  It also keeps an index
+		of its Actors by name, built when first needed after a change.
+	Methods:
+		ActorList.append(Actor actor) returns None
+		ActorList.insert(int i, Actor actor) returns None
+		ActorList.extend(list actors) returns None
+		ActorList.remove(Actor actor) returns None
+		ActorList.pop(int i) returns Actor
+		ActorList.assign_uids() returns None
+		ActorList.find_name(str name) returns Actor or None
+	"""
+	def __init__(self, owner, actors=()):
+		list.__init__(self, actors)
+		self.owner = owner
+		self.names = None
+		self.assign_uids()
+
+	def find_name(self, name):
+		"""
+		ActorList.find_name(str name) returns Actor or None
+		Returns the first Actor whose name, in lower case, is name.
+		"""
+		if self.names == None:
+			self.names = {}
+			for i in reversed(self):
+				self.names[i.name.lower()] = i
+		return self.names.get(name)
+
+	def assign_uids(self):
+		"""
+		ActorList.assign_uids() returns None
+		Rebuilds the uid lookup, keeping each Actor's uid unless it has none
+		or another Actor in the list has it already.  Actors loaded from
+		files saved before uids were get their index.
+		"""
+		self.by_uid = {}
+		self.names = None
+		self.next_uid = max([i.uid for i in self if i.uid != None] + [-1]) + 1
+		for i in self:
+			self.add_uid(i)
+
+	def add_uid(self, actor):
+		if actor.uid == None or self.by_uid.get(actor.uid, actor) is not actor:
+			actor.uid = self.next_uid
+		self.by_uid[actor.uid] = actor
+		self.next_uid = max(self.next_uid, actor.uid + 1)
+
+	def added(self, actor, i):
+		self.add_uid(actor)
+		self.names = None
+		owner = self.owner
+		if hasattr(owner, 'index_actor'):
+			owner.index_actor(actor)
+			if actor.process != None:
+				owner.listen(actor)
+		owner.touch()
+		journal = owner.get_journal()
+		if journal != None:
+			journal.record('add', owner.get_path(), i, actor.serialize())
+
+	def removed(self, actor):
+		if self.by_uid.get(actor.uid) is actor:
+			del self.by_uid[actor.uid]
+		self.names = None
+		owner = self.owner
+		if hasattr(owner, 'unindex_actor'):
+			owner.unindex_actor(actor)
+			owner.unlisten(actor)
+		owner.record_change('remove', actor.uid)
+
+	def replaced(self, old):
+		self.assign_uids()
+		owner = self.owner
+		if hasattr(owner, 'reindex'):
+			owner.reindex()
+			kept = set(self)
+			for i in old:
+				if i not in kept:
+					owner.unlisten(i)
+		owner.touch()
+		journal = owner.get_journal()
+		if journal != None:
+			journal.record('actors', owner.get_path(), [i.serialize() for i in self])
+
+	def append(self, actor):
+		list.append(self, actor)
+		self.added(actor, len(self) - 1)
+
+	def insert(self, i, actor):
+		list.insert(self, i, actor)
+		self.added(actor, self.index(actor))
+
+	def extend(self, actors):
+		for i in list(actors):
+			self.append(i)
+
+	def __iadd__(self, actors):
+		self.extend(actors)
+		return self
+
+	def remove(self, actor):
+		list.remove(self, actor)
+		self.removed(actor)
+
+	def pop(self, i=-1):
+		actor = list.pop(self, i)
+		self.removed(actor)
+		return actor
+
+	def __setitem__(self, i, value):
+		old = list(self)
+		list.__setitem__(self, i, value)
+		self.replaced(old)
+
+	def __delitem__(self, i):
+		old = list(self)
+		list.__delitem__(self, i)
+		self.replaced(old)
+
+	def __setslice__(self, i, j, value):
+		old = list(self)
+		list.__setslice__(self, i, j, value)
+		self.replaced(old)
+
+	def __delslice__(self, i, j):
+		old = list(self)
+		list.__delslice__(self, i, j)
+		self.replaced(old)
 
 
 class Actor(Saveable, Material):
 	"""
 	An Actor is a programmable Dust entity that can execute Dramatic code.
+	Single-tile Actors do not get a console of their own; Layers draw them in
+	batches straight into the frame.
 	Methods:
 		Actor.get_footprint() returns dict
-		Actor.tick() returns None
+		Actor.get_name() returns str
+		Actor.set_name(str name) returns None
+		Actor.get_process() returns dramatic.Process
+		Actor.is_awake() returns bool
+		Actor.wake() returns None
+		Actor.tick(int limit) returns int
+		Actor.move_to(int x, int y) returns None
+		Actor.clone(Saveable parent) returns Actor
 		Actor.blit(Graphics dest_graphics, ...) returns None
 	"""
+	# Most Dramatic instructions an Actor runs in one tick.
+	instruction_limit = 1000
+
 	def __init__(self, parent, w=1, h=1, x=0, y=0, name="New Actor"):
 		self.parent = parent
 		self.find_main_display()
 		self.w, self.h, self.x, self.y = w, h, x, y
 		self.name = name
-		self.sprite = [Sprite(self, w, h, x, y)]
+		self.sprite = [Sprite(self, w, h, x, y, new_console=(w * h > 1))]
 		self.counters = {}
 		self.program = ""
+		self.heading = 0
+		self.uid = None
+		self.process = None
+		self.listening = []
 		
 	def get_footprint(self):
-		return {'w': False, 'h': False, 'x': False, 'y': False, 'name': False, 'sprite': Sprite, 'counters': False, 'program': False}
+		return {'w': False, 'h': False, 'x': False, 'y': False, 'name': False, 'sprite': Sprite, 'counters': False, 'program': False, 'heading': False, 'uid': False}
 	get_footprint.__doc__ = Saveable.get_footprint.__doc__ # Inherit docstring.
+
+	def get_name(self):
+		"""
+		Actor.get_name() returns str
+		Returns the Actor's name.
+		"""
+		return self._name
+
+	def set_name(self, name):
+		"""
+		Actor.set_name(str name) returns None
+		Renames the Actor, and has its parent's ActorList rebuild its index
+		of names when next needed.
+		"""
+		self._name = name
+		actors = getattr(self.parent, 'actors', None)
+		if isinstance(actors, ActorList):
+			actors.names = None
+			self.touch()
+	name = property(get_name, set_name)
+
+	def get_process(self):
+		"""
+		Actor.get_process() returns dramatic.Process
+		Returns the Process running the Actor's program, starting a new one
+		if the program has changed.  Programs are compiled once per distinct
+		source; see dramatic.compile.
+		"""
+		if self.process == None or self.process.program.source != self.program:
+			self.process = dramatic.Process(dramatic.compile(self.program), self)
+			if hasattr(self.parent, 'listen'):
+				self.parent.listen(self)
+		return self.process
+
+	def is_awake(self):
+		"""
+		Actor.is_awake() returns bool
+		Returns False if the Actor has no program, or its script has ended
+		and is waiting for an event or a jump; such Actors are not ticked.
+		"""
+		process = self.process
+		return bool(self.program) and (process == None or not process.done or process.program.source != self.program)
 		
-	def tick(self):
+	def wake(self):
 		"""
-		Actor.tick() returns None
-		Runs the Actor's tick...
+		Actor.wake() returns None
+		Tells the World's Scheduler that the Actor's script has been woken
+		by an event or a jump.  Called by dramatic.Process.
 		"""
-		pass
+		world = self.get_world()
+		if world != None:
+			world.scheduler.wake(self)
+
+	def tick(self, limit=None):
+		"""
+		Actor.tick(int limit) returns int
+		Runs the Actor's program until it yields (at the end of a loop or
+		after a go), ends, or has run limit instructions (instruction_limit
+		by default), and returns the number of instructions run.  A script
+		that runs out of instructions carries on from the same place next
+		tick.  A script with an error prints it and stops until the program
+		is changed; see dramatic.Process.
+		"""
+		if not self.program:
+			return 0
+		if limit == None:
+			limit = self.instruction_limit
+		try:
+			count = self.get_process().run(limit)
+			if count:
+				self.touch()
+			return count
+		except dramatic.DramaticError, e:
+			print "Script error in", self.name + ":", e
+			if self.process == None or self.process.program.source != self.program:
+				self.process = dramatic.failed(self.program, self, str(e))
+				if hasattr(self.parent, 'listen'):
+					self.parent.listen(self)
+			return 0
+
+	def move_to(self, x, y):
+		"""
+		Actor.move_to(int x, int y) returns None
+		Moves the Actor to (x, y) and records the move.  Moves it in its
+		Layer's spatial index, moves its event registrations with it, and
+		sends 'adjacent' to the Actors it moves next to.
+		"""
+		self.touch()
+		old_x, old_y = self.x, self.y
+		self.x, self.y = x, y
+		if hasattr(self.parent, 'update_actor'):
+			self.parent.update_actor(self)
+		if self.listening:
+			self.parent.listen(self)
+		if 'adjacent' in getattr(self.parent, 'listeners', ()):
+			self.parent.fire_adjacent(self, old_x, old_y)
+		self.record_change('move', x, y)
+
+	def clone(self, parent=None):
+		new = Saveable.clone(self, parent)
+		new.listening = []
+		if self.process != None:
+			new.process = self.process.clone(new)
+		return new
+	clone.__doc__ = Saveable.clone.__doc__ # Inherit docstring.
+
 	def blit(self, dest_graphics):
 		"""
 		Actor.blit(Graphics dest_graphics, ...)
@@ -535,25 +3074,90 @@ class Actor(Saveable, Material):
 		self.get_sprite().blit(dest_graphics, x=self.x, y=self.y)
 
 
+class Palette(object):
+	"""
+	A Palette maps Dust color codes to colors.  It is built once and then
+	shared, and holds both a table of libtcodpy.Color objects for per-tile
+	calls and an (n, 3) array of RGB values for the console fill functions.
+	Index 16 is the key color used for transparent tiles.
+	Methods:
+		Palette.get_color(int c) returns libtcodpy.Color
+	"""
+	def __init__(self, colors):
+		"""
+		Palette(list colors)
+		Takes a list of at least 17 colors, each either a libtcodpy.Color or
+		an (r, g, b) tuple.
+		"""
+		if len(colors) < 17:
+			raise ValueError("A Palette needs at least 17 colors (16 and a key color), got %d" % len(colors))
+		self.colors = [c if isinstance(c, libtcodpy.Color) else libtcodpy.Color(*c) for c in colors]
+		self.rgb = numpy.array([tuple(c) for c in self.colors], dtype=numpy.int32)
+
+	def get_color(self, c):
+		"""
+		Palette.get_color(int c) returns libtcodpy.Color
+		Returns the color with the code c.
+		"""
+		return self.colors[c]
+
+CGA_PALETTE = Palette([libtcodpy.black, libtcodpy.dark_blue, libtcodpy.dark_green, libtcodpy.dark_cyan, libtcodpy.dark_red, libtcodpy.dark_purple, libtcodpy.dark_orange, libtcodpy.light_gray, libtcodpy.dark_gray, libtcodpy.light_blue, libtcodpy.light_green, libtcodpy.light_cyan, libtcodpy.light_red, libtcodpy.light_magenta, libtcodpy.light_yellow, libtcodpy.white, libtcodpy.han])
+
+
 class Graphics(Material):
 	"""
 	A Graphics object is a lower level wrapper for the underlying console
 	wrapper.  It is not serializable, because it does not contain map data.
+	Colors are looked up in Graphics.palette, which defaults to CGA_PALETTE
+	for every instance; assign a Palette to the class to swap it globally, or
+	call set_palette to swap it for a single object.
 	Methods:
 		Graphics.blit(Graphics dest_graphics, ...) returns None
+		Graphics.open_console() returns None
+		Graphics.close() returns None
+		Graphics.get_memory_size() returns int
 		Graphics.get_color(int c) returns libtcodpy.Color
+		Graphics.set_palette(Palette palette) returns None
 		Graphics.clear() returns None
 	"""
+	palette = CGA_PALETTE
+
 	def __init__(self, parent, w=80, h=25, x=0, y=0, new_console=True):
 		self.parent = parent
 		self.w, self.h, self.x, self.y = w, h, x, y
+		self.console = False
 		if new_console:
+			self.open_console()
+			Material.__init__(self)
+		self.dirty = True
+
+	def open_console(self):
+		"""
+		Graphics.open_console() returns None
+		Creates the libtcodpy console for this object, unless it already has
+		one, and sets its key color.
+		"""
+		if not self.console:
 			self.console = libtcodpy.console_new(self.w, self.h)
 			libtcodpy.console_set_key_color(self.console, self.get_color(16))
-			Material.__init__(self)
-		else:
+
+	def close(self):
+		"""
+		Graphics.close() returns None
+		Deletes this object's libtcodpy console, if it has one.
+		"""
+		if self.console:
+			libtcodpy.console_delete(self.console)
 			self.console = False
-		self.dirty = True
+
+	def get_memory_size(self):
+		"""
+		Graphics.get_memory_size() returns int
+		Returns an estimate of the bytes held by this object's console.
+		"""
+		if self.console:
+			return self.w * self.h * 12
+		return 0
 			
 	def blit(self, dest_graphics, x=0, y=0):
 		"""
@@ -567,9 +3171,22 @@ class Graphics(Material):
 		"""
 		Graphics.get_color(int c) returns libtcodpy.Color
 		Returns a libtcodpy.Color object representing the color c of the
-		CGA color set (4 bits, each bit is I,R,G,B respectively).
+		CGA color set (4 bits, each bit is I,R,G,B respectively), as found in
+		the Graphics object's palette.
+		"""
+		return self.palette.colors[c]
+
+	def set_palette(self, palette):
 		"""
-		return [libtcodpy.black, libtcodpy.dark_blue, libtcodpy.dark_green, libtcodpy.dark_cyan, libtcodpy.dark_red, libtcodpy.dark_purple, libtcodpy.dark_orange, libtcodpy.light_gray, libtcodpy.dark_gray, libtcodpy.light_blue, libtcodpy.light_green, libtcodpy.light_cyan, libtcodpy.light_red, libtcodpy.light_magenta, libtcodpy.light_yellow, libtcodpy.white, libtcodpy.han][c]
+		Graphics.set_palette(Palette palette) returns None
+		Swaps in a different Palette for this object only, updates the
+		console's key color, and marks the object dirty so that it is redrawn
+		with the new colors.
+		"""
+		self.palette = palette
+		if self.console:
+			libtcodpy.console_set_key_color(self.console, self.get_color(16))
+		self.dirty = True
 		
 	def clear(self):
 		"""
@@ -582,27 +3199,132 @@ class Graphics(Material):
 class Sprite(Graphics, Saveable):
 	"""
 	A Sprite object is a higher level wrapper that extends Graphics and is
-	seriable.  It contains a list of (char, color) tuples that represent a map
-	of ASCII characters and CGA color codes.
+	seriable.  It contains a packed array of (char, color) rows that represent
+	a map of ASCII characters and CGA color codes.  Unless new_console is
+	given, only Sprites of more than one tile get a console when created.
 	Methods:
+		Sprite.unshare() returns numpy.ndarray
 		Sprite.get_tile_ref(int x, int y) returns int
 		Sprite.get_tile(int x, int y) returns tuple (int, int)
 		Sprite.put_tile(int x, int y, int char, int color) returns None
 		Sprite.fill_sprite(int char, int color) returns None
+		Sprite.mark_dirty(int x1, int y1, int x2, int y2) returns None
+		Sprite.write_cells(numpy.ndarray refs, numpy.ndarray rows) returns None
+		Sprite.get_memory_size() returns int
+		Sprite.upload() returns None
 		Sprite.redraw(Graphics dest_graphics) returns none
 	"""
 
-	def __init__(self, parent, w=80, h=25, x=0, y=0, new_console=True):
+	# Dirty regions up to this many tiles are uploaded tile by tile; larger
+	# ones are uploaded as whole planes.
+	cell_upload_limit = 64
+
+	def __init__(self, parent, w=80, h=25, x=0, y=0, new_console=None):
+		if new_console == None:
+			new_console = (w * h > 1)
+		self._planes = None
 		Graphics.__init__(self, parent, w, h, x, y, new_console) # call parent init function to do grunt work: position & open console
-		self.tilemap = [[0, 7]] * (self.w * self.h)
+		self.tilemap = blank_plane((0, 7), self.w * self.h)
 		self.tilemask = 0
 		self.dirty = True
 		#self.redraw(self)
 		
 	def get_footprint(self):
-		return {'w': False, 'h': False, 'x': False, 'y': False, 'tilemap': False, 'tilemask': False}
+		return {'w': False, 'h': False, 'x': False, 'y': False, 'tilemap': numpy.ndarray, 'tilemask': False}
 	get_footprint.__doc__ = Saveable.get_footprint.__doc__ # Inherit docstring.
 
+	def get_tilemap(self):
+		"""
+		Sprite.get_tilemap() returns numpy.ndarray
+		Returns the Sprite's tilemap as a (w*h, 2) array of int32, where
+		column 0 is the char and column 1 is the CGA color of each tile.
+		"""
+		return self._tilemap
+
+	def set_tilemap(self, tilemap):
+		"""
+		Sprite.set_tilemap(list tilemap) returns None
+		Replaces the Sprite's tilemap.  Accepts a list of (char, color) pairs,
+		as found in a Dust World file, or an array of the same shape.  A
+		read-only int32 array, as loaded from a binary World file, is shared
+		rather than copied until the Sprite changes it.
+		"""
+		if is_shared_plane(tilemap):
+			self._tilemap = tilemap.reshape(-1, 2)
+		else:
+			self._tilemap = numpy.array(tilemap, dtype=numpy.int32).reshape(-1, 2)
+		self.dirty = True
+		self.touch()
+	tilemap = property(get_tilemap, set_tilemap)
+
+	def unshare(self):
+		"""
+		Sprite.unshare() returns numpy.ndarray
+		Returns the Sprite's tilemap for writing.  A tilemap shared with a
+		BackgroundSave is read-only, so it is copied first.
+		"""
+		self.touch()
+		if not self._tilemap.flags.writeable:
+			self._tilemap = self._tilemap.copy()
+		return self._tilemap
+
+	def get_dirty(self):
+		"""
+		Sprite.get_dirty() returns bool
+		Returns True if any part of the tilemap has changed since the last
+		upload to the console.
+		"""
+		return self.dirty_rect != None
+
+	def set_dirty(self, dirty):
+		"""
+		Sprite.set_dirty(bool dirty) returns None
+		Marks the whole Sprite as dirty, or clears its dirty region.
+		"""
+		if dirty:
+			self.dirty_rect = (0, 0, self.w, self.h)
+		else:
+			self.dirty_rect = None
+	dirty = property(get_dirty, set_dirty)
+
+	def mark_dirty(self, x1, y1, x2=None, y2=None):
+		"""
+		Sprite.mark_dirty(int x1, int y1, int x2, int y2) returns None
+		Adds the rectangle (x1, y1) to (x2, y2), exclusive, to the Sprite's
+		dirty region, which is kept as a single bounding rectangle.  If x2 and
+		y2 are not provided, marks the single tile at (x1, y1).
+		"""
+		if x2 == None:
+			x2, y2 = x1 + 1, y1 + 1
+		if self.dirty_rect != None:
+			dx1, dy1, dx2, dy2 = self.dirty_rect
+			x1, y1, x2, y2 = min(x1, dx1), min(y1, dy1), max(x2, dx2), max(y2, dy2)
+		self.dirty_rect = (x1, y1, x2, y2)
+
+	def get_memory_size(self):
+		"""
+		Sprite.get_memory_size() returns int
+		Returns an estimate of the bytes held by the Sprite's tilemap, cached
+		planes and console.
+		"""
+		size = Graphics.get_memory_size(self) + self._tilemap.nbytes
+		if self._planes != None:
+			size += sum(p.nbytes for p in self._planes)
+		return size
+
+	def close(self):
+		Graphics.close(self)
+		self._planes = None
+	close.__doc__ = Graphics.close.__doc__ # Inherit docstring.
+
+	def clone(self, parent=None):
+		new = Saveable.clone(self, parent)
+		new.console = False
+		new._planes = None
+		new.dirty = True
+		return new
+	clone.__doc__ = Saveable.clone.__doc__ # Inherit docstring.
+
 	def get_tile_ref(self, x, y):
 		"""
 		Sprite.get_tile_ref(int x, int y) returns int
@@ -618,22 +3340,24 @@ class Sprite(Graphics, Saveable):
 		Based on the given coordinates, returns a (char, color) tuple of the
 		contents of the map at that position.
 		"""
-		return self.tilemap[((y * self.w) + x)]
+		return tuple(self._tilemap[((y * self.w) + x)].tolist())
 	def put_tile(self, x, y, char, color=False):
 		"""
 		Sprite.put_tile(int x, int y, int char, int color) returns None
 		Based on the given coordinates, places a tile of the given character
 		and color at the correct position.  If color is not provided, the color
-		remains the same.
+		remains the same.  The console is updated on the next blit.
 		"""
+		self.touch()
+		history = self.get_history()
+		if history != None:
+			ref = self.get_tile_ref(x, y)
+			history.record(self, 'tilemap', ref, (char, color or int(self._tilemap[ref, 1])))
 		if color:
-			self.tilemap[self.get_tile_ref(x, y)] = (char, color)
-			libtcodpy.console_set_default_foreground(self.console, self.get_color(color % 16))
-			libtcodpy.console_put_char(self.console, x, y, char, libtcodpy.BKGND_SET)
+			self.unshare()[self.get_tile_ref(x, y)] = (char, color)
 		else:
-			self.tilemap[self.get_tile_ref(x, y)][0] = char
-			libtcodpy.console_set_char(self.console, x, y, char, libtcodpy.BKGND_SET)
-		self.dirty = True
+			self.unshare()[self.get_tile_ref(x, y), 0] = char
+		self.mark_dirty(x, y)
 			
 	def fill_sprite(self, char, color):
 		"""
@@ -642,34 +3366,179 @@ class Sprite(Graphics, Saveable):
 		"""
 		if (char == None) and (color == None):
 			return
-		elif char == None:
-			for i in range(len(self.tilemap)):
-				self.tilemap[i][1] = color
-		elif color == None:
-			for i in range(len(self.tilemap)):
-				self.tilemap[i][0] = char
-		else:
-			for i in range(len(self.tilemap)):
-				self.tilemap[i] = [char, color]
+		self.touch()
+		history = self.get_history()
+		if history != None:
+			history.record(self, 'tilemap', None, (char, color))
+		if char != None:
+			self.unshare()[:, 0] = char
+		if color != None:
+			self.unshare()[:, 1] = color
 		self.dirty = True
+
+	def write_cells(self, refs, rows):
+		"""
+		Sprite.write_cells(numpy.ndarray refs, numpy.ndarray rows) returns None
+		Sets the tilemap rows at the given tile refs, as History.undo and
+		History.redo do.
+		"""
+		self.unshare()[refs] = rows
+		xs, ys = refs % self.w, refs // self.w
+		self.mark_dirty(int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)
+
+	def upload(self):
+		"""
+		Sprite.upload() returns None
+		Pushes the dirty region of the tilemap into the Sprite's console and
+		clears it.  The char, foreground and background planes are cached, so
+		only the dirty tiles are recomputed; small regions are then drawn tile
+		by tile, and larger ones are pushed as whole planes through
+		libtcodpy's fill functions.  Tiles whose char is the tilemask get the
+		key color as background, so they are skipped when blitted.
+		"""
+		if self.dirty_rect == None:
+			return
+		x1, y1, x2, y2 = self.dirty_rect
+		self.dirty_rect = None
+		n = self.w * self.h
+		if self._planes == None or len(self._planes[0]) != n:
+			self._planes = (numpy.zeros(n, dtype=numpy.int32), numpy.zeros((n, 3), dtype=numpy.int32), numpy.zeros((n, 3), dtype=numpy.int32))
+			x1, y1, x2, y2 = 0, 0, self.w, self.h
+		x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, self.w), min(y2, self.h)
+		if x2 <= x1 or y2 <= y1:
+			return
+		refs = (numpy.arange(y1, y2)[:, None] * self.w + numpy.arange(x1, x2)).ravel()
+		chars, fore, back = self._planes
+		rgb = self.palette.rgb
+		tiles = self._tilemap[refs]
+		fore_ids = tiles[:, 1] % 16
+		back_ids = numpy.where(tiles[:, 0] == self.tilemask, 16, (tiles[:, 1] // 16) % 16)
+		chars[refs] = tiles[:, 0]
+		fore[refs] = rgb[fore_ids]
+		back[refs] = rgb[back_ids]
+		if len(refs) <= self.cell_upload_limit:
+			for i, c, f, b in zip(refs.tolist(), tiles[:, 0].tolist(), fore_ids.tolist(), back_ids.tolist()):
+				libtcodpy.console_put_char_ex(self.console, i % self.w, i // self.w, c, self.palette.colors[f], self.palette.colors[b])
+		else:
+			libtcodpy.console_fill_char(self.console, chars)
+			libtcodpy.console_fill_foreground(self.console, fore[:, 0], fore[:, 1], fore[:, 2])
+			libtcodpy.console_fill_background(self.console, back[:, 0], back[:, 1], back[:, 2])
 		
 	def blit(self, dest_graphics, x=0, y=0):
 		"""
 		Graphics.blit(Graphics dest_graphics, ...) returns None
 		Prints the libtcodpy console contained in self.console to the Graphics
-		object supplied by dest_graphics.
+		object supplied by dest_graphics.  A Sprite created without a console
+		gets one on its first blit.
 		"""
-		if self.dirty:
-			p = 0
-			for i in self.tilemap:
-				if i[0] == self.tilemask:
-					libtcodpy.console_put_char_ex(self.console, (p % self.w), (p / self.w), i[0], self.get_color(i[1]%16), self.get_color(16))
-				else:
-					libtcodpy.console_put_char_ex(self.console, (p % self.w), (p / self.w), i[0], self.get_color(i[1]%16), self.get_color(i[1]/16))
-				p += 1
+		if not self.console:
+			self.open_console()
+			self.dirty = True
+		self.upload()
 		libtcodpy.console_blit(self.console, 0, 0, self.w, self.h, dest_graphics.console, x, y)
 
 
+class Compositor(object):
+	"""
+	A Compositor builds a whole frame from a stack of Layers and writes it to
+	a Graphics object in one pass.  Layers and their Actors are visited from
+	the top down, and each tile of the frame is taken from the topmost Sprite
+	whose char at that tile is not its tilemask; Sprites below an opaque tile
+	are never read, and visiting stops once every tile is covered.  Tiles that
+	nothing covers are cleared.
+	Methods:
+		Compositor.composite(list layers, Graphics dest_graphics) returns None
+		Compositor.draw(Sprite sprite, int x, int y) returns None
+		Compositor.draw_glyphs(xs, ys, tiles, tilemasks, Palette palette)
+			returns None
+	"""
+	def __init__(self, w, h):
+		self.w, self.h = w, h
+		self.chars = numpy.zeros((h, w), dtype=numpy.int32)
+		self.fore = numpy.zeros((h, w, 3), dtype=numpy.int32)
+		self.back = numpy.zeros((h, w, 3), dtype=numpy.int32)
+		self.covered = numpy.zeros((h, w), dtype=bool)
+		self.remaining = w * h
+
+	def composite(self, layers, dest_graphics):
+		"""
+		Compositor.composite(list layers, Graphics dest_graphics) returns None
+		Composites layers, given from the top down, and uploads the frame to
+		dest_graphics.  Within a Layer, Actors are drawn over the Layer's
+		Sprite, and earlier Actors over later ones, as in Layer.blit.
+		"""
+		self.covered[:] = False
+		self.remaining = self.w * self.h
+		for layer in layers:
+			for batch in layer.get_actor_batches():
+				if not self.remaining:
+					break
+				if isinstance(batch, Actor):
+					self.draw(batch.get_sprite(), batch.x, batch.y)
+				else:
+					self.draw_glyphs(*batch)
+			if not self.remaining:
+				break
+			if layer.dirty or layer.dirty_tiles:
+				layer.flip()
+			self.draw(layer.get_sprite(), 0, 0)
+		if self.remaining:
+			empty = ~self.covered
+			self.chars[empty] = 32
+			self.fore[empty] = tuple(libtcodpy.white)
+			self.back[empty] = tuple(libtcodpy.black)
+		fore = self.fore.reshape(-1, 3)
+		back = self.back.reshape(-1, 3)
+		libtcodpy.console_fill_char(dest_graphics.console, self.chars.ravel())
+		libtcodpy.console_fill_foreground(dest_graphics.console, fore[:, 0], fore[:, 1], fore[:, 2])
+		libtcodpy.console_fill_background(dest_graphics.console, back[:, 0], back[:, 1], back[:, 2])
+
+	def draw(self, sprite, x, y):
+		"""
+		Compositor.draw(Sprite sprite, int x, int y) returns None
+		Draws the opaque tiles of sprite, placed at (x, y), into the frame
+		wherever the frame is not yet covered, and marks them as covered.
+		"""
+		x1, y1 = max(x, 0), max(y, 0)
+		x2, y2 = min(x + sprite.w, self.w), min(y + sprite.h, self.h)
+		if x2 <= x1 or y2 <= y1:
+			return
+		tiles = sprite.tilemap.reshape(sprite.h, sprite.w, 2)[y1 - y:y2 - y, x1 - x:x2 - x]
+		covered = self.covered[y1:y2, x1:x2]
+		need = (tiles[..., 0] != sprite.tilemask) & ~covered
+		count = int(need.sum())
+		if not count:
+			return
+		colors = tiles[..., 1][need]
+		self.chars[y1:y2, x1:x2][need] = tiles[..., 0][need]
+		self.fore[y1:y2, x1:x2][need] = sprite.palette.rgb[colors % 16]
+		self.back[y1:y2, x1:x2][need] = sprite.palette.rgb[(colors // 16) % 16]
+		covered[need] = True
+		self.remaining -= count
+
+	def draw_glyphs(self, xs, ys, tiles, tilemasks, palette):
+		"""
+		Compositor.draw_glyphs(xs, ys, tiles, tilemasks, Palette palette)
+			returns None
+		Draws a run of single-tile glyphs, as returned by
+		Layer.get_actor_batches, into the frame in one pass.  Where several
+		glyphs land on the same tile, the first one wins.
+		"""
+		keep = (xs >= 0) & (xs < self.w) & (ys >= 0) & (ys < self.h) & (tiles[:, 0] != tilemasks)
+		refs, first = numpy.unique((ys * self.w + xs)[keep], return_index=True)
+		tiles = tiles[keep][first]
+		covered = self.covered.reshape(-1)
+		free = ~covered[refs]
+		refs, tiles = refs[free], tiles[free]
+		if not len(refs):
+			return
+		self.chars.reshape(-1)[refs] = tiles[:, 0]
+		self.fore.reshape(-1, 3)[refs] = palette.rgb[tiles[:, 1] % 16]
+		self.back.reshape(-1, 3)[refs] = palette.rgb[(tiles[:, 1] // 16) % 16]
+		covered[refs] = True
+		self.remaining -= len(refs)
+
+
 class Console(Graphics):
 	"""
 	A Console object is an extension of Graphics that borrows console
@@ -686,7 +3555,7 @@ class Console(Graphics):
 		Console.random_id() returns int
 		Console.get_random_position(Material material) returns tuple (x, y)
 	"""
-	import libtcodpy
+	libtcodpy = libtcodpy
 	
 	def __init__(self, w=80, h=25, fps=50):
 		self.w, self.h, self.fps = w, h, fps
@@ -0,0 +1,687 @@
+#!/usr/bin/env python
+"""
+Low-level reading and writing of binary Dust World files.
+
+A binary World file is a small header followed by a sequence of chunks:
+
+	header:  4s magic 'DUST', u16 version, u16 flags
+	chunk:   4s tag, u32 length, then length bytes of payload
+
+The World's own properties are stored in a 'WRLD' chunk, each Board in a
+'BORD' chunk of its own, in order, and the file ends with an 'END ' chunk.
+
+Files written by write_world also carry an 'INDX' chunk just before the END
+chunk, whose payload (UTF-8 JSON) gives the location of the WRLD chunk and,
+for each Board in order, the location, length and CRC-32 of its payload, its
+name and, for each of its Layers, the name and the stored gamemap plane's
+table entry with its offset made absolute.  The END chunk's payload is then a
+u64 offset of the INDX chunk, so the index is found from the end of the file.
+With an index, a single Board can be read, validated or replaced without
+reading the others.  A replaced Board's new chunk is appended after the END
+chunk, followed by a new index and END chunk, and only then are the old
+chunk, index and END chunk retagged 'FREE', so the index, not the order of
+the chunks, gives the order of the Boards.  If the file ends in a partly
+written chunk, the first END chunk after the header is used instead, and
+the file reads as it was before the replacement.  The index's "free" gives
+the bytes held by FREE chunks, which compact reclaims.  Readers skip chunks
+whose tags they do not know.
+The payload of a WRLD or BORD chunk is:
+
+	u32 metadata length, metadata (UTF-8 JSON), then the raw planes
+
+The metadata is {"object": ..., "planes": [...]}, where "object" is the
+serialized object with every tile plane replaced by {"plane": index}, and each
+entry of "planes" gives the dtype, shape, offset and size of a plane within
+the raw plane data.  Planes are stored little-endian, in the narrowest
+integer type that holds their values.
+
+A plane whose entry has "encoding": "rle" is stored as run lengths (of the
+entry's "runs_dtype", "runs" of them) followed by one row of values per run.
+Planes are run-length encoded whenever that is smaller.  A plane whose entry
+has "deflate": true has its stored bytes compressed with zlib.
+
+Identical planes within a chunk are stored once: each distinct plane has one
+entry, and every {"plane": index} that holds the same tiles refers to it.
+
+In JSON World files, a plane that shrinks by at least half is written as
+{"rle": [[count, values...], ...]} instead of a list of rows.
+
+All integers in the file are little-endian.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import zlib
+import numpy
+
+MAGIC = b'DUST'
+VERSION = 2
+HEADER = struct.Struct('<4sHH')
+CHUNK = struct.Struct('<4sI')
+LENGTH = struct.Struct('<I')
+LOCATOR = struct.Struct('<Q')
+
+# The keys of a serialized object that hold tile planes, and those that hold
+# lists of child objects.  Only these are searched for {"plane": index}; other
+# values, such as counters, are user data and are never rewritten.
+PLANE_KEYS = frozenset(['gamemap', 'tilemap'])
+CHILD_KEYS = frozenset(['boards', 'layers', 'actors', 'sprite'])
+
+
+class DustFileError(ValueError):
+	"""
+	Raised when a file is not a valid binary Dust World file.
+	"""
+	pass
+
+
+def is_dust_file(file_path):
+	"""
+	dustfile.is_dust_file(str file_path) returns bool
+	Checks whether the file at file_path starts with the binary World magic.
+	"""
+	with open(file_path, 'rb') as f:
+		return f.read(len(MAGIC)) == MAGIC
+
+
+def write_header(f, flags=0):
+	"""
+	dustfile.write_header(file f, int flags) returns None
+	Writes the file header.
+	"""
+	f.write(HEADER.pack(MAGIC, VERSION, flags))
+
+
+def read_header(f):
+	"""
+	dustfile.read_header(file f) returns int
+	Reads and checks the file header, and returns its flags.
+	"""
+	data = f.read(HEADER.size)
+	if len(data) != HEADER.size:
+		raise DustFileError("File is too short to be a Dust World")
+	magic, version, flags = HEADER.unpack(data)
+	if magic != MAGIC:
+		raise DustFileError("Not a binary Dust World file")
+	if version > VERSION:
+		raise DustFileError("Dust World file version %d is newer than supported version %d" % (version, VERSION))
+	return flags
+
+
+def write_chunk(f, tag, payload):
+	"""
+	dustfile.write_chunk(file f, str tag, str payload) returns None
+	Writes one chunk.  tag must be four bytes long.
+	"""
+	f.write(CHUNK.pack(tag, len(payload)))
+	f.write(payload)
+
+
+def read_chunk_header(f):
+	"""
+	dustfile.read_chunk_header(file f) returns tuple (str, int)
+	Reads the header of the next chunk and returns its (tag, length), leaving
+	f at the start of the payload.
+	"""
+	data = f.read(CHUNK.size)
+	if len(data) != CHUNK.size:
+		raise DustFileError("Dust World file ends without an END chunk")
+	return CHUNK.unpack(data)
+
+
+def read_chunk(f):
+	"""
+	dustfile.read_chunk(file f) returns tuple (str, str)
+	Reads one chunk and returns its (tag, payload).  Raises DustFileError if
+	the file ends in the middle of a chunk.
+	"""
+	tag, length = read_chunk_header(f)
+	payload = f.read(length)
+	if len(payload) != length:
+		raise DustFileError("Dust World file ends in the middle of a %r chunk" % tag)
+	return tag, payload
+
+
+def iter_chunks(f):
+	"""
+	dustfile.iter_chunks(file f) yields tuple (str, str)
+	Yields each (tag, payload) after the header, stopping at the END chunk.
+	"""
+	while True:
+		tag, payload = read_chunk(f)
+		if tag == b'END ':
+			return
+		yield tag, payload
+
+
+def narrow(plane):
+	"""
+	dustfile.narrow(numpy.ndarray plane) returns numpy.ndarray
+	Returns an integer plane in the smallest of uint8, uint16, int16 and its
+	own type that can hold all of its values.
+	"""
+	if plane.dtype.kind not in 'iu' or not plane.size:
+		return plane
+	low, high = plane.min(), plane.max()
+	for dtype in (numpy.uint8, numpy.uint16, numpy.int16):
+		info = numpy.iinfo(dtype)
+		if numpy.dtype(dtype).itemsize < plane.dtype.itemsize and info.min <= low and high <= info.max:
+			return plane.astype(dtype)
+	return plane
+
+
+def iter_chunk_locations(f):
+	"""
+	dustfile.iter_chunk_locations(file f) yields tuple (str, int, int)
+	Yields the (tag, start, length) of each chunk's payload after the header,
+	stopping at the END chunk, without reading the payloads.  f must be
+	seekable.
+	"""
+	while True:
+		tag, length = read_chunk_header(f)
+		if tag == b'END ':
+			return
+		start = f.tell()
+		yield tag, start, length
+		f.seek(start + length)
+
+
+def read_payload(file_path, start, length):
+	"""
+	dustfile.read_payload(str file_path, int start, int length) returns str
+	Reads a single chunk payload from a file, given its location.
+	"""
+	with open(file_path, 'rb') as f:
+		f.seek(start)
+		payload = f.read(length)
+	if len(payload) != length:
+		raise DustFileError("Dust World file ends in the middle of a chunk")
+	return payload
+
+
+def load_chunk(location):
+	"""
+	dustfile.load_chunk(tuple location) returns tuple (dict, list)
+	Reads and decodes the chunk at location, a tuple (file_path, start,
+	length, dtype) as given by iter_chunk_locations plus the dtype for
+	decode_chunk.  Takes a single argument so that it can be mapped over a
+	multiprocessing.Pool.
+	"""
+	file_path, start, length, dtype = location
+	return decode_chunk(read_payload(file_path, start, length), dtype)
+
+
+def iter_sections(f):
+	"""
+	dustfile.iter_sections(file f) yields tuple (str, Section)
+	Yields the tag and a Section for each WRLD and BORD chunk after the
+	header, in the order given by read_locations.  Only a chunk's metadata
+	is read up front, so the file is streamed one chunk, and one plane, at a
+	time.  f must be seekable.
+	"""
+	for tag, start, length in read_locations(f):
+		yield tag, Section(f, start, length)
+
+
+def describe_board(payload, start):
+	"""
+	dustfile.describe_board(str payload, int start) returns dict
+	Returns the index entry for a BORD chunk whose payload starts at start.
+	"""
+	meta_length, = LENGTH.unpack_from(payload, 0)
+	meta = json.loads(payload[LENGTH.size:LENGTH.size + meta_length].decode('utf-8'))
+	data_start = start + LENGTH.size + meta_length
+	layers = []
+	for layer in meta['object'].get('layers', []):
+		item = {'name': layer.get('name')}
+		ref = layer.get('gamemap')
+		if isinstance(ref, dict) and 'plane' in ref:
+			entry = meta['planes'][ref['plane']]
+			item['gamemap'] = dict(entry, offset=data_start + entry['offset'])
+		layers.append(item)
+	return {'start': start, 'length': len(payload), 'crc32': zlib.crc32(payload) & 0xffffffff, 'name': meta['object'].get('name'), 'layers': layers}
+
+
+def write_world(f, world_payload, board_payloads):
+	"""
+	dustfile.write_world(file f, str world_payload, board_payloads)
+		returns dict
+	Writes a whole binary World file: the header, the WRLD chunk, a BORD
+	chunk for each payload in the iterable board_payloads, the index and the
+	END chunk.  Returns the index.
+	"""
+	write_header(f)
+	index = {'world': [f.tell() + CHUNK.size, len(world_payload)], 'boards': []}
+	write_chunk(f, b'WRLD', world_payload)
+	for payload in board_payloads:
+		index['boards'].append(describe_board(payload, f.tell() + CHUNK.size))
+		write_chunk(f, b'BORD', payload)
+	write_index(f, index)
+	return index
+
+
+def write_index(f, index):
+	"""
+	dustfile.write_index(file f, dict index) returns None
+	Writes the INDX chunk and the END chunk that locates it.
+	"""
+	start = f.tell()
+	write_chunk(f, b'INDX', json.dumps(index).encode('utf-8'))
+	write_chunk(f, b'END ', LOCATOR.pack(start))
+
+
+def locate_end(f):
+	"""
+	dustfile.locate_end(file f) returns tuple (int, int)
+	Returns the offset of the INDX chunk, or None if the file has no index,
+	and the offset just past the END chunk that locates it: the END chunk at
+	the end of the file or, if the file ends in a partly written chunk, as a
+	crash in replace_board can leave it, the first END chunk after the
+	header.
+	"""
+	size = CHUNK.size + LOCATOR.size
+	f.seek(0, 2)
+	end = f.tell()
+	if end >= HEADER.size + size:
+		f.seek(end - size)
+		tag, length = CHUNK.unpack(f.read(CHUNK.size))
+		if tag == b'END ' and length == LOCATOR.size:
+			start, = LOCATOR.unpack(f.read(LOCATOR.size))
+			return start, end
+	f.seek(HEADER.size)
+	tag, length = read_chunk_header(f)
+	while tag != b'END ':
+		f.seek(length, 1)
+		tag, length = read_chunk_header(f)
+	payload = f.read(length)
+	if length != LOCATOR.size or len(payload) != length:
+		return None, f.tell()
+	start, = LOCATOR.unpack(payload)
+	return start, f.tell()
+
+
+def locate_index(f):
+	"""
+	dustfile.locate_index(file f) returns int or None
+	Returns the offset of the INDX chunk from the END chunk (see locate_end),
+	or None if the file has no index.
+	"""
+	return locate_end(f)[0]
+
+
+def read_index(f):
+	"""
+	dustfile.read_index(file f) returns dict or None
+	Returns the file's index (see write_world), or None if it has none.
+	"""
+	start = locate_index(f)
+	if start == None:
+		return None
+	f.seek(start)
+	tag, payload = read_chunk(f)
+	if tag != b'INDX':
+		raise DustFileError("Dust World file's END chunk does not point at its index")
+	return json.loads(payload.decode('utf-8'))
+
+
+def read_locations(f):
+	"""
+	dustfile.read_locations(file f) returns list of tuple (str, int, int)
+	Returns the (tag, start, length) of the WRLD chunk and of each BORD chunk
+	in Board order, from the index if the file has one or else by scanning
+	the chunks.  f must be at the start of the file, and seekable.
+	"""
+	read_header(f)
+	index = read_index(f)
+	if index != None:
+		locations = [(b'WRLD', index['world'][0], index['world'][1])]
+		return locations + [(b'BORD', b['start'], b['length']) for b in index['boards']]
+	f.seek(HEADER.size)
+	return [l for l in iter_chunk_locations(f) if l[0] in (b'WRLD', b'BORD')]
+
+
+def get_board_entry(f, i):
+	"""
+	dustfile.get_board_entry(file f, int i) returns dict
+	Returns the index entry of Board i.  Raises DustFileError if the file has
+	no index, or IndexError if it has no Board i.
+	"""
+	read_header(f)
+	index = read_index(f)
+	if index == None:
+		raise DustFileError("Dust World file has no index")
+	return index['boards'][i]
+
+
+def read_board(file_path, i):
+	"""
+	dustfile.read_board(str file_path, int i) returns str
+	Returns the BORD chunk payload of Board i, seeking to it by the index.
+	"""
+	with open(file_path, 'rb') as f:
+		entry = get_board_entry(f, i)
+	return read_payload(file_path, entry['start'], entry['length'])
+
+
+def validate_board(file_path, i):
+	"""
+	dustfile.validate_board(str file_path, int i) returns bool
+	Returns True if Board i's payload matches the CRC-32 in the index.
+	"""
+	with open(file_path, 'rb') as f:
+		entry = get_board_entry(f, i)
+	try:
+		payload = read_payload(file_path, entry['start'], entry['length'])
+	except DustFileError:
+		return False
+	return zlib.crc32(payload) & 0xffffffff == entry['crc32']
+
+
+def replace_board(file_path, i, payload):
+	"""
+	dustfile.replace_board(str file_path, int i, str payload) returns dict
+	Replaces Board i's chunk with payload, and returns the new index.  The
+	new chunk and index are appended after the END chunk and synced to disk
+	before the new END chunk that locates them is, and the old chunk, index
+	and END chunk are then retagged 'FREE'; the rest of the file is not
+	touched.  A crash at any point leaves a file that reads either as it was
+	or as it is after the replacement.
+	"""
+	with open(file_path, 'r+b') as f:
+		read_header(f)
+		start, end = locate_end(f)
+		if start == None:
+			raise DustFileError("Dust World file has no index")
+		f.seek(start)
+		tag, data = read_chunk(f)
+		if tag != b'INDX':
+			raise DustFileError("Dust World file's END chunk does not point at its index")
+		index = json.loads(data.decode('utf-8'))
+		old = index['boards'][i]
+		f.seek(end)
+		f.truncate()
+		index['boards'][i] = describe_board(payload, end + CHUNK.size)
+		index['free'] = index.get('free', 0) + CHUNK.size + old['length'] + end - start
+		write_chunk(f, b'BORD', payload)
+		index_start = f.tell()
+		write_chunk(f, b'INDX', json.dumps(index).encode('utf-8'))
+		f.flush()
+		os.fsync(f.fileno())
+		write_chunk(f, b'END ', LOCATOR.pack(index_start))
+		f.flush()
+		os.fsync(f.fileno())
+		for offset in (old['start'] - CHUNK.size, start, end - CHUNK.size - LOCATOR.size):
+			f.seek(offset)
+			f.write(b'FREE')
+	return index
+
+
+def compact(file_path):
+	"""
+	dustfile.compact(str file_path) returns dict
+	Rewrites a binary World file without its FREE chunks, with its Boards in
+	order, through a temporary file that then replaces it.  Returns a dict
+	from the old start of each Board's payload to its new (start, length).
+	"""
+	with open(file_path, 'rb') as f:
+		read_header(f)
+		index = read_index(f)
+	if index == None:
+		raise DustFileError("Dust World file has no index")
+	temp_path = file_path + '.tmp'
+	with open(temp_path, 'wb') as f:
+		world_payload = read_payload(file_path, *index['world'])
+		new = write_world(f, world_payload, (read_payload(file_path, b['start'], b['length']) for b in index['boards']))
+		f.flush()
+		os.fsync(f.fileno())
+	if os.name == 'nt':
+		os.remove(file_path)
+	os.rename(temp_path, file_path)
+	return dict((old['start'], (b['start'], b['length'])) for old, b in zip(index['boards'], new['boards']))
+
+
+class Section(object):
+	"""
+	A Section is a WRLD or BORD chunk whose metadata has been read, but whose
+	planes are only read from the file when they are indexed.  It can be
+	passed as the planes argument of Saveable.load_from_dict.  Each plane is
+	read once and is returned as a read-only array, converted to dtype if it
+	is given, so that everything loaded from it can share the array.
+	"""
+	def __init__(self, f, start, length, dtype=None):
+		self.f = f
+		self.dtype = dtype
+		self.cache = {}
+		f.seek(start)
+		meta_length, = LENGTH.unpack(f.read(LENGTH.size))
+		meta = json.loads(f.read(meta_length).decode('utf-8'))
+		self.object = meta['object']
+		self.table = meta['planes']
+		self.data_start = start + LENGTH.size + meta_length
+
+	def __len__(self):
+		return len(self.table)
+
+	def __getitem__(self, i):
+		if i in self.cache:
+			return self.cache[i]
+		entry = self.table[i]
+		self.f.seek(self.data_start + entry['offset'])
+		data = self.f.read(entry['size'])
+		if len(data) != entry['size']:
+			raise DustFileError("Dust World file ends in the middle of a plane")
+		plane = self.cache[i] = share_plane(decode_plane(data, entry, 0), self.dtype)
+		return plane
+
+
+def rle_encode(plane):
+	"""
+	dustfile.rle_encode(numpy.ndarray plane) returns tuple (lengths, values)
+	Splits a plane into runs of identical rows, returning the length of each
+	run and the row it repeats.
+	"""
+	rows = plane.reshape(len(plane), -1)
+	change = (rows[1:] != rows[:-1]).any(axis=1)
+	starts = numpy.concatenate(([0], numpy.nonzero(change)[0] + 1))
+	lengths = numpy.diff(numpy.append(starts, len(plane)))
+	return lengths, plane[starts]
+
+
+def rle_decode(lengths, values):
+	"""
+	dustfile.rle_decode(lengths, values) returns numpy.ndarray
+	Expands runs made by rle_encode back into a plane.
+	"""
+	return numpy.repeat(values, lengths, axis=0)
+
+
+def encode_plane(plane, compress=False):
+	"""
+	dustfile.encode_plane(numpy.ndarray plane, bool compress) returns tuple
+		(dict, str)
+	Packs a plane for a chunk and returns its metadata entry (without the
+	offset) and its bytes.  The plane is narrowed, run-length encoded if that
+	is smaller, and deflated if compress is True and that is smaller.
+	"""
+	plane = narrow(plane)
+	plane = numpy.ascontiguousarray(plane, dtype=plane.dtype.newbyteorder('<'))
+	entry = {'dtype': plane.dtype.str, 'shape': list(plane.shape)}
+	data = plane.tobytes()
+	if plane.ndim and len(plane) > 1:
+		lengths, values = rle_encode(plane)
+		lengths = narrow(lengths.astype(numpy.uint32))
+		lengths = numpy.ascontiguousarray(lengths, dtype=lengths.dtype.newbyteorder('<'))
+		if lengths.nbytes + values.nbytes < len(data):
+			entry['encoding'] = 'rle'
+			entry['runs'] = len(lengths)
+			entry['runs_dtype'] = lengths.dtype.str
+			data = lengths.tobytes() + values.tobytes()
+	if compress:
+		deflated = zlib.compress(data)
+		if len(deflated) < len(data):
+			entry['deflate'] = True
+			data = deflated
+	entry['size'] = len(data)
+	return entry, data
+
+
+def decode_plane(data, entry, offset):
+	"""
+	dustfile.decode_plane(str data, dict entry, int offset) returns
+		numpy.ndarray
+	Returns the plane described by a metadata entry, read from data starting
+	at offset.  An uncompressed raw plane shares data's memory.
+	"""
+	dtype = numpy.dtype(str(entry['dtype']))
+	if entry.get('deflate'):
+		data = zlib.decompress(data[offset:offset + entry['size']])
+		offset = 0
+	if entry.get('encoding') == 'rle':
+		runs_dtype = numpy.dtype(str(entry['runs_dtype']))
+		lengths = numpy.frombuffer(data, dtype=runs_dtype, count=entry['runs'], offset=offset)
+		offset += lengths.nbytes
+		values = numpy.frombuffer(data, dtype=dtype, count=entry['runs'] * int(numpy.prod(entry['shape'][1:])), offset=offset)
+		return rle_decode(lengths, values.reshape([entry['runs']] + entry['shape'][1:]))
+	count = int(numpy.prod(entry['shape']))
+	plane = numpy.frombuffer(data, dtype=dtype, count=count, offset=offset)
+	return plane.reshape(entry['shape'])
+
+
+def share_plane(plane, dtype=None):
+	"""
+	dustfile.share_plane(numpy.ndarray plane, dtype) returns numpy.ndarray
+	Returns the plane, converted to dtype if it is given, as a read-only array
+	that can be shared by the objects loaded from it.
+	"""
+	if dtype != None and plane.dtype != dtype:
+		plane = plane.astype(dtype)
+	plane.flags.writeable = False
+	return plane
+
+
+def plane_key(plane):
+	"""
+	dustfile.plane_key(numpy.ndarray plane) returns str
+	Returns a digest of the plane's dtype, shape and contents, under which
+	identical planes are stored once.
+	"""
+	plane = numpy.ascontiguousarray(plane)
+	digest = hashlib.sha1(('%s %r ' % (plane.dtype.str, plane.shape)).encode('ascii'))
+	digest.update(plane.data)
+	return digest.hexdigest()
+
+
+def map_planes(obj, func):
+	"""
+	dustfile.map_planes(dict obj, function func) returns dict
+	Returns a copy of a serialized object in which each {"plane": i} under
+	one of the PLANE_KEYS, in it or in the objects under its CHILD_KEYS, is
+	replaced with func(i).  Everything else is shared with obj.
+	"""
+	new = dict(obj)
+	for k, v in obj.items():
+		if k in PLANE_KEYS:
+			if isinstance(v, dict) and len(v) == 1 and 'plane' in v:
+				new[k] = func(v['plane'])
+		elif k in CHILD_KEYS and isinstance(v, list):
+			new[k] = [map_planes(i, func) if isinstance(i, dict) else i for i in v]
+	return new
+
+
+def renumber_planes(obj, index):
+	"""
+	dustfile.renumber_planes(dict obj, list index) returns dict
+	Returns a copy of a serialized object in which each {"plane": i} is
+	replaced with {"plane": index[i]}.  See map_planes.
+	"""
+	return map_planes(obj, lambda i: {'plane': index[i]})
+
+
+def encode_json_plane(plane):
+	"""
+	dustfile.encode_json_plane(numpy.ndarray plane) returns list or dict
+	Returns a plane in the form it takes in a JSON World file: run-length
+	encoded as {"rle": [[count, values...], ...]} if that has at most half as
+	many rows, or else a list of rows.
+	"""
+	if plane.ndim and len(plane) > 1:
+		lengths, values = rle_encode(plane)
+		if len(lengths) * 2 <= len(plane):
+			values = values.reshape(len(values), -1).tolist()
+			return {'rle': [[l] + v for l, v in zip(lengths.tolist(), values)]}
+	return plane.tolist()
+
+
+def decode_json_plane(value):
+	"""
+	dustfile.decode_json_plane(dict value) returns numpy.ndarray
+	Expands a run-length encoded plane from a JSON World file.
+	"""
+	runs = value['rle']
+	return rle_decode([r[0] for r in runs], numpy.array([r[1:] for r in runs], dtype=numpy.int32))
+
+
+def encode_chunk(obj, planes, compress=False):
+	"""
+	dustfile.encode_chunk(dict obj, list planes, bool compress) returns str
+	Packs a serialized object, whose planes were collected into the list
+	planes by Saveable.serialize, into a chunk payload.  Identical planes are
+	stored once.  See encode_plane.
+	"""
+	unique = []
+	index = []
+	by_id = {}
+	by_key = {}
+	for plane in planes:
+		if id(plane) not in by_id:
+			key = plane_key(plane)
+			if key not in by_key:
+				by_key[key] = len(unique)
+				unique.append(plane)
+			by_id[id(plane)] = by_key[key]
+		index.append(by_id[id(plane)])
+	if len(unique) < len(planes):
+		obj = renumber_planes(obj, index)
+	table = []
+	raw = []
+	offset = 0
+	for plane in unique:
+		entry, data = encode_plane(plane, compress)
+		entry['offset'] = offset
+		table.append(entry)
+		raw.append(data)
+		offset += len(data)
+	meta = json.dumps({'object': obj, 'planes': table}).encode('utf-8')
+	return LENGTH.pack(len(meta)) + meta + b''.join(raw)
+
+
+def resolve_planes(obj, source, planes=None):
+	"""
+	dustfile.resolve_planes(dict obj, list source, list planes) returns dict
+	Returns a copy of a decoded object in which each {"plane": index}
+	refers to source.  If planes is given, the planes are appended to it and
+	the references renumbered to match; otherwise they take their JSON form.
+	See map_planes.
+	"""
+	if planes == None:
+		return map_planes(obj, lambda i: encode_json_plane(source[i]))
+	def append(i):
+		planes.append(source[i])
+		return {'plane': len(planes) - 1}
+	return map_planes(obj, append)
+
+
+def decode_chunk(payload, dtype=None):
+	"""
+	dustfile.decode_chunk(str payload, dtype) returns tuple (dict, list)
+	Unpacks a chunk payload into the serialized object and its list of
+	planes, ready for Saveable.load_from_dict.  The planes are read-only and
+	are converted to dtype if it is given.  See Section.
+	"""
+	length, = LENGTH.unpack_from(payload, 0)
+	start = LENGTH.size + length
+	meta = json.loads(payload[LENGTH.size:start].decode('utf-8'))
+	planes = [share_plane(decode_plane(payload, entry, start + entry['offset']), dtype) for entry in meta['planes']]
+	return meta['object'], planes
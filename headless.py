@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+"""
+Headless console backend for Dust.
+
+Implements the subset of libtcodpy that dust.py uses on in-memory numpy
+arrays, so that Worlds can be built, rendered and benchmarked on machines
+without a display or a libtcod shared library.  Select it at startup by
+setting the environment variable DUST_BACKEND=headless before importing dust.
+
+Keypresses are polled from a queue which can be fed with push_key(), and the
+window can be "closed" with close_window().
+"""
+
+from collections import deque
+import random
+import numpy
+
+############################
+# color module
+############################
+
+class Color(object):
+	"""
+	A Color is an (r, g, b) triplet, compatible with libtcodpy.Color.
+	"""
+	__slots__ = ('r', 'g', 'b')
+
+	def __init__(self, r=0, g=0, b=0):
+		self.r, self.g, self.b = r, g, b
+
+	def __eq__(self, c):
+		return tuple(self) == tuple(c)
+
+	def __ne__(self, c):
+		return not self.__eq__(c)
+
+	def __repr__(self):
+		return "Color(%d,%d,%d)" % (self.r, self.g, self.b)
+
+	def __getitem__(self, i):
+		if type(i) == str:
+			return getattr(self, i)
+		else:
+			return getattr(self, "rgb"[i])
+
+	def __iter__(self):
+		yield self.r
+		yield self.g
+		yield self.b
+
+black = Color(0, 0, 0)
+dark_gray = Color(95, 95, 95)
+light_gray = Color(159, 159, 159)
+white = Color(255, 255, 255)
+han = Color(63, 0, 255)
+dark_red = Color(191, 0, 0)
+dark_orange = Color(191, 95, 0)
+dark_green = Color(0, 191, 0)
+dark_cyan = Color(0, 191, 191)
+dark_blue = Color(0, 0, 191)
+dark_purple = Color(143, 0, 191)
+light_red = Color(255, 114, 114)
+light_yellow = Color(255, 255, 114)
+light_green = Color(114, 255, 114)
+light_cyan = Color(114, 255, 255)
+light_blue = Color(114, 114, 255)
+light_magenta = Color(255, 114, 219)
+
+############################
+# console module
+############################
+
+BKGND_NONE = 0
+BKGND_SET = 1
+
+FONT_LAYOUT_ASCII_INCOL = 1
+FONT_LAYOUT_ASCII_INROW = 2
+FONT_TYPE_GREYSCALE = 4
+
+KEY_PRESSED = 1
+KEY_RELEASED = 2
+
+KEY_NONE = 0
+KEY_ESCAPE = 1
+KEY_ENTER = 4
+KEY_UP = 14
+KEY_LEFT = 15
+KEY_RIGHT = 16
+KEY_DOWN = 17
+KEY_CHAR = 65
+
+class Key(object):
+	"""
+	A keyboard event, with the same fields as libtcodpy.Key.
+	"""
+	def __init__(self, vk=KEY_NONE, c=0, pressed=False):
+		self.vk, self.c, self.pressed = vk, c, pressed
+		self.text = ''
+		self.lalt = self.lctrl = self.lmeta = False
+		self.ralt = self.rctrl = self.rmeta = False
+		self.shift = False
+
+
+class HeadlessConsole(object):
+	"""
+	An in-memory console made of three planes (char, foreground and
+	background), each stored as a flat array in row-major order.
+	"""
+	def __init__(self, w, h):
+		self.w, self.h = w, h
+		self.ch = numpy.zeros(w * h, dtype=numpy.int32)
+		self.fg = numpy.zeros((w * h, 3), dtype=numpy.uint8)
+		self.bg = numpy.zeros((w * h, 3), dtype=numpy.uint8)
+		self.default_fg = tuple(white)
+		self.default_bg = tuple(black)
+		self.key_color = None
+		self.clear()
+
+	def clear(self):
+		self.ch[:] = 32
+		self.fg[:] = self.default_fg
+		self.bg[:] = self.default_bg
+
+	def plane(self, name):
+		"""
+		Returns the given plane ('ch', 'fg' or 'bg') reshaped to (h, w).
+		"""
+		a = getattr(self, name)
+		return a.reshape((self.h, self.w) + a.shape[1:])
+
+
+_consoles = {}
+_next_handle = [1]
+_key_queue = deque()
+_state = {'closed': False, 'frames': 0, 'fps': 0}
+
+def _get(con):
+	if not con:
+		return _consoles[0]
+	return _consoles[con]
+
+def console_set_custom_font(fontFile, flags=FONT_LAYOUT_ASCII_INROW, nb_char_horiz=0, nb_char_vertic=0):
+	pass
+
+def console_init_root(w, h, title, fullscreen=False, renderer=0):
+	_consoles[0] = HeadlessConsole(w, h)
+	_state['closed'] = False
+
+def console_get_width(con):
+	return _get(con).w
+
+def console_get_height(con):
+	return _get(con).h
+
+def console_new(w, h):
+	handle = _next_handle[0]
+	_next_handle[0] += 1
+	_consoles[handle] = HeadlessConsole(w, h)
+	return handle
+
+def console_delete(con):
+	if con:
+		del _consoles[con]
+
+def console_set_key_color(con, col):
+	_get(con).key_color = tuple(col)
+
+def console_set_default_foreground(con, col):
+	_get(con).default_fg = tuple(col)
+
+def console_set_default_background(con, col):
+	_get(con).default_bg = tuple(col)
+
+def console_clear(con):
+	_get(con).clear()
+
+def console_put_char(con, x, y, c, flag=BKGND_SET):
+	cons = _get(con)
+	if 0 <= x < cons.w and 0 <= y < cons.h:
+		i = (y * cons.w) + x
+		cons.ch[i] = c
+		cons.fg[i] = cons.default_fg
+		if flag != BKGND_NONE:
+			cons.bg[i] = cons.default_bg
+
+def console_set_char(con, x, y, c, flag=BKGND_SET):
+	cons = _get(con)
+	if 0 <= x < cons.w and 0 <= y < cons.h:
+		cons.ch[(y * cons.w) + x] = c
+
+def console_put_char_ex(con, x, y, c, fore, back):
+	cons = _get(con)
+	if 0 <= x < cons.w and 0 <= y < cons.h:
+		i = (y * cons.w) + x
+		cons.ch[i] = c
+		cons.fg[i] = tuple(fore)
+		cons.bg[i] = tuple(back)
+
+def console_get_char(con, x, y):
+	cons = _get(con)
+	return int(cons.ch[(y * cons.w) + x])
+
+def console_get_char_foreground(con, x, y):
+	cons = _get(con)
+	return Color(*cons.fg[(y * cons.w) + x].tolist())
+
+def console_get_char_background(con, x, y):
+	cons = _get(con)
+	return Color(*cons.bg[(y * cons.w) + x].tolist())
+
+def console_fill_char(con, arr):
+	cons = _get(con)
+	cons.ch[:] = numpy.asarray(arr).reshape(-1)[:cons.w * cons.h]
+
+def console_fill_foreground(con, r, g, b):
+	if len(r) != len(g) or len(r) != len(b):
+		raise TypeError('R, G and B must all have the same size.')
+	cons = _get(con)
+	cons.fg[:, 0], cons.fg[:, 1], cons.fg[:, 2] = r, g, b
+
+def console_fill_background(con, r, g, b):
+	if len(r) != len(g) or len(r) != len(b):
+		raise TypeError('R, G and B must all have the same size.')
+	cons = _get(con)
+	cons.bg[:, 0], cons.bg[:, 1], cons.bg[:, 2] = r, g, b
+
+def console_blit(src, x, y, w, h, dst, xdst, ydst, ffade=1.0, bfade=1.0):
+	"""
+	Copies the (x, y, w, h) rectangle of src onto dst at (xdst, ydst),
+	clipping to both consoles.  As in libtcod, a w or h of 0 means the whole
+	source, and cells whose background is the source's key color are skipped.
+	"""
+	s, d = _get(src), _get(dst)
+	if w == 0:
+		w = s.w
+	if h == 0:
+		h = s.h
+	x1, y1 = max(x, x - xdst, 0), max(y, y - ydst, 0)
+	x2, y2 = min(x + w, s.w, d.w - xdst + x), min(y + h, s.h, d.h - ydst + y)
+	if x2 <= x1 or y2 <= y1:
+		return
+	sl = (slice(y1, y2), slice(x1, x2))
+	dl = (slice(y1 - y + ydst, y2 - y + ydst), slice(x1 - x + xdst, x2 - x + xdst))
+	sch, sfg, sbg = s.plane('ch')[sl], s.plane('fg')[sl], s.plane('bg')[sl]
+	dch, dfg, dbg = d.plane('ch')[dl], d.plane('fg')[dl], d.plane('bg')[dl]
+	if s.key_color is None:
+		mask = numpy.ones(sch.shape, dtype=bool)
+	else:
+		mask = (sbg != numpy.array(s.key_color, dtype=numpy.uint8)).any(axis=-1)
+	if ffade != 1.0:
+		sfg = (sfg * ffade + dfg * (1.0 - ffade)).astype(numpy.uint8)
+	if bfade != 1.0:
+		sbg = (sbg * bfade + dbg * (1.0 - bfade)).astype(numpy.uint8)
+	dch[mask] = sch[mask]
+	dfg[mask] = sfg[mask]
+	dbg[mask] = sbg[mask]
+
+def console_flush():
+	_state['frames'] += 1
+
+def console_is_window_closed():
+	return _state['closed']
+
+def close_window():
+	"""
+	Marks the headless window as closed, so that console_is_window_closed
+	returns True.
+	"""
+	_state['closed'] = True
+
+def push_key(vk, c=0, pressed=True):
+	"""
+	Queues a keyboard event to be returned by console_check_for_keypress.
+	For a character key, pass KEY_CHAR and the character code as c.
+	"""
+	_key_queue.append(Key(vk, c, pressed))
+
+def console_check_for_keypress(flags=KEY_RELEASED):
+	while _key_queue:
+		k = _key_queue.popleft()
+		if (k.pressed and flags & KEY_PRESSED) or (not k.pressed and flags & KEY_RELEASED):
+			return k
+	return Key()
+
+############################
+# sys and random modules
+############################
+
+def sys_set_fps(val):
+	_state['fps'] = val
+
+def sys_get_fps():
+	return _state['fps']
+
+def random_new_from_seed(seed, algo=0):
+	return random.Random(seed)
+
+def random_get_int(rnd, mi, ma):
+	if not rnd:
+		return random.randint(mi, ma)
+	return rnd.randint(mi, ma)
@@ -1,4 +1,5 @@
-import dust, json, libtcodpy
+import dust, json
+from dust import libtcodpy
 import pprint
 
 
@@ -8,11 +9,14 @@ def mainer():
 	my_world = dust.World(my_console, 'j.json')
 	my_board = my_world.boards[-1]
 	my_layer = my_board.layers[-1]
+	my_world.start_autosave(60, 'j.json')
+	my_history = my_world.open_history()
 	#my_world.redraw(my_console)
 	
 	# main loop
 	running = True
 	while running and not my_console.is_terminated():
+		my_world.tick()
 		my_world.blit(my_console)
 	
 		my_console.end_cycle()
@@ -39,22 +43,35 @@ def mainer():
 					x1, y1 = my_console.get_random_position(my_layer)
 					x2, y2 = my_console.get_random_position(my_layer)
 					id, color, param = my_console.random_id(), my_console.random_color(), my_console.random_char()
-					my_console.line_iter(my_layer, 'set_game_tile', x1, y1, x2, y2, heavy=True, id=id, color=color, param=param)
+					with my_history.action():
+						my_console.line_iter(my_layer, 'set_game_tile', x1, y1, x2, y2, heavy=True, id=id, color=color, param=param)
 
 				elif key.c == ord('d'):
 					# Brownian
 					print chr(key.c), key.vk, key.pressed
-					for i in range(10):
-						id, color, param = my_console.random_id(), my_console.random_color(), my_console.random_char()
-						my_console.brownian_iterxy(my_layer, 'set_game_tile', 100, *my_console.get_random_position(my_layer), id=id, color=color, param=param)
+					with my_history.action():
+						for i in range(10):
+							id, color, param = my_console.random_id(), my_console.random_color(), my_console.random_char()
+							my_console.brownian_iterxy(my_layer, 'set_game_tile', 100, *my_console.get_random_position(my_layer), id=id, color=color, param=param)
 
 				elif key.c == ord('f'):
 					# Fill
-					for l in my_board.layers:
-						l.fill(1, 7, 0)
+					with my_history.action():
+						for l in my_board.layers:
+							l.fill(1, 7, 0)
+
+				elif key.c == ord('u'):
+					# Undo
+					my_history.undo()
+
+				elif key.c == ord('r'):
+					# Redo
+					my_history.redo()
 			# else:
 				# print "non-char:", chr(key.vk), key.vk, key.pressed
 		
+	my_world.stop_autosave()
+	my_world.poll_autosave(wait=True)
 	my_world.save('j.json')
 	
 if __name__=="__main__":
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+Tests for Dramatic scripts running in Dust Worlds.
+
+Covers compile errors, if/else, for each, event handlers that return, the
+journaling of counters set by scripts, and binary and JSON round-trips of a
+World whose Actors run scripts.
+
+Runs on the headless backend unless DUST_BACKEND is already set.
+
+Usage:
+	python test_dramatic.py
+"""
+
+import os
+os.environ.setdefault('DUST_BACKEND', 'headless')
+
+import json
+import shutil
+import tempfile
+import unittest
+import dust
+import dramatic
+
+console = None
+
+
+def setUpModule():
+	global console
+	os.chdir(os.path.dirname(os.path.abspath(__file__)))
+	console = dust.Console()
+
+
+def build_world():
+	"""
+	build_world() returns World
+	Builds a World with a Layer holding one Actor, named 'Hero', whose
+	program is set by each test.
+	"""
+	world = dust.World(console)
+	layer = world.current_board.layers[-1]
+	layer.actors.append(dust.Actor(layer, 1, 1, 5, 5, 'Hero'))
+	return world
+
+
+def run(world, ticks=1):
+	"""
+	run(World world, int ticks) returns None
+	Ticks world ticks times.
+	"""
+	for i in range(ticks):
+		world.tick()
+
+
+class CompileTest(unittest.TestCase):
+
+	def test_errors(self):
+		for source in ("open file\n", "set to 1\n", "if\n", "goto nowhere\n", "set x to (1 +\n"):
+			self.assertRaises(dramatic.DramaticError, dramatic.compile, source)
+
+	def test_error_names_line(self):
+		try:
+			dramatic.compile("set a to 1\nset b to (2 *\n")
+		except dramatic.DramaticError, e:
+			self.assertTrue(str(e).startswith('line 2:'), str(e))
+		else:
+			self.fail("no DramaticError")
+
+	def test_failed_script_stops(self):
+		world = build_world()
+		hero = world.current_board.layers[-1].actors[0]
+		hero.program = "set n to (1 +\n"
+		run(world, 2)
+		self.assertFalse(hero.is_awake())
+		self.assertTrue(hero.process.error)
+		hero.program = "set n to 1\n"
+		run(world)
+		self.assertEqual(hero.counters['n'], 1)
+
+
+class ControlTest(unittest.TestCase):
+
+	def setUp(self):
+		self.world = build_world()
+		self.layer = self.world.current_board.layers[-1]
+		self.hero = self.layer.actors[0]
+
+	def test_if_else(self):
+		self.hero.program = "set n to 3\nif n > 2\n\tset r to \"big\"\nelse\n\tset r to \"small\"\nif n > 5\n\tset s to 1\nelse\n\tset s to 2\n"
+		run(self.world)
+		self.assertEqual(self.hero.counters['r'], 'big')
+		self.assertEqual(self.hero.counters['s'], 2)
+
+	def test_for_each(self):
+		self.hero.program = "for each split \"1 2 3 4\" by \" \"\n\tset total to total + it\n\tset count to count + 1\n"
+		run(self.world, 10)
+		self.assertEqual(self.hero.counters['count'], 4)
+		self.assertEqual(self.hero.counters['total'], '01234')
+
+	def test_handler_return_unwinds(self):
+		self.hero.program = "loop\n\twait\nwhen touched\nset hits to hits + 1\nfor each \"abc\"\n\treturn\nreturn\n"
+		bumper = dust.Actor(self.layer, 1, 1, 15, 5, 'Bumper')
+		bumper.program = "loop\n\tgo west\n"
+		self.layer.actors.append(bumper)
+		run(self.world, 40)
+		self.assertTrue(self.hero.counters.get('hits', 0) > 1)
+		self.assertTrue(len(self.hero.process.loops) <= 1, self.hero.process.loops)
+		self.assertEqual(self.hero.process.stack, [])
+
+
+class SaveTest(unittest.TestCase):
+
+	def setUp(self):
+		self.path = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.path)
+
+	def test_store_is_journaled(self):
+		file_path = os.path.join(self.path, 'journal.dust')
+		world = build_world()
+		world.file_path = file_path
+		hero = world.current_board.layers[-1].actors[0]
+		hero.program = "loop\n\tset n to n + 1\n"
+		world.save()
+		world.open_journal()
+		run(world, 5)
+		self.assertTrue(world.save_incremental())
+		loaded = dust.World(console, file_path=file_path)
+		self.assertEqual(loaded.current_board.layers[-1].actors[0].counters, hero.counters)
+		self.assertEqual(hero.counters['n'], 5)
+
+	def test_round_trips(self):
+		world = build_world()
+		layer = world.current_board.layers[-1]
+		layer.set_game_tile(2, 3, 4, 5, 6)
+		for i in range(10):
+			actor = dust.Actor(layer, 1, 1, i, 10, 'A%d' % i)
+			actor.program = "loop\n\tset n to n + 1\n\tgo east\n"
+			actor.counters['list'] = [i, {'plane': i}]
+			layer.actors.append(actor)
+		run(world, 3)
+		expected = json.loads(json.dumps(world.serialize()))
+		for name in ('world.dust', 'world.json'):
+			file_path = os.path.join(self.path, name)
+			self.assertTrue(world.save(file_path))
+			loaded = dust.World(console, file_path=file_path)
+			self.assertEqual(json.loads(json.dumps(loaded.serialize())), expected)
+
+
+if __name__ == '__main__':
+	unittest.main()